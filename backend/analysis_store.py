@@ -0,0 +1,130 @@
+"""
+Short-lived store of decoded audio for /visualize
+
+/classify keeps the decoded signal under its analysis id so visualization
+features can be computed later without decoding the upload again. Entries
+expire ``ttl_seconds`` after they are stored and the store is bounded by
+total bytes, evicting the oldest entries first. When decoded audio is not
+at hand (a cached /classify result) or does not fit the budget, the upload
+itself is kept instead and decoded on demand; temporary files handed to the
+store are deleted when their entry goes.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+
+class AnalysisEntry:
+    """Decoded ``audio`` or the original ``source``, plus the options that produced it."""
+
+    def __init__(self, audio: Optional[np.ndarray], source, options: dict, expires_at: float):
+        self.audio = audio
+        self.source = source
+        self.options = options
+        self.expires_at = expires_at
+
+    @property
+    def nbytes(self) -> int:
+        if self.audio is not None:
+            return self.audio.nbytes
+        # Spooled temporary files live on disk and do not count
+        return len(self.source) if isinstance(self.source, (bytes, bytearray)) else 0
+
+    def discard(self):
+        if isinstance(self.source, str):
+            try:
+                os.unlink(self.source)
+            except OSError as e:
+                print(f"Warning: Could not remove spooled upload {self.source}: {e}")
+
+
+class AnalysisStore:
+    """TTL- and size-bounded map of analysis id -> AnalysisEntry. Only touched from the event loop."""
+
+    def __init__(self, ttl_seconds: float = 300, max_bytes: int = 256 * 1024 * 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, AnalysisEntry]" = OrderedDict()
+        self._size = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def __contains__(self, analysis_id: str) -> bool:
+        return self.get(analysis_id) is not None
+
+    def get(self, analysis_id: str) -> Optional[AnalysisEntry]:
+        entry = self._entries.get(analysis_id)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self._remove(analysis_id)
+            self.expired += 1
+            return None
+        return entry
+
+    def put_audio(self, analysis_id: str, audio: np.ndarray, options: dict) -> bool:
+        """Keep decoded audio; returns False (and stores nothing) if it exceeds the budget."""
+        return self._put(analysis_id, AnalysisEntry(audio, None, options, time.monotonic() + self.ttl_seconds))
+
+    def put_source(self, analysis_id: str, source, options: dict) -> bool:
+        """Keep the upload (bytes or a temporary file path) to decode on demand.
+
+        Returns True if stored, in which case the store now owns (and will
+        delete) a temporary file ``source``.
+        """
+        return self._put(analysis_id, AnalysisEntry(None, source, options, time.monotonic() + self.ttl_seconds))
+
+    def promote(self, analysis_id: str, audio: np.ndarray):
+        """Swap a source entry for its decoded audio, if it still exists and fits."""
+        entry = self._entries.get(analysis_id)
+        if entry is None or entry.audio is not None or audio.nbytes > self.max_bytes:
+            return
+        self._size -= entry.nbytes
+        entry.discard()
+        entry.audio, entry.source = audio, None
+        self._size += entry.nbytes
+        self._shrink()
+
+    def purge(self):
+        """Drop expired entries."""
+        now = time.monotonic()
+        for analysis_id in [key for key, entry in self._entries.items() if entry.expires_at <= now]:
+            self._remove(analysis_id)
+            self.expired += 1
+
+    def clear(self):
+        for analysis_id in list(self._entries):
+            self._remove(analysis_id)
+
+    def _put(self, analysis_id: str, entry: AnalysisEntry) -> bool:
+        if entry.nbytes > self.max_bytes:
+            return False
+        if analysis_id in self._entries:
+            self._remove(analysis_id)
+        self._entries[analysis_id] = entry
+        self._size += entry.nbytes
+        self.purge()
+        self._shrink()
+        return analysis_id in self._entries
+
+    def _shrink(self):
+        while self._size > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, analysis_id: str):
+        entry = self._entries.pop(analysis_id)
+        self._size -= entry.nbytes
+        entry.discard()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "maxBytes": self.max_bytes,
+            "ttlSeconds": self.ttl_seconds,
+            "expired": self.expired,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,246 @@
+"""
+Dynamic micro-batching for model inference
+
+Concurrent /classify requests submit their segment tensors to a single
+scheduler, which packs them into batches of up to ``max_batch_size`` segments
+(or whatever has arrived within ``max_wait_ms``), runs one predict call, and
+scatters the per-segment probabilities back to each caller.
+
+/classify/batch knows which of its files are still being decoded, so a
+SegmentStacker holds their segments back until the batch is full or no
+decode is left to wait for, instead of relying on arrival timing.
+"""
+
+import asyncio
+import contextlib
+import time
+from concurrent.futures import Executor
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import numpy as np
+
+
+class InferenceScheduler:
+    """Gathers segment batches from concurrent requests into shared predict calls."""
+
+    def __init__(
+        self,
+        predict_fn: Callable[[np.ndarray], np.ndarray],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+        executor: Optional[Executor] = None,
+        observer: Optional[Callable[[int, List[float], float], None]] = None,
+    ):
+        """``observer(batch_size, queue_waits_s, predict_s)`` is called after every predict."""
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.executor = executor
+        self.observer = observer
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._carry: Optional[Tuple[np.ndarray, asyncio.Future, float]] = None
+
+        # Batch-fill statistics
+        self.batches = 0
+        self.segments = 0
+        self.requests = 0
+        self.full_batches = 0
+        self.predict_time_ms = 0.0
+
+    def start(self):
+        """Start the batching loop on the running event loop."""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the batching loop and fail any queued work."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._carry is not None:
+            self._queue.put_nowait(self._carry)
+            self._carry = None
+        while self._queue is not None and not self._queue.empty():
+            _, future, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Inference scheduler stopped"))
+
+    async def predict(self, batch: np.ndarray) -> np.ndarray:
+        """Return per-segment predictions for ``batch``, sharing predict calls with other requests."""
+        if self._task is None:
+            raise RuntimeError("Inference scheduler is not running")
+        loop = asyncio.get_running_loop()
+        futures = []
+        # Oversized requests are split so no single item exceeds a batch
+        for start in range(0, len(batch), self.max_batch_size):
+            future = loop.create_future()
+            self._queue.put_nowait((batch[start:start + self.max_batch_size], future, time.monotonic()))
+            futures.append(future)
+        self.requests += 1
+        results = await asyncio.gather(*futures)
+        return results[0] if len(results) == 1 else np.concatenate(results, axis=0)
+
+    async def _collect(self) -> List[Tuple[np.ndarray, asyncio.Future, float]]:
+        """Wait for the first item, then fill the batch until it is full or the window closes."""
+        if self._carry is not None:
+            items, self._carry = [self._carry], None
+        else:
+            items = [await self._queue.get()]
+        size = len(items[0][0])
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while size < self.max_batch_size:
+            if not self._queue.empty():
+                item = self._queue.get_nowait()
+            else:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if size + len(item[0]) > self.max_batch_size:
+                # Never overfill: the item leads the next batch instead
+                self._carry = item
+                break
+            items.append(item)
+            size += len(item[0])
+        return items
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = await self._collect()
+            live = [item for item in items if not item[1].done()]
+            if not live:
+                continue
+            inputs = np.concatenate([x for x, _, _ in live], axis=0) if len(live) > 1 else live[0][0]
+
+            batch_start = time.monotonic()
+            start = time.perf_counter()
+            try:
+                outputs = await loop.run_in_executor(self.executor, self.predict_fn, inputs)
+            except Exception as e:
+                for _, future, _ in live:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            predict_s = time.perf_counter() - start
+            self.predict_time_ms += predict_s * 1000
+            if self.observer is not None:
+                self.observer(len(inputs), [batch_start - enqueued for _, _, enqueued in live], predict_s)
+
+            self.batches += 1
+            self.segments += len(inputs)
+            if len(inputs) >= self.max_batch_size:
+                self.full_batches += 1
+
+            # Scatter per-segment probabilities back to each request
+            offset = 0
+            for x, future, _ in live:
+                if not future.done():
+                    future.set_result(outputs[offset:offset + len(x)])
+                offset += len(x)
+
+    def stats(self) -> dict:
+        """Batch-fill statistics since startup."""
+        avg_batch = self.segments / self.batches if self.batches else 0.0
+        return {
+            "maxBatchSize": self.max_batch_size,
+            "maxWaitMs": self.max_wait_ms,
+            "batches": self.batches,
+            "segments": self.segments,
+            "requests": self.requests,
+            "avgBatchSize": avg_batch,
+            "avgFill": avg_batch / self.max_batch_size,
+            "fullBatches": self.full_batches,
+            "avgPredictMs": self.predict_time_ms / self.batches if self.batches else 0.0,
+            "queued": (self._queue.qsize() if self._queue is not None else 0) + (self._carry is not None),
+        }
+
+
+class SegmentStacker:
+    """Stacks the segment batches of a group of jobs into few predict calls.
+
+    Each job runs inside ``job()``, which yields the ``predict`` it should
+    use instead of the scheduler's. Submitted batches are held until they
+    add up to ``max_batch_size`` segments, every job still running has
+    submitted (or finished without predicting), or the oldest has waited
+    ``max_wait_ms``; they then go to ``predict_fn`` as one array.
+    """
+
+    def __init__(self, predict_fn: Callable[[np.ndarray], Awaitable[np.ndarray]], max_batch_size: int = 64,
+                 max_wait_ms: float = 200.0):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._pending: List[Tuple[np.ndarray, asyncio.Future]] = []
+        self._segments = 0
+        self._active = 0  # jobs that may still submit
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    @contextlib.asynccontextmanager
+    async def job(self):
+        """Context for one job; yields its ``predict(batch)`` coroutine function."""
+        loop = asyncio.get_running_loop()
+        submitted = False
+        self._active += 1
+
+        async def predict(batch: np.ndarray) -> np.ndarray:
+            nonlocal submitted
+            if submitted:
+                # A second batch from the same job is not held back
+                return await self.predict_fn(batch)
+            submitted = True
+            self._active -= 1
+            future = loop.create_future()
+            self._pending.append((batch, future))
+            self._segments += len(batch)
+            if self._timer is None:
+                # Never hold a batch forever, e.g. while a job waits on another job's result
+                self._timer = loop.call_later(self.max_wait_ms / 1000, self._flush)
+            self._maybe_flush()
+            return await future
+
+        try:
+            yield predict
+        finally:
+            if not submitted:
+                self._active -= 1
+                self._maybe_flush()
+
+    def _maybe_flush(self):
+        if self._pending and (self._segments >= self.max_batch_size or self._active == 0):
+            self._flush()
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, self._pending, self._segments = self._pending, [], 0
+        if items:
+            task = asyncio.get_running_loop().create_task(self._predict(items))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _predict(self, items: List[Tuple[np.ndarray, asyncio.Future]]):
+        inputs = np.concatenate([x for x, _ in items], axis=0) if len(items) > 1 else items[0][0]
+        try:
+            outputs = await self.predict_fn(inputs)
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        offset = 0
+        for x, future in items:
+            if not future.done():
+                future.set_result(outputs[offset:offset + len(x)])
+            offset += len(x)
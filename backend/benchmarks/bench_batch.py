@@ -0,0 +1,139 @@
+"""
+Clips-per-second of /classify/batch vs. sequential /classify calls
+
+Synthesizes short clips (3-30 s by default), classifies them one request at
+a time through /classify, then again in --batch-size groups through
+/classify/batch, and reports clips per second for both plus how many
+topGenre answers agree. Run against a server started with
+CACHE_MAX_BYTES=0 (--spawn does this) so the second pass is not served
+from the cache.
+
+Usage:
+    python backend/benchmarks/bench_batch.py --spawn
+    python backend/benchmarks/bench_batch.py --spawn --clips 256 --batch-size 64 --json batch.json
+    python backend/benchmarks/bench_batch.py --url http://127.0.0.1:8000 --archive
+"""
+
+import argparse
+import http.client
+import io
+import json
+import os
+import sys
+import time
+import uuid
+import zipfile
+from urllib.parse import urlparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import encode, synth_track  # noqa: E402
+from loadtest import Client, spawn_server, wait_for_health  # noqa: E402
+
+
+def multipart(fields: list) -> tuple:
+    """``(body, content_type)`` for ``[(field, filename, data), ...]``."""
+    boundary = uuid.uuid4().hex
+    body = bytearray()
+    for field, filename, data in fields:
+        body += (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n"
+        ).encode() + data + b"\r\n"
+    body += f"--{boundary}--\r\n".encode()
+    return bytes(body), f"multipart/form-data; boundary={boundary}"
+
+
+def post(conn: http.client.HTTPConnection, path: str, fields: list) -> dict:
+    body, content_type = multipart(fields)
+    conn.request("POST", path, body=body, headers={"Content-Type": content_type})
+    response = conn.getresponse()
+    payload = response.read()
+    if response.status != 200:
+        raise RuntimeError(f"{path} returned {response.status}: {payload[:200]!r}")
+    return json.loads(payload)
+
+
+def zip_clips(clips: list) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        for name, data in clips:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Server base URL")
+    parser.add_argument("--spawn", action="store_true", help="Start a uvicorn server (without cache) on the URL's port")
+    parser.add_argument("--clips", type=int, default=64, help="Clips to classify")
+    parser.add_argument("--min-seconds", type=float, default=3, help="Shortest clip (s)")
+    parser.add_argument("--max-seconds", type=float, default=30, help="Longest clip (s)")
+    parser.add_argument("--batch-size", type=int, default=32, help="Clips per /classify/batch request")
+    parser.add_argument("--archive", action="store_true", help="Send each batch as one zip archive")
+    parser.add_argument("--timeout", type=float, default=600, help="Per-request timeout (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the summary to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    lengths = rng.uniform(args.min_seconds, args.max_seconds, args.clips)
+    clips = [(f"clip-{i}.wav", encode(synth_track(float(seconds), seed=i))) for i, seconds in enumerate(lengths)]
+    print(f"{args.clips} clips, {lengths.sum():.0f} s of audio in total")
+
+    parsed = urlparse(args.url)
+    server = None
+    if args.spawn:
+        os.environ["CACHE_MAX_BYTES"] = "0"
+        server = spawn_server(parsed.port or 80)
+    try:
+        wait_for_health(Client(args.url, 5), timeout=300, server=server)
+        conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=args.timeout)
+        # Warm up the model and the feature path
+        post(conn, "/classify", [("file", clips[0][0], clips[0][1])])
+
+        start = time.perf_counter()
+        sequential = [post(conn, "/classify", [("file", name, data)])["topGenre"] for name, data in clips]
+        sequential_seconds = time.perf_counter() - start
+
+        batched, failed = [], 0
+        start = time.perf_counter()
+        for offset in range(0, len(clips), args.batch_size):
+            group = clips[offset:offset + args.batch_size]
+            if args.archive:
+                fields = [("archive", "clips.zip", zip_clips(group))]
+            else:
+                fields = [("files", name, data) for name, data in group]
+            result = post(conn, "/classify/batch", fields)
+            failed += result["failed"]
+            batched += [item["result"]["topGenre"] if "result" in item else None for item in result["results"]]
+        batch_seconds = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    summary = {
+        "clips": args.clips,
+        "audioSeconds": float(lengths.sum()),
+        "batchSize": args.batch_size,
+        "archive": args.archive,
+        "sequentialClipsPerSecond": args.clips / sequential_seconds,
+        "batchClipsPerSecond": args.clips / batch_seconds,
+        "speedup": sequential_seconds / batch_seconds,
+        "failed": failed,
+        "topGenreAgreement": float(np.mean([a == b for a, b in zip(sequential, batched)])),
+    }
+    print(f"sequential /classify: {summary['sequentialClipsPerSecond']:.1f} clips/s")
+    print(f"/classify/batch:      {summary['batchClipsPerSecond']:.1f} clips/s "
+          f"({summary['speedup']:.1f}x, {failed} failed, topGenre agreement {summary['topGenreAgreement']:.0%})")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main_cli()
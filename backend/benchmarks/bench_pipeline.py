@@ -0,0 +1,251 @@
+"""
+Stage-by-stage benchmark of the classification pipeline on synthetic audio
+
+Generates deterministic tone/noise/click tracks, times each backend stage
+(decode + segmentation, mel spectrograms, visualization, streaming feature
+extraction, inference, JSON and binary response encoding, with encoded
+sizes) and the end-to-end /classify path through an
+in-process test client, and records p50/p95 latency, throughput (seconds of
+audio per second) and peak traced memory per call. Results can be saved
+as a JSON baseline; --compare flags stages that got slower or hungrier
+than it. The mel front-end reuses a per-worker FrontendWorkspace, so the
+peak covers only what a call allocates; --cold-workspace gives every call
+fresh buffers to show what the workspace saves.
+
+Without model/crnn_gtzan_model_best.h5 a tiny stand-in Keras model is used.
+The /classify stage needs httpx (for fastapi.testclient) and is skipped
+otherwise.
+
+Usage:
+    python backend/benchmarks/bench_pipeline.py --json baseline.json
+    python backend/benchmarks/bench_pipeline.py --compare baseline.json
+    python backend/benchmarks/bench_pipeline.py --durations 3 60 3600 --kinds tone noise clicks --repeat 3
+    python backend/benchmarks/bench_pipeline.py --stages mel_spectrogram_batch classify --cold-workspace
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import encoding  # noqa: E402
+import main  # noqa: E402
+from cache import ResultCache  # noqa: E402
+from fixtures import build_stand_in_model, encode, synth_track  # noqa: E402
+
+STAGES = ("process_audio_file", "extract_mel_spectrogram", "mel_spectrogram_batch",
+          "extract_visualization_data", "extract_features", "inference",
+          "encode_json", "encode_frames_float16", "encode_frames_uint8", "encode_msgpack_float16", "classify")
+
+
+def load_predictor() -> str:
+    """Install the real model, or the stand-in when its file is missing; returns its name."""
+    if os.path.exists(main.model_path()):
+        main.load_model()
+        return "keras"
+    main.model = build_stand_in_model()
+    return "stand-in"
+
+
+def measure(fn, repeat: int) -> dict:
+    """Time ``fn`` ``repeat`` times, then run it once more under tracemalloc for peak memory."""
+    fn()  # warm-up: librosa caches, numba JIT, model graph tracing
+    samples = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "p50Ms": float(np.percentile(samples, 50)),
+        "p95Ms": float(np.percentile(samples, 95)),
+        "meanMs": float(np.mean(samples)),
+        "peakMemMb": peak / (1024 * 1024),
+        "samplesMs": samples,
+    }
+
+
+def stage_functions(audio_bytes: bytes, client) -> dict:
+    """Zero-argument callables for each stage, sharing one decode of the track."""
+    audio, _ = main.decode_audio(audio_bytes)
+    segments, _, num_segments = main.segment_audio(audio)
+    segments = segments[:max(num_segments, 1)]
+    batch = main.mel_spectrogram_batch(segments)
+
+    features = main.extract_features(audio_bytes)
+    result = {
+        "predictions": [p.model_dump() for p in main.rank_genres(np.mean(main.predict_segments(batch), axis=0))],
+        "topGenre": "", "topConfidence": 0.0, "processingTime": 0.0,
+        "audioInfo": {"duration": features["duration"], "numSegments": features["numSegments"]},
+        "visualization": features["visualization"],
+    }
+
+    def classify():
+        response = client.post("/classify", files={"file": ("bench.wav", audio_bytes, "audio/wav")})
+        response.raise_for_status()
+
+    stages = {
+        "process_audio_file": lambda: main.process_audio_file(audio_bytes),
+        "extract_mel_spectrogram": lambda: [main.prepare_segment_for_model(s) for s in segments],
+        "mel_spectrogram_batch": lambda: main.mel_spectrogram_batch(segments),
+        "extract_visualization_data": lambda: main.extract_visualization_data(audio),
+        "extract_features": lambda: main.extract_features(audio_bytes),
+        "inference": lambda: main.predict_segments(batch),
+        "encode_json": lambda: main.encode_result(result),
+        "encode_frames_float16": lambda: main.encode_result(result, encoding.FRAMES_MEDIA_TYPE, "float16"),
+        "encode_frames_uint8": lambda: main.encode_result(result, encoding.FRAMES_MEDIA_TYPE, "uint8"),
+    }
+    if encoding.msgpack is not None:
+        stages["encode_msgpack_float16"] = lambda: main.encode_result(result, encoding.MSGPACK_MEDIA_TYPE, "float16")
+    if client is not None:
+        stages["classify"] = classify
+    return stages
+
+
+def run(args) -> dict:
+    predictor = load_predictor()
+    if args.cold_workspace:
+        # Every mel_spectrogram_batch call, in any thread, allocates its own buffers
+        main.frontend_workspace = main.FrontendWorkspace
+    # Every /classify call must do the work, so results are never cached
+    main.result_cache = ResultCache(max_bytes=0)
+
+    client = None
+    if "classify" in args.stages:
+        try:
+            from fastapi.testclient import TestClient
+        except ImportError as e:
+            print(f"Skipping classify stage: {e}")
+        else:
+            client = TestClient(main.app)
+            client.__enter__()
+
+    results = {}
+    try:
+        for kind in args.kinds:
+            for seconds in args.durations:
+                track = f"{kind}-{seconds:g}s"
+                audio_bytes = encode(synth_track(seconds, seed=args.seed, kind=kind))
+                stages = stage_functions(audio_bytes, client)
+                for stage in args.stages:
+                    if stage not in stages:
+                        continue
+                    stats = measure(stages[stage], args.repeat)
+                    stats.update({
+                        "track": track,
+                        "stage": stage,
+                        "audioSeconds": seconds,
+                        "throughputX": seconds / (stats["p50Ms"] / 1000),
+                    })
+                    if stage.startswith("encode_"):
+                        stats["sizeBytes"] = len(stages[stage]())
+                    results[f"{track}/{stage}"] = stats
+                    size = f"{stats['sizeBytes'] / 1024:>10.1f}" if "sizeBytes" in stats else ""
+                    print(f"{track:<16}{stage:<28}{stats['p50Ms']:>10.1f}{stats['p95Ms']:>10.1f}"
+                          f"{stats['throughputX']:>10.1f}x{stats['peakMemMb']:>10.1f}{size}")
+    finally:
+        if client is not None:
+            client.__exit__(None, None, None)
+
+    return {
+        "meta": {
+            "predictor": predictor,
+            "repeat": args.repeat,
+            "coldWorkspace": args.cold_workspace,
+            "workspaceMb": main.FrontendWorkspace().nbytes / (1024 * 1024),
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "librosa": main.librosa.__version__,
+            "machine": platform.machine(),
+            "cpuCount": os.cpu_count(),
+            "createdAt": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float, memory_tolerance: float, min_delta_ms: float) -> list:
+    """Print a comparison table and return the keys that regressed."""
+    regressions = []
+    print(f"\n{'track/stage':<44}{'p50 base':>10}{'p50 now':>10}{'ratio':>8}{'mem base':>10}{'mem now':>10}")
+    for key, now in current["results"].items():
+        base = baseline["results"].get(key)
+        if base is None:
+            print(f"{key:<44}{'-':>10}{now['p50Ms']:>10.1f}  (new)")
+            continue
+        ratio = now["p50Ms"] / base["p50Ms"] if base["p50Ms"] else float("inf")
+        slower = (now["p50Ms"] > base["p50Ms"] * (1 + tolerance)
+                  and now["p50Ms"] - base["p50Ms"] > min_delta_ms)
+        slower_tail = (now["p95Ms"] > base["p95Ms"] * (1 + tolerance)
+                       and now["p95Ms"] - base["p95Ms"] > min_delta_ms)
+        hungrier = now["peakMemMb"] > base["peakMemMb"] * (1 + memory_tolerance) + 1.0
+        flags = [name for name, hit in (("p50", slower), ("p95", slower_tail), ("memory", hungrier)) if hit]
+        if flags:
+            regressions.append(key)
+        print(f"{key:<44}{base['p50Ms']:>10.1f}{now['p50Ms']:>10.1f}{ratio:>8.2f}"
+              f"{base['peakMemMb']:>10.1f}{now['peakMemMb']:>10.1f}"
+              f"{'  REGRESSION: ' + ', '.join(flags) if flags else ''}")
+    if baseline["meta"].get("predictor") != current["meta"]["predictor"]:
+        print(f"\nNote: baseline used the {baseline['meta'].get('predictor')} model, "
+              f"this run used {current['meta']['predictor']}")
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", type=float, nargs="+", default=[3, 30, 180, 600],
+                        help="Synthetic track lengths in seconds (up to 3600)")
+    parser.add_argument("--kinds", nargs="+", default=["mix"], choices=["tone", "noise", "clicks", "mix"],
+                        help="Synthetic track content")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES, help="Stages to time")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per stage (after one warm-up)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic tracks")
+    parser.add_argument("--cold-workspace", action="store_true",
+                        help="Allocate the mel front-end buffers on every call instead of reusing them")
+    parser.add_argument("--json", help="Write results to this file (use it as a baseline)")
+    parser.add_argument("--compare", help="Baseline JSON to compare against; exits 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative latency increase")
+    parser.add_argument("--memory-tolerance", type=float, default=0.10, help="Allowed relative peak-memory increase")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="Ignore latency changes smaller than this")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    print(f"{'track':<16}{'stage':<28}{'p50 ms':>10}{'p95 ms':>10}{'speed':>11}{'peak MB':>10}{'size KB':>10}")
+    current = run(args)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    if baseline is not None:
+        regressions = compare(current, baseline, args.tolerance, args.memory_tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond tolerance")
+            sys.exit(1)
+        print("\nNo regressions beyond tolerance")
+
+
+if __name__ == "__main__":
+    main_cli()
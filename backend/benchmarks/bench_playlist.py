@@ -0,0 +1,127 @@
+"""
+Latency benchmark for the /playlist engine on large synthetic catalogs
+
+Generates catalogs of songs with (valence, energy) scattered around the
+five mood points plus uniform background, random genres, artists and
+languages, and times ``playlist.generate_playlist`` for random mood pairs
+and preferences. Reports catalog load (column build + grid) time, p50/p95
+playlist latency, and checks every playlist against the exhaustive scan.
+
+Usage:
+    python backend/benchmarks/bench_playlist.py
+    python backend/benchmarks/bench_playlist.py --sizes 1000000 --length 20 --json playlist.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import playlist  # noqa: E402
+
+GENRES = ["blues", "classical", "country", "disco", "hiphop", "jazz", "metal", "pop", "reggae", "rock"]
+LANGUAGES = ["english", "hindi", "tamil", "korean", "arabic"]
+
+
+def synthetic_catalog(n: int, artists: int, seed: int) -> playlist.Catalog:
+    rng = np.random.default_rng(seed)
+    centres = np.array(list(playlist.MOOD_POINTS.values()))
+    clustered = rng.random(n) < 0.7
+    points = rng.random((n, 2))
+    points[clustered] = np.clip(
+        centres[rng.integers(len(centres), size=clustered.sum())] + 0.12 * rng.standard_normal((clustered.sum(), 2)), 0, 1
+    )
+    # Two-decimal moods, like the hand-labelled catalog, so exact ties are common
+    points = np.round(points, 2)
+    columns = {
+        "id": np.arange(n).astype(str).astype(object),
+        "title": np.array([f"Song {i}" for i in range(n)], dtype=object),
+        "artist": rng.integers(artists, size=n).astype(np.int32),
+        "genre": rng.integers(len(GENRES), size=n).astype(np.int32),
+        "language": rng.integers(len(LANGUAGES), size=n).astype(np.int32),
+        "valence": points[:, 0],
+        "energy": points[:, 1],
+        "tempo": np.round(rng.uniform(60, 180, n)),
+        "crnnConfidence": np.round(rng.uniform(0.5, 1, n), 2),
+    }
+    vocab = {"artist": [f"Artist {i}" for i in range(artists)], "genre": GENRES, "language": LANGUAGES}
+    return playlist.Catalog(columns, vocab)
+
+
+def random_request(catalog: playlist.Catalog, rng: np.random.Generator) -> tuple:
+    moods = list(playlist.MOOD_POINTS)
+    prefs = playlist.Preferences(
+        catalog,
+        preferred_genres=list(rng.choice(GENRES, rng.integers(0, 4), replace=False)),
+        favorite_artists=list(rng.choice(catalog.vocab["artist"], rng.integers(0, 6), replace=False)),
+        preferred_languages=list(rng.choice(LANGUAGES, rng.integers(0, 3), replace=False)),
+        liked_song_ids=[str(i) for i in rng.integers(catalog.size, size=rng.integers(0, 50))],
+    )
+    return moods[rng.integers(len(moods))], moods[rng.integers(len(moods))], prefs
+
+
+def run(args) -> dict:
+    rows = {}
+    for n in args.sizes:
+        start = time.perf_counter()
+        catalog = synthetic_catalog(n, args.artists, args.seed)
+        build_s = time.perf_counter() - start
+        rng = np.random.default_rng(args.seed)
+        latencies, mismatches = [], 0
+        for i in range(args.requests):
+            current, target, prefs = random_request(catalog, rng)
+            start = time.perf_counter()
+            result = playlist.generate_playlist(catalog, current, target, prefs, args.length)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if i < args.verify:
+                reference = playlist.generate_playlist(catalog, current, target, prefs, args.length, exhaustive=True)
+                mismatches += result != reference
+        rows[str(n)] = {
+            "size": n,
+            "grid": catalog.grid,
+            "buildS": build_s,
+            "p50Ms": float(np.percentile(latencies, 50)),
+            "p95Ms": float(np.percentile(latencies, 95)),
+            "verified": min(args.verify, args.requests),
+            "mismatches": mismatches,
+        }
+        row = rows[str(n)]
+        print(f"{n:<12}{catalog.grid:>6}{build_s:>10.2f}{row['p50Ms']:>10.2f}{row['p95Ms']:>10.2f}"
+              f"{row['verified'] - mismatches:>6}/{row['verified']}")
+    return rows
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="Catalog sizes")
+    parser.add_argument("--artists", type=int, default=50_000, help="Distinct artists in the synthetic catalog")
+    parser.add_argument("--length", type=int, default=8, help="Songs per playlist")
+    parser.add_argument("--requests", type=int, default=200, help="Playlists per catalog size")
+    parser.add_argument("--verify", type=int, default=20, help="Playlists checked against the exhaustive scan")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    print(f"{'size':<12}{'grid':>6}{'build s':>10}{'p50 ms':>10}{'p95 ms':>10}{'exact':>10}")
+    results = run(args)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "meta": {
+                    "artists": args.artists, "length": args.length, "requests": args.requests, "seed": args.seed,
+                    "numpy": np.__version__, "python": platform.python_version(), "machine": platform.machine(),
+                    "cpuCount": os.cpu_count(), "createdAt": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                },
+                "results": results,
+            }, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main_cli()
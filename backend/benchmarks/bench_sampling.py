@@ -0,0 +1,103 @@
+"""
+Latency vs. agreement benchmark for the /classify segment sampling strategies
+
+Runs extract_features + inference exhaustively and with each sampling
+strategy on synthetic tracks (or real files), then reports how often the
+sampled topGenre agrees with the exhaustive one and how far the averaged
+probabilities move.
+
+Usage:
+    python backend/benchmarks/bench_sampling.py
+    python backend/benchmarks/bench_sampling.py --durations 60 600 --k 4 8 16 --trials 5
+    python backend/benchmarks/bench_sampling.py --files song1.mp3 song2.flac --json sampling.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import main  # noqa: E402
+from fixtures import encode, stand_in_predict, synth_track  # noqa: E402
+
+
+def get_predictor():
+    """The real model when its file exists, otherwise the deterministic stand-in."""
+    if os.path.exists(main.model_path()):
+        main.load_model()
+        return main.predict_segments, "keras"
+    return stand_in_predict, "stand-in"
+
+
+def classify(source, predict, strategy="all", k=main.DEFAULT_SAMPLE_WINDOWS, seed=None) -> tuple:
+    """Return (mean probabilities, latency ms, segments analysed)."""
+    start = time.perf_counter()
+    features = main.extract_features(source, strategy, k, seed)
+    probs = np.mean(predict(features["batch"]), axis=0)
+    return probs, (time.perf_counter() - start) * 1000, len(features["batch"])
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", type=float, nargs="+", default=[60, 300], help="Synthetic track lengths (s)")
+    parser.add_argument("--tracks", type=int, default=3, help="Synthetic tracks per duration")
+    parser.add_argument("--files", nargs="*", default=[], help="Real audio files to use instead of synthetic ones")
+    parser.add_argument("--k", type=int, nargs="+", default=[4, 8, 16], help="Windows per sampled strategy")
+    parser.add_argument("--trials", type=int, default=3, help="Seeds per random/energy configuration")
+    parser.add_argument("--json", help="Write raw results to this file")
+    args = parser.parse_args()
+
+    predict, predictor_name = get_predictor()
+    if args.files:
+        sources = [(os.path.basename(path), path) for path in args.files]
+    else:
+        sources = [
+            (f"synth-{int(d)}s-{i}", encode(synth_track(d, seed=i)))
+            for d in args.durations for i in range(args.tracks)
+        ]
+
+    print(f"Predictor: {predictor_name}; {len(sources)} tracks")
+    rows = []
+    for name, source in sources:
+        # Warm caches and JIT before timing
+        classify(source, predict, "uniform", 1)
+        reference, ref_ms, ref_segments = classify(source, predict)
+        rows.append({"track": name, "strategy": "all", "k": ref_segments, "seed": None,
+                     "latencyMs": ref_ms, "agree": True, "l1": 0.0})
+        for strategy in ("uniform", "energy", "random"):
+            for k in args.k:
+                seeds = [None] if strategy == "uniform" else range(args.trials)
+                for seed in seeds:
+                    probs, ms, _ = classify(source, predict, strategy, k, seed)
+                    rows.append({
+                        "track": name, "strategy": strategy, "k": k, "seed": seed, "latencyMs": ms,
+                        "agree": bool(np.argmax(probs) == np.argmax(reference)),
+                        "l1": float(np.abs(probs - reference).sum()),
+                        "speedup": ref_ms / ms,
+                    })
+
+    print(f"\n{'strategy':<10}{'k':>5}{'latency ms':>13}{'speedup':>10}{'agree %':>10}{'L1':>8}")
+    exhaustive = [r for r in rows if r["strategy"] == "all"]
+    print(f"{'all':<10}{'-':>5}{np.mean([r['latencyMs'] for r in exhaustive]):>13.1f}{1.0:>10.2f}{100.0:>10.1f}{0.0:>8.3f}")
+    for strategy in ("uniform", "energy", "random"):
+        for k in args.k:
+            group = [r for r in rows if r["strategy"] == strategy and r["k"] == k]
+            print(f"{strategy:<10}{k:>5}"
+                  f"{np.mean([r['latencyMs'] for r in group]):>13.1f}"
+                  f"{np.mean([r['speedup'] for r in group]):>10.2f}"
+                  f"{100 * np.mean([r['agree'] for r in group]):>10.1f}"
+                  f"{np.mean([r['l1'] for r in group]):>8.3f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"predictor": predictor_name, "results": rows}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main_cli()
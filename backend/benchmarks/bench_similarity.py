@@ -0,0 +1,144 @@
+"""
+Build time, memory and recall/latency benchmark for the /similar vector index
+
+Generates clustered synthetic embeddings (unit vectors scattered around
+random genre-like centres), builds the exact and IVF indexes over them in
+float32 and float16, and reports per configuration: build time, bytes per
+vector, single-query p50/p95 latency and recall@k against brute force for
+a sweep of IVF n_probe values. Queries are fresh points from the same
+distribution, not catalog members.
+
+Usage:
+    python backend/benchmarks/bench_similarity.py
+    python backend/benchmarks/bench_similarity.py --sizes 1000000 --dim 128 --n-probe 4 16 64 --json similarity.json
+    python backend/benchmarks/bench_similarity.py --embeddings embeddings.npz   # real catalog embeddings
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import vector_index  # noqa: E402
+
+
+def synthetic_embeddings(n: int, dim: int, clusters: int, spread: float, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(clusters, size=n)
+    vectors = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, vector_index.SCAN_CHUNK_ROWS):
+        rows = labels[start:start + vector_index.SCAN_CHUNK_ROWS]
+        noise = rng.standard_normal((len(rows), dim)).astype(np.float32)
+        vectors[start:start + len(rows)] = centres[rows] + spread * noise
+    return vector_index.normalize(vectors)
+
+
+def time_queries(index, queries: np.ndarray, k: int, **options) -> tuple:
+    """Run every query; returns (result ids per query, latencies in ms)."""
+    results, latencies = [], []
+    index.search(queries[0], k, **options)  # warm-up: page in a memory-mapped index
+    for query in queries:
+        start = time.perf_counter()
+        ids, _ = index.search(query, k, **options)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(ids)
+    return results, latencies
+
+
+def recall(results: list, truth: list) -> float:
+    k = len(truth[0])
+    return float(np.mean([len(set(r) & set(t)) / k for r, t in zip(results, truth)]))
+
+
+def run(args) -> dict:
+    rows = {}
+    for n in args.sizes:
+        if args.embeddings:
+            data = np.load(args.embeddings)
+            vectors = vector_index.normalize(data["vectors"][:n])
+            ids = data["ids"][:n]
+            # Leave-one-out queries from the catalog itself
+            query_rows = np.random.default_rng(args.seed).choice(len(vectors), args.queries, replace=False)
+            queries = vectors[query_rows]
+        else:
+            vectors = synthetic_embeddings(n, args.dim, args.clusters, args.spread, args.seed)
+            ids = np.arange(n).astype(str)
+            queries = synthetic_embeddings(args.queries, args.dim, args.clusters, args.spread, args.seed)
+        n = len(vectors)
+        truth = None
+
+        for dtype in args.dtypes:
+            for kind in ("exact", "ivf"):
+                start = time.perf_counter()
+                index = vector_index.build_index(kind, vectors, ids, dtype=dtype, n_lists=args.n_lists)
+                build_s = time.perf_counter() - start
+                sweep = args.n_probe if kind == "ivf" else [None]
+                for n_probe in sweep:
+                    results, latencies = time_queries(index, queries, args.k, n_probe=n_probe)
+                    if truth is None:
+                        # float32 exact search is the ground truth (it runs first)
+                        truth = results
+                    name = f"{n}/{kind}-{dtype}" + (f"/nprobe={n_probe}" if n_probe else "")
+                    rows[name] = {
+                        "size": n,
+                        "kind": kind,
+                        "dtype": dtype,
+                        "nProbe": n_probe,
+                        "nLists": index.stats().get("nLists"),
+                        "buildS": build_s,
+                        "bytesPerVector": index.nbytes() / n,
+                        "p50Ms": float(np.percentile(latencies, 50)),
+                        "p95Ms": float(np.percentile(latencies, 95)),
+                        f"recallAt{args.k}": recall(results, truth),
+                    }
+                    row = rows[name]
+                    print(f"{name:<36}{build_s:>9.2f}{row['bytesPerVector']:>10.1f}{row['p50Ms']:>10.2f}"
+                          f"{row['p95Ms']:>10.2f}{row[f'recallAt{args.k}']:>10.3f}")
+                del index
+    return rows
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="Catalog sizes")
+    parser.add_argument("--dim", type=int, default=128, help="Embedding size of the synthetic vectors")
+    parser.add_argument("--clusters", type=int, default=200, help="Centres the synthetic vectors scatter around")
+    parser.add_argument("--spread", type=float, default=0.8, help="Noise scale around each centre")
+    parser.add_argument("--embeddings", help=".npz with 'ids' and 'vectors' to use instead of synthetic vectors")
+    parser.add_argument("--dtypes", nargs="+", default=["float32", "float16"], choices=["float32", "float16"])
+    parser.add_argument("--n-lists", type=int, help="IVF lists (default: 4 * sqrt(n))")
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[1, 4, 16, 64], help="IVF lists scanned per query")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours per query")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per configuration")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+    if "float32" in args.dtypes:
+        # Ground truth comes from the first (float32 exact) configuration
+        args.dtypes = ["float32"] + [d for d in args.dtypes if d != "float32"]
+
+    print(f"{'size/config':<36}{'build s':>9}{'B/vector':>10}{'p50 ms':>10}{'p95 ms':>10}{'recall':>10}")
+    results = run(args)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "meta": {
+                    "dim": args.dim, "clusters": args.clusters, "spread": args.spread, "k": args.k,
+                    "queries": args.queries, "embeddings": args.embeddings, "numpy": np.__version__,
+                    "python": platform.python_version(), "machine": platform.machine(), "cpuCount": os.cpu_count(),
+                    "createdAt": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                },
+                "results": results,
+            }, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,110 @@
+"""
+Deterministic synthetic audio for the backend benchmarks
+
+Tracks are built from sections of tones, noise and click patterns so that
+different windows of one track look different to the model. Everything is
+generated from a seed; nothing is downloaded.
+"""
+
+import io
+
+import numpy as np
+import soundfile as sf
+
+SECTION_SECONDS = 7.0
+
+
+def tone(seconds: float, sr: int, freqs=(220.0, 277.2, 329.6), seed: int = 0) -> np.ndarray:
+    """Chord of sine partials with a slow tremolo."""
+    t = np.arange(int(seconds * sr)) / sr
+    rng = np.random.default_rng(seed)
+    y = sum(np.sin(2 * np.pi * f * t + rng.uniform(0, 2 * np.pi)) for f in freqs) / len(freqs)
+    return (0.3 * y * (0.8 + 0.2 * np.sin(2 * np.pi * 0.5 * t))).astype(np.float32)
+
+
+def noise(seconds: float, sr: int, seed: int = 0, color: float = 0.0) -> np.ndarray:
+    """White (color=0) to brown-ish (color=1) noise."""
+    rng = np.random.default_rng(seed)
+    y = rng.standard_normal(int(seconds * sr))
+    if color > 0:
+        y = (1 - color) * y + color * np.cumsum(y) / np.sqrt(sr)
+        y -= np.mean(y)
+    return (0.2 * y / (np.max(np.abs(y)) + 1e-9)).astype(np.float32)
+
+
+def clicks(seconds: float, sr: int, bpm: float = 120.0, seed: int = 0) -> np.ndarray:
+    """Decaying noise bursts on every beat."""
+    rng = np.random.default_rng(seed)
+    y = np.zeros(int(seconds * sr), dtype=np.float32)
+    burst = int(0.03 * sr)
+    envelope = np.exp(-np.arange(burst) / (0.005 * sr)).astype(np.float32)
+    for start in np.arange(0, len(y) - burst, 60.0 / bpm * sr).astype(int):
+        y[start:start + burst] += 0.6 * envelope * rng.standard_normal(burst).astype(np.float32)
+    return y
+
+
+def synth_track(seconds: float, sr: int = 22050, seed: int = 0, kind: str = "mix") -> np.ndarray:
+    """A mono float32 track of ``seconds`` built from ``kind`` sections ("tone", "noise", "clicks" or "mix")."""
+    rng = np.random.default_rng(seed)
+    total = int(seconds * sr)
+    out = np.zeros(total, dtype=np.float32)
+    position = 0
+    section = 0
+    while position < total:
+        length = min(int(SECTION_SECONDS * sr), total - position)
+        section_kind = kind if kind != "mix" else ("tone", "noise", "clicks")[rng.integers(3)]
+        section_seed = seed * 1000 + section
+        if section_kind == "tone":
+            root = rng.uniform(110, 440)
+            y = tone(length / sr, sr, freqs=(root, root * 1.26, root * 1.5), seed=section_seed)
+        elif section_kind == "noise":
+            y = noise(length / sr, sr, seed=section_seed, color=rng.uniform(0, 1))
+        else:
+            y = clicks(length / sr, sr, bpm=rng.uniform(70, 170), seed=section_seed)
+        out[position:position + len(y)] = y[:length] * rng.uniform(0.3, 1.0)
+        position += length
+        section += 1
+    return out
+
+
+def encode(y: np.ndarray, sr: int = 22050, fmt: str = "WAV", channels: int = 1) -> bytes:
+    """Encode a mono signal as an in-memory audio file (WAV, FLAC, OGG or MP3)."""
+    if channels > 1:
+        y = np.repeat(y[:, np.newaxis], channels, axis=1)
+    buffer = io.BytesIO()
+    sf.write(buffer, y, sr, format=fmt)
+    return buffer.getvalue()
+
+
+def stand_in_predict(batch: np.ndarray, num_classes: int = 10, seed: int = 0) -> np.ndarray:
+    """Deterministic stand-in for the CRNN when no model file is present.
+
+    Softmax of a fixed random projection of each segment's per-band mean
+    log-mel, so predictions still depend on the audio.
+    """
+    rng = np.random.default_rng(seed)
+    band_means = batch.reshape(len(batch), batch.shape[1], -1).mean(axis=2)
+    band_means = (band_means - band_means.mean(axis=1, keepdims=True)) / 10.0
+    logits = band_means @ rng.standard_normal((batch.shape[1], num_classes))
+    logits -= logits.max(axis=1, keepdims=True)
+    probs = np.exp(logits)
+    return (probs / probs.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+def build_stand_in_model(num_classes: int = 10, seed: int = 0):
+    """Tiny untrained Keras model with the CRNN's input and output shapes.
+
+    Used by the benchmarks when crnn_gtzan_model_best.h5 is missing so the
+    inference and /classify timings still exercise a real ``model.predict``.
+    """
+    import keras
+
+    keras.utils.set_random_seed(seed)
+    return keras.Sequential([
+        keras.Input(shape=(128, 130, 1)),
+        keras.layers.Conv2D(8, 3, strides=2, activation="relu"),
+        keras.layers.MaxPooling2D(4),
+        keras.layers.Conv2D(16, 3, activation="relu"),
+        keras.layers.GlobalAveragePooling2D(),
+        keras.layers.Dense(num_classes, activation="softmax"),
+    ])
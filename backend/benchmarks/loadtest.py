@@ -0,0 +1,424 @@
+"""
+Load generator for a local backend instance
+
+Replays a mix of synthetic uploads (several lengths and formats) against
+/classify, with a share of /health probes, either closed-loop at a fixed
+concurrency or open-loop at a target arrival rate. Every --interval seconds
+it prints throughput, latency percentiles, error and 503 counts and the
+server's RSS (including worker processes); a summary and optional JSON
+time series follow at the end.
+
+Open-loop latency is measured from each request's scheduled send time, so
+time spent waiting for a free client slot counts against the server.
+
+With --spawn, --topology picks how the server runs: "single" (one uvicorn
+process, today's default), "workers" (uvicorn --workers N, a model copy per
+worker) or "model-process" (serve.py: N HTTP workers and one model process).
+Several topologies run one after another and end with a comparison of
+throughput, latency and resident memory per process.
+
+Uploads repeat across requests, so run the server with CACHE_MAX_BYTES=0 to
+measure uncached capacity. Requests go through http.client, so the client
+needs nothing beyond the fixtures' numpy and soundfile; RSS sampling reads
+/proc and is skipped on other platforms.
+
+Usage:
+    python backend/benchmarks/loadtest.py --spawn --concurrency 8 --duration 60
+    python backend/benchmarks/loadtest.py --url http://127.0.0.1:8000 --server-pid 1234 --rate 5
+    python backend/benchmarks/loadtest.py --spawn --rate 2 4 8 16 --duration 30 --json capacity.json
+    python backend/benchmarks/loadtest.py --spawn --topology single workers model-process --workers 4 --concurrency 16
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import encode, synth_track  # noqa: E402
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+CONTENT_TYPES = {"WAV": "audio/wav", "FLAC": "audio/flac", "OGG": "audio/ogg", "MP3": "audio/mpeg"}
+
+
+class Upload:
+    """A pre-encoded multipart /classify request body."""
+
+    def __init__(self, name: str, audio_seconds: float, data: bytes, fmt: str):
+        boundary = uuid.uuid4().hex
+        filename = f"{name}.{fmt.lower()}"
+        self.name = name
+        self.audio_seconds = audio_seconds
+        self.body = (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f"Content-Type: {CONTENT_TYPES[fmt]}\r\n\r\n"
+        ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+
+
+def build_uploads(durations, formats, variants: int) -> list:
+    uploads = []
+    for seconds in durations:
+        for fmt in formats:
+            for variant in range(variants):
+                y = synth_track(seconds, seed=variant)
+                uploads.append(Upload(f"{seconds:g}s-{variant}", seconds, encode(y, fmt=fmt), fmt))
+    return uploads
+
+
+def process_rss_bytes(pid: int) -> int:
+    """Resident memory of ``pid`` and all of its descendants, from /proc."""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/statm") as f:
+                total += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+            for tid in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{tid}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+def process_rss_breakdown(pid: int) -> list:
+    """``(pid, command, rss_bytes)`` for ``pid`` and each of its descendants, from /proc."""
+    processes = []
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/statm") as f:
+                rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+            with open(f"/proc/{current}/cmdline", "rb") as f:
+                command = f.read().replace(b"\0", b" ").decode(errors="replace").strip()
+            for tid in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{tid}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue
+        processes.append((current, command, rss))
+    return processes
+
+
+class Recorder:
+    """Thread-safe log of completed requests."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = []  # (finished_at, endpoint, status, latency_s, x_cache, audio_seconds)
+        self.dropped = 0
+        self.in_flight = 0
+
+    def add(self, *record):
+        with self.lock:
+            self.records.append(record)
+
+    def window(self, start: float, end: float) -> list:
+        with self.lock:
+            return [r for r in self.records if start <= r[0] < end]
+
+
+class Client:
+    """Per-thread keep-alive connection to the server."""
+
+    def __init__(self, url: str, timeout: float):
+        parsed = urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def request(self, method: str, path: str, body: bytes = None, headers: dict = None) -> tuple:
+        """Return ``(status, x_cache)``; status 0 means a connection error or timeout."""
+        conn = self._connection()
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            response.read()
+            return response.status, response.getheader("X-Cache")
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self.local.conn = None
+            return 0, None
+
+
+def send(client: Client, recorder: Recorder, upload, scheduled_at: float):
+    """Issue one request; ``upload`` None means a /health probe."""
+    with recorder.lock:
+        recorder.in_flight += 1
+    try:
+        if upload is None:
+            status, x_cache = client.request("GET", "/health")
+            recorder.add(time.monotonic(), "/health", status, time.monotonic() - scheduled_at, x_cache, 0.0)
+        else:
+            status, x_cache = client.request("POST", "/classify", upload.body, {"Content-Type": upload.content_type})
+            recorder.add(time.monotonic(), "/classify", status, time.monotonic() - scheduled_at,
+                         x_cache, upload.audio_seconds)
+    finally:
+        with recorder.lock:
+            recorder.in_flight -= 1
+
+
+def pick(rng: random.Random, uploads: list, health_ratio: float):
+    return None if rng.random() < health_ratio else rng.choice(uploads)
+
+
+def run_closed_loop(client, recorder, uploads, args, end: float):
+    """``concurrency`` workers, each sending its next request as soon as the last one returns."""
+    def worker(index: int):
+        rng = random.Random(args.seed + index)
+        while time.monotonic() < end:
+            send(client, recorder, pick(rng, uploads, args.health_ratio), time.monotonic())
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_open_loop(client, recorder, uploads, args, rate: float, end: float):
+    """Send at ``rate`` requests/s (Poisson or constant) regardless of how fast responses come back."""
+    rng = random.Random(args.seed)
+    with ThreadPoolExecutor(max_workers=args.max_in_flight) as pool:
+        next_at = time.monotonic()
+        while next_at < end:
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if recorder.in_flight >= args.max_in_flight:
+                # The client itself is saturated; count it rather than queueing without bound
+                with recorder.lock:
+                    recorder.dropped += 1
+            else:
+                pool.submit(send, client, recorder, pick(rng, uploads, args.health_ratio), next_at)
+            gap = rng.expovariate(rate) if args.arrival == "poisson" else 1.0 / rate
+            next_at += gap
+
+
+def summarize(records: list, seconds: float) -> dict:
+    """Throughput, latency percentiles and status breakdown for a set of records."""
+    summary = {}
+    for endpoint in ("/classify", "/health"):
+        rows = [r for r in records if r[1] == endpoint]
+        ok = [r for r in rows if r[2] == 200]
+        latencies = np.array([r[3] for r in ok]) * 1000
+        statuses = {}
+        for r in rows:
+            statuses[str(r[2])] = statuses.get(str(r[2]), 0) + 1
+        stats = {
+            "requests": len(rows),
+            "ok": len(ok),
+            "throughputRps": len(ok) / seconds if seconds else 0.0,
+            "errorRate": sum(1 for r in rows if r[2] not in (200, 503)) / len(rows) if rows else 0.0,
+            "rate503": statuses.get("503", 0) / len(rows) if rows else 0.0,
+            "statuses": statuses,
+        }
+        if len(ok):
+            stats.update({
+                f"p{q}Ms": float(np.percentile(latencies, q)) for q in (50, 90, 95, 99)
+            })
+            stats["maxMs"] = float(latencies.max())
+        if endpoint == "/classify":
+            stats["audioSecondsPerSecond"] = sum(r[5] for r in ok) / seconds if seconds else 0.0
+            stats["cacheHits"] = sum(1 for r in ok if r[4] not in (None, "computed"))
+        summary[endpoint] = stats
+    return summary
+
+
+def run_level(client, recorder, uploads, args, rate, server_pid) -> dict:
+    """Drive one load level for --duration seconds and report as it goes."""
+    start = time.monotonic()
+    measure_from = start + args.warmup
+    end = measure_from + args.duration
+    label = f"rate {rate:g}/s" if rate else f"concurrency {args.concurrency}"
+    print(f"\n== {label}: {args.warmup:g}s warm-up + {args.duration:g}s ==")
+    print(f"{'t':>6}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'503':>6}{'err':>6}{'inflight':>10}{'RSS MB':>10}")
+
+    if rate:
+        driver = threading.Thread(target=run_open_loop, args=(client, recorder, uploads, args, rate, end), daemon=True)
+    else:
+        driver = threading.Thread(target=run_closed_loop, args=(client, recorder, uploads, args, end), daemon=True)
+    driver.start()
+
+    timeline = []
+    tick = start
+    while driver.is_alive():
+        driver.join(timeout=max(0.0, tick + args.interval - time.monotonic()))
+        now = time.monotonic()
+        if now - tick < args.interval and driver.is_alive():
+            continue
+        rows = [r for r in recorder.window(tick, now) if r[1] == "/classify"]
+        ok = np.array([r[3] for r in rows if r[2] == 200]) * 1000
+        rss = process_rss_bytes(server_pid) / (1024 * 1024) if server_pid else None
+        point = {
+            "t": now - start,
+            "rps": len(ok) / (now - tick),
+            "p50Ms": float(np.percentile(ok, 50)) if len(ok) else None,
+            "p95Ms": float(np.percentile(ok, 95)) if len(ok) else None,
+            "p99Ms": float(np.percentile(ok, 99)) if len(ok) else None,
+            "count503": sum(1 for r in rows if r[2] == 503),
+            "errors": sum(1 for r in rows if r[2] not in (200, 503)),
+            "inFlight": recorder.in_flight,
+            "rssMb": rss,
+        }
+        timeline.append(point)
+        fmt = lambda v: f"{v:>10.0f}" if v is not None else f"{'-':>10}"  # noqa: E731
+        print(f"{point['t']:>6.0f}{point['rps']:>8.2f}{fmt(point['p50Ms'])}{fmt(point['p95Ms'])}{fmt(point['p99Ms'])}"
+              f"{point['count503']:>6}{point['errors']:>6}{point['inFlight']:>10}{fmt(rss)}")
+        tick = now
+
+    summary = summarize(recorder.window(measure_from, float("inf")), args.duration)
+    rss_values = [p["rssMb"] for p in timeline if p["rssMb"] is not None]
+    result = {
+        "mode": "open" if rate else "closed",
+        "rate": rate,
+        "concurrency": None if rate else args.concurrency,
+        "dropped": recorder.dropped,
+        "summary": summary,
+        "rssMbMax": max(rss_values) if rss_values else None,
+        "timeline": timeline,
+    }
+    classify = summary["/classify"]
+    print(f"/classify: {classify['throughputRps']:.2f} req/s, {classify['audioSecondsPerSecond']:.1f} audio s/s, "
+          f"p50 {classify.get('p50Ms', 0):.0f} ms, p95 {classify.get('p95Ms', 0):.0f} ms, "
+          f"p99 {classify.get('p99Ms', 0):.0f} ms, 503 {100 * classify['rate503']:.1f}%, "
+          f"other errors {100 * classify['errorRate']:.1f}%, served from cache {classify['cacheHits']}"
+          + (f", client-dropped {recorder.dropped}" if rate else ""))
+    if result["rssMbMax"] is not None:
+        print(f"server RSS: max {result['rssMbMax']:.0f} MB")
+    return result
+
+
+def spawn_server(port: int, topology: str = "single", workers: int = 1) -> subprocess.Popen:
+    """Start the server on ``port`` from the backend directory, inheriting this environment."""
+    if topology == "model-process":
+        command = [sys.executable, "serve.py", "--workers", str(workers)]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "main:app"]
+        if topology == "workers":
+            command += ["--workers", str(workers)]
+    return subprocess.Popen(
+        command + ["--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+    )
+
+
+def wait_for_health(client: Client, timeout: float, server: subprocess.Popen = None):
+    """Block until /health/ready answers 200, i.e. the model is loaded and warmed up.
+
+    /health answers as soon as the process serves requests, so waiting on it
+    would time the warm-up as part of the first measured level.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if client.request("GET", "/health/ready")[0] == 200:
+            return
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        time.sleep(0.5)
+    raise RuntimeError(f"Server did not become ready within {timeout:g}s")
+
+
+def print_topology_comparison(runs: list):
+    print(f"\n{'topology':<16}{'procs':>6}{'RSS MB':>9}{'max/proc':>10}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}")
+    for run in runs:
+        for level in run["levels"]:
+            classify = level["summary"]["/classify"]
+            print(f"{run['topology']:<16}{len(run['processes']):>6}{run['rssMb']:>9.0f}{run['maxProcessRssMb']:>10.0f}"
+                  f"{classify['throughputRps']:>8.2f}{classify.get('p50Ms', 0):>9.0f}{classify.get('p95Ms', 0):>9.0f}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Server base URL")
+    parser.add_argument("--spawn", action="store_true", help="Start a uvicorn server on the URL's port for the run")
+    parser.add_argument("--server-pid", type=int, help="PID whose RSS (plus children) to sample")
+    parser.add_argument("--topology", nargs="+", default=["single"], choices=["single", "workers", "model-process"],
+                        help="With --spawn: server layout(s) to run, one after another")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes for the workers and model-process topologies")
+    parser.add_argument("--concurrency", type=int, default=4, help="Closed-loop in-flight requests")
+    parser.add_argument("--rate", type=float, nargs="*", default=[],
+                        help="Open-loop arrival rate(s) in requests/s; several values run one level each")
+    parser.add_argument("--arrival", choices=["poisson", "constant"], default="poisson", help="Open-loop spacing")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="Open-loop client concurrency cap")
+    parser.add_argument("--duration", type=float, default=60, help="Measured seconds per level")
+    parser.add_argument("--warmup", type=float, default=5, help="Unmeasured seconds before each level")
+    parser.add_argument("--interval", type=float, default=5, help="Seconds between progress lines")
+    parser.add_argument("--durations", type=float, nargs="+", default=[10, 30, 180], help="Upload lengths (s)")
+    parser.add_argument("--formats", nargs="+", default=["WAV", "FLAC", "OGG"], choices=sorted(CONTENT_TYPES))
+    parser.add_argument("--variants", type=int, default=2, help="Distinct tracks per length and format")
+    parser.add_argument("--health-ratio", type=float, default=0.05, help="Share of requests sent to /health")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write summaries and time series to this file")
+    args = parser.parse_args()
+    if len(args.topology) > 1 and not args.spawn:
+        parser.error("comparing topologies needs --spawn")
+
+    print("Encoding uploads...")
+    uploads = build_uploads(args.durations, args.formats, args.variants)
+    print(f"{len(uploads)} uploads, {sum(len(u.body) for u in uploads) / 1e6:.1f} MB")
+
+    client = Client(args.url, args.timeout)
+    runs = []
+    for topology in args.topology if args.spawn else [None]:
+        server = None
+        server_pid = args.server_pid
+        if args.spawn:
+            print(f"\n### topology: {topology}" + (f" ({args.workers} workers)" if topology != "single" else ""))
+            server = spawn_server(client.port, topology, args.workers)
+            server_pid = server.pid
+        try:
+            wait_for_health(client, timeout=120 if args.spawn else 5, server=server)
+            levels = []
+            for rate in args.rate or [None]:
+                recorder = Recorder()
+                levels.append(run_level(client, recorder, uploads, args, rate, server_pid))
+            processes = process_rss_breakdown(server_pid) if server_pid else []
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+        runs.append({
+            "topology": topology,
+            "levels": levels,
+            "processes": [{"pid": pid, "command": command, "rssMb": rss / (1024 * 1024)}
+                          for pid, command, rss in processes],
+            "rssMb": sum(rss for _, _, rss in processes) / (1024 * 1024),
+            "maxProcessRssMb": max((rss for _, _, rss in processes), default=0) / (1024 * 1024),
+        })
+    if len(runs) > 1:
+        print_topology_comparison(runs)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "runs": runs} if args.spawn else
+                      {"args": vars(args), "levels": runs[0]["levels"]}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main_cli()
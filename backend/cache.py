@@ -0,0 +1,180 @@
+"""
+Content-addressed result cache for /classify
+
+Results are stored as serialized JSON keyed on a hash of the uploaded bytes
+plus the model's identity. An in-memory LRU tier is bounded by total size in
+bytes; an optional on-disk tier keeps results across restarts. Identical
+uploads arriving together share a single computation (single-flight).
+
+Cached values are replayed byte for byte, so a hit reports the
+``processingTime`` of the run that computed it; callers tell hits apart by
+the source get_or_compute returns.
+"""
+
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+
+def new_key_hasher(model_identity: str):
+    """Incremental sha256 seeded with the model identity; feed it the upload bytes."""
+    return hashlib.sha256(model_identity.encode())
+
+
+def cache_key(audio_bytes: bytes, model_identity: str) -> str:
+    """Key for an upload: sha256 over the model identity and the raw audio bytes."""
+    digest = new_key_hasher(model_identity)
+    digest.update(audio_bytes)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Two-tier (memory LRU + optional disk) cache with in-flight deduplication."""
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, disk_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir or None
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._in_flight: dict = {}
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+        self.evictions = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the cached value, promoting disk hits into memory."""
+        return self._lookup(key)[0]
+
+    def _lookup(self, key: str) -> tuple:
+        value = self._get_memory(key)
+        if value is not None:
+            return value, "memory"
+        if self.disk_dir:
+            return self._promote_disk(key, self._read_disk(key))
+        return None, None
+
+    def _get_memory(self, key: str) -> Optional[bytes]:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return value
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        """Read a disk entry; touches no shared state, so it may run in a thread."""
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            print(f"Warning: Could not read cache entry {key}: {e}")
+            return None
+
+    def _promote_disk(self, key: str, value: Optional[bytes]) -> tuple:
+        if value is None:
+            return None, None
+        self.disk_hits += 1
+        self._put_memory(key, value)
+        return value, "disk"
+
+    def put(self, key: str, value: bytes):
+        """Store a value in memory and, if configured, on disk."""
+        self._put_memory(key, value)
+        if self.disk_dir:
+            self._put_disk(key, value)
+
+    def _put_disk(self, key: str, value: bytes):
+        # Write-then-rename so readers never see a partial file
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: Could not write cache entry {key}: {e}")
+
+    def _put_memory(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous)
+        self._entries[key] = value
+        self._size += len(value)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self.evictions += 1
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[bytes]]) -> tuple:
+        """Return ``(value, source)`` where source is "memory", "disk", "shared" or "computed".
+
+        Concurrent callers with the same key wait on one ``compute()``, run as
+        a task the cache owns: a caller that is cancelled stops waiting, but
+        the computation carries on for the others. Failures propagate to
+        every waiter and are not cached. Disk reads and writes run in a
+        thread, off the event loop.
+        """
+        pending = self._in_flight.get(key)
+        if pending is None:
+            value = self._get_memory(key)
+            if value is not None:
+                return value, "memory"
+            if self.disk_dir:
+                value, source = self._promote_disk(key, await asyncio.to_thread(self._read_disk, key))
+                if value is not None:
+                    return value, source
+            # Another caller may have started the computation while the disk was read
+            pending = self._in_flight.get(key)
+
+        if pending is not None:
+            self.deduplicated += 1
+            return await asyncio.shield(pending), "shared"
+
+        self.misses += 1
+        task = asyncio.get_running_loop().create_task(self._compute(key, compute))
+        self._in_flight[key] = task
+        return await asyncio.shield(task), "computed"
+
+    def pending(self, key: str) -> Optional[asyncio.Task]:
+        """The in-flight computation for ``key``, if any."""
+        return self._in_flight.get(key)
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[bytes]]) -> bytes:
+        try:
+            value = await compute()
+            self._put_memory(key, value)
+            if self.disk_dir:
+                await asyncio.to_thread(self._put_disk, key, value)
+            return value
+        finally:
+            self._in_flight.pop(key, None)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current memory usage."""
+        lookups = self.hits + self.disk_hits + self.misses + self.deduplicated
+        return {
+            "hits": self.hits,
+            "diskHits": self.disk_hits,
+            "misses": self.misses,
+            "deduplicated": self.deduplicated,
+            "evictions": self.evictions,
+            "hitRate": (lookups - self.misses) / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "maxBytes": self.max_bytes,
+            "diskDir": self.disk_dir,
+        }
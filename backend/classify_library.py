@@ -0,0 +1,338 @@
+"""
+Bulk offline genre classification of an audio library
+
+Walks a directory (or reads a manifest of paths, one per line), decodes and
+extracts model inputs in a pool of worker processes, and runs every track
+through a single copy of the model in this process, in large batches that
+mix segments from many tracks. Results are appended to a JSONL file, one
+line per track:
+
+    {"path": ..., "duration": ..., "numSegments": ..., "topGenre": ...,
+     "topConfidence": ..., "probabilities": [...]}
+
+Probabilities follow the GTZAN_GENRES order recorded in the checkpoint.
+Tracks that cannot be classified get ``{"path": ..., "error": ...}``.
+
+A checkpoint next to the output (``<output>.checkpoint``) records how many
+bytes of it are complete. After an interruption, running the same command
+again truncates any partly written line and skips the tracks already
+listed, so the run resumes where it stopped. --export-npz additionally
+writes the results as columns (paths, probabilities, ...) for analysis.
+With --feature-store, tracks already in a feature store (feature_store.py)
+are read from its memory-mapped mels instead of being decoded.
+
+Usage:
+    python backend/classify_library.py /music --output tags.jsonl
+    python backend/classify_library.py --manifest tracks.txt --output tags.jsonl --workers 16
+    python backend/classify_library.py /music --output tags.jsonl --strategy uniform --k 8 --export-npz tags.npz
+    python backend/classify_library.py /music --output tags-v2.jsonl --feature-store features/
+"""
+
+import os
+
+# One BLAS/OpenMP thread per process: parallelism comes from the worker pool,
+# and oversubscribed cores would stop throughput from scaling with them
+for _var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import multiprocessing  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait  # noqa: E402
+
+import numpy as np  # noqa: E402
+
+import main  # noqa: E402
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".ogg", ".flac")
+PROGRESS_INTERVAL_SECONDS = 5.0
+
+
+def find_tracks(root: str) -> list:
+    """Audio files under ``root``, relative to it, in a stable order."""
+    tracks = []
+    for directory, subdirs, files in os.walk(root):
+        subdirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(AUDIO_EXTENSIONS):
+                tracks.append(os.path.relpath(os.path.join(directory, name), root))
+    return tracks
+
+
+def read_manifest(path: str) -> list:
+    """Paths listed one per line; blank lines and ``#`` comments are skipped."""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def file_signature(path: str) -> dict:
+    """Size and mtime, to tell whether a file changed since its features were stored."""
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtimeNs": stat.st_mtime_ns}
+
+
+def extract_track(path: str, strategy: str, k: int, seed: int) -> dict:
+    """Worker job: model inputs for one track, or an error message.
+
+    Errors are returned rather than raised so a bad file never has to
+    pickle an arbitrary exception back to the parent.
+    """
+    try:
+        features = main.extract_features(path, strategy, k, seed, visualize=False)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    if features["numSegments"] == 0:
+        return {"error": "Audio file too short. Minimum duration is ~1.5 seconds."}
+    return {"duration": features["duration"], "numSegments": features["numSegments"], "batch": features["batch"]}
+
+
+def stored_features(store, path: str, base: str, args) -> dict:
+    """Model inputs for ``path`` from a FeatureStore, or None if it is missing or out of date."""
+    try:
+        signature = file_signature(os.path.join(base, path))
+    except OSError:
+        # The audio is gone but its features are not
+        signature = None
+    if path not in store or (signature is not None and not store.is_current(path, signature)):
+        return None
+    mel = store.mel(path)
+    num_segments = len(mel)
+    if args.strategy != "all":
+        indices = main.select_segment_windows(num_segments, args.strategy, args.k, args.seed)
+        mel = mel[indices]
+    return {
+        "duration": store.records[path]["duration"],
+        "numSegments": num_segments,
+        "batch": mel.astype(np.float32)[..., np.newaxis],
+    }
+
+
+class ResultLog:
+    """Append-only JSONL output plus the checkpoint that makes it resumable."""
+
+    def __init__(self, path: str, meta: dict):
+        self.path = path
+        self.checkpoint_path = path + ".checkpoint"
+        self.meta = meta
+        self.done = set()
+        self.tracks = 0
+        self.errors = 0
+        self._recover()
+        self._file = open(self.path, "ab")
+
+    def _recover(self):
+        if not os.path.exists(self.path):
+            return
+        checkpoint = None
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+            for key, value in self.meta.items():
+                if checkpoint["meta"].get(key) != value:
+                    raise SystemExit(
+                        f"{self.path} was written with {key}={checkpoint['meta'].get(key)!r}, not {value!r}; "
+                        f"use another --output (or delete it and its checkpoint) to start over"
+                    )
+        with open(self.path, "rb") as f:
+            data = f.read()
+        # Everything after the last checkpoint (or the last full line) may be torn
+        offset = checkpoint["offset"] if checkpoint is not None else data.rfind(b"\n") + 1
+        if offset < len(data):
+            print(f"Discarding {len(data) - offset} bytes written after the last checkpoint")
+            with open(self.path, "r+b") as f:
+                f.truncate(offset)
+        for line in data[:offset].splitlines():
+            record = json.loads(line)
+            self.done.add(record["path"])
+            self.tracks += 1
+            self.errors += "error" in record
+
+    def write(self, record: dict):
+        self._file.write(json.dumps(record, separators=(",", ":")).encode() + b"\n")
+        self.done.add(record["path"])
+        self.tracks += 1
+        self.errors += "error" in record
+
+    def checkpoint(self):
+        """Make everything written so far durable, then record its length atomically."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        state = {"offset": self._file.tell(), "tracks": self.tracks, "errors": self.errors,
+                 "meta": self.meta, "updatedAt": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def close(self):
+        self.checkpoint()
+        self._file.close()
+
+
+def classify_pending(model, pending: list, batch_size: int, log: ResultLog) -> int:
+    """Run one predict call over the segments of every pending track and log the results."""
+    batch = np.concatenate([features["batch"] for _, features in pending])
+    predictions = model.predict(batch, batch_size=batch_size, verbose=0)
+    start = 0
+    for path, features in pending:
+        count = len(features["batch"])
+        probabilities = np.mean(predictions[start:start + count], axis=0)
+        start += count
+        top = int(np.argmax(probabilities))
+        log.write({
+            "path": path,
+            "duration": features["duration"],
+            "numSegments": features["numSegments"],
+            "topGenre": main.GTZAN_GENRES[top],
+            "topConfidence": float(probabilities[top]),
+            "probabilities": [round(float(p), 6) for p in probabilities],
+        })
+    return len(batch)
+
+
+def run(args, tracks: list, log: ResultLog):
+    todo = [path for path in tracks if path not in log.done]
+    print(f"{len(tracks)} tracks, {len(tracks) - len(todo)} already done, {len(todo)} to classify "
+          f"with {args.workers} feature workers")
+    if not todo:
+        return
+    model = main.load_model()
+    base = args.root or ""
+    store = None
+    if args.feature_store:
+        # Imported here: feature_store builds on this module
+        from feature_store import FeatureStore
+        store = FeatureStore(args.feature_store)
+        print(f"Reading stored features for up to {len(store)} tracks from {args.feature_store}")
+
+    executor = ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"))
+    in_flight = {}
+    queue = iter(todo)
+    pending, pending_segments = [], 0
+    tracks_done = segments_done = 0
+    start = last_report = last_checkpoint = time.perf_counter()
+
+    def submit_more():
+        # A bounded number of tracks in flight keeps decoded batches from piling up in memory
+        nonlocal pending_segments
+        while len(in_flight) < args.prefetch and pending_segments < args.batch_size:
+            path = next(queue, None)
+            if path is None:
+                return
+            features = stored_features(store, path, base, args) if store is not None else None
+            if features is not None:
+                pending.append((path, features))
+                pending_segments += len(features["batch"])
+                continue
+            future = executor.submit(extract_track, os.path.join(base, path), args.strategy, args.k, args.seed)
+            in_flight[future] = path
+
+    try:
+        submit_more()
+        while in_flight or pending:
+            if in_flight:
+                finished, _ = wait(in_flight, timeout=1.0, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path = in_flight.pop(future)
+                    features = future.result()
+                    if "error" in features:
+                        log.write({"path": path, "error": features["error"]})
+                        tracks_done += 1
+                    else:
+                        pending.append((path, features))
+                        pending_segments += len(features["batch"])
+
+            # Predict once a batch is full, or when nothing else is coming
+            if pending and (pending_segments >= args.batch_size or not in_flight):
+                segments_done += classify_pending(model, pending, args.batch_size, log)
+                tracks_done += len(pending)
+                pending, pending_segments = [], 0
+            submit_more()
+
+            now = time.perf_counter()
+            if now - last_checkpoint >= args.checkpoint_every:
+                log.checkpoint()
+                last_checkpoint = now
+            if now - last_report >= PROGRESS_INTERVAL_SECONDS:
+                elapsed = now - start
+                print(f"{tracks_done}/{len(todo)} tracks  {tracks_done / elapsed:.1f} tracks/s  "
+                      f"{segments_done / elapsed:.0f} segments/s  {log.errors} errors")
+                last_report = now
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        log.checkpoint()
+
+    elapsed = time.perf_counter() - start
+    print(f"Classified {tracks_done} tracks ({segments_done} segments) in {elapsed:.1f} s: "
+          f"{tracks_done / elapsed:.2f} tracks/s, {segments_done / elapsed:.0f} segments/s")
+
+
+def export_npz(results_path: str, npz_path: str):
+    """Write the successful results of a JSONL log as columns."""
+    records = []
+    with open(results_path) as f:
+        for line in f:
+            record = json.loads(line)
+            if "error" not in record:
+                records.append(record)
+    np.savez(
+        npz_path,
+        genres=np.array(main.GTZAN_GENRES),
+        paths=np.array([r["path"] for r in records]),
+        duration=np.array([r["duration"] for r in records], dtype=np.float32),
+        numSegments=np.array([r["numSegments"] for r in records], dtype=np.int32),
+        topGenre=np.array([r["topGenre"] for r in records]),
+        probabilities=np.array([r["probabilities"] for r in records], dtype=np.float32).reshape(-1, len(main.GTZAN_GENRES)),
+    )
+    print(f"Wrote {len(records)} results to {npz_path}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", nargs="?", help="Directory to scan for audio files (paths are stored relative to it)")
+    parser.add_argument("--manifest", help="File listing audio paths, one per line (relative to root if given)")
+    parser.add_argument("--output", required=True, help="JSONL results file, appended to and resumed from")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Feature extraction processes")
+    parser.add_argument("--prefetch", type=int, help="Tracks decoded ahead of inference (default: 4 per worker)")
+    parser.add_argument("--batch-size", type=int, default=256, help="Segments per model predict call")
+    parser.add_argument("--strategy", default="all", choices=main.SAMPLING_STRATEGIES, help="Segment sampling")
+    parser.add_argument("--k", type=int, default=main.DEFAULT_SAMPLE_WINDOWS, help="Windows per sampled track")
+    parser.add_argument("--seed", type=int, help="Seed for the random and energy strategies")
+    parser.add_argument("--checkpoint-every", type=float, default=10.0, help="Seconds between checkpoints")
+    parser.add_argument("--export-npz", help="Also write all results as columns to this .npz file")
+    parser.add_argument("--feature-store", help="Read model inputs from this feature store (see feature_store.py) "
+                                                "instead of decoding tracks it holds")
+    args = parser.parse_args()
+    if args.root is None and args.manifest is None:
+        parser.error("give a directory to scan or --manifest")
+    if args.feature_store and args.strategy == "energy":
+        parser.error("--strategy energy needs the audio; use all, uniform or random with --feature-store")
+    args.prefetch = args.prefetch or 4 * args.workers
+
+    tracks = read_manifest(args.manifest) if args.manifest else find_tracks(args.root)
+    meta = {
+        "model": main.model_identity(),
+        "genres": main.GTZAN_GENRES,
+        "strategy": args.strategy,
+        "k": args.k if args.strategy != "all" else None,
+        "seed": args.seed,
+    }
+    log = ResultLog(args.output, meta)
+    try:
+        run(args, tracks, log)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted; {log.tracks} tracks are saved in {args.output}. Run again to resume.")
+        sys.exit(130)
+    finally:
+        log.close()
+
+    if args.export_npz:
+        export_npz(args.output, args.export_npz)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,209 @@
+"""
+Compact binary encodings for /classify responses
+
+The visualization arrays dominate the JSON response. These encoders send
+them as typed buffers instead: float16 (default), uint8 (linearly quantized
+between each array's min and max) or float32, each with its shape. Two
+containers are offered:
+
+* ``application/x-gtzan-frames``: ``b"GTZF"``, a little-endian uint32
+  header length, a UTF-8 JSON header, zero padding to 8 bytes, then the
+  array buffers. The header holds the result with its arrays removed, plus
+  one ``{"path", "dtype", "shape", "offset", "length"[, "min", "max"]}``
+  entry per array. Offsets are relative to the start of the buffer section
+  and aligned to 8 bytes. Needs no extra dependencies.
+* ``application/x-msgpack``: the result as a MessagePack map, with each
+  array replaced by ``{"dtype", "shape", "data"[, "min", "max"]}``. Needs
+  the optional ``msgpack`` package.
+
+Buffers are little-endian and row-major. ``decode_frames`` and
+``decode_msgpack`` are the reference decoders.
+"""
+
+import json
+import struct
+from typing import Tuple
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MEDIA_TYPE = "application/json"
+FRAMES_MEDIA_TYPE = "application/x-gtzan-frames"
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+FRAMES_MAGIC = b"GTZF"
+QUANTIZATIONS = ("float16", "uint8", "float32")
+
+_ALIASES = {
+    "*/*": JSON_MEDIA_TYPE,
+    "application/*": JSON_MEDIA_TYPE,
+    JSON_MEDIA_TYPE: JSON_MEDIA_TYPE,
+    FRAMES_MEDIA_TYPE: FRAMES_MEDIA_TYPE,
+    MSGPACK_MEDIA_TYPE: MSGPACK_MEDIA_TYPE,
+    "application/msgpack": MSGPACK_MEDIA_TYPE,
+    "application/vnd.msgpack": MSGPACK_MEDIA_TYPE,
+}
+
+
+def negotiate(accept: str) -> str:
+    """Pick the response media type for an Accept header.
+
+    The highest-q supported type wins (earlier entries win ties); anything
+    unsupported, including msgpack without the package, falls back to JSON.
+    """
+    best, best_q = JSON_MEDIA_TYPE, 0.0
+    for part in (accept or "").split(","):
+        fields = part.split(";")
+        media_type = _ALIASES.get(fields[0].strip().lower())
+        if media_type is None or (media_type == MSGPACK_MEDIA_TYPE and msgpack is None):
+            continue
+        q = 1.0
+        for param in fields[1:]:
+            name, _, value = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > best_q:
+            best, best_q = media_type, q
+    return best
+
+
+def quantize_array(array: np.ndarray, quantize: str) -> Tuple[bytes, dict]:
+    """Return the buffer and metadata for one array."""
+    array = np.asarray(array, dtype=np.float32)
+    meta = {"dtype": quantize, "shape": list(array.shape)}
+    if quantize == "uint8":
+        low = float(array.min()) if array.size else 0.0
+        high = float(array.max()) if array.size else 0.0
+        scale = (high - low) / 255 if high > low else 1.0
+        data = np.round((array - low) / scale).astype(np.uint8)
+        meta.update({"min": low, "max": high})
+    elif quantize == "float16":
+        data = array.astype("<f2")
+    elif quantize == "float32":
+        data = array.astype("<f4")
+    else:
+        raise ValueError(f"Unknown quantization: {quantize!r} (expected one of {', '.join(QUANTIZATIONS)})")
+    return data.tobytes(), meta
+
+
+def dequantize_array(data: bytes, meta: dict) -> np.ndarray:
+    """Inverse of quantize_array (up to quantization error), as float32."""
+    if meta["dtype"] == "uint8":
+        q = np.frombuffer(data, dtype=np.uint8).astype(np.float32)
+        scale = (meta["max"] - meta["min"]) / 255 if meta["max"] > meta["min"] else 0.0
+        array = meta["min"] + q * scale
+    else:
+        array = np.frombuffer(data, dtype="<f2" if meta["dtype"] == "float16" else "<f4").astype(np.float32)
+    return array.reshape(meta["shape"])
+
+
+def _split_arrays(value, path: tuple, arrays: list):
+    """Copy ``value`` with every ndarray removed, collecting ``(path, array)`` pairs."""
+    if isinstance(value, np.ndarray):
+        arrays.append((path, value))
+        return None
+    if isinstance(value, dict):
+        out = {}
+        for key, item in value.items():
+            if isinstance(item, np.ndarray):
+                arrays.append((path + (key,), item))
+            else:
+                out[key] = _split_arrays(item, path + (key,), arrays)
+        return out
+    if isinstance(value, (list, tuple)):
+        return [_split_arrays(item, path + (i,), arrays) for i, item in enumerate(value)]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _insert(result: dict, path: list, value):
+    target = result
+    for key in path[:-1]:
+        target = target[key]
+    target[path[-1]] = value
+
+
+def encode_frames(result: dict, quantize: str = "float16") -> bytes:
+    arrays = []
+    header = {"version": 1, "result": _split_arrays(result, (), arrays), "arrays": []}
+    buffers = []
+    offset = 0
+    for path, array in arrays:
+        data, meta = quantize_array(array, quantize)
+        meta.update({"path": list(path), "offset": offset, "length": len(data)})
+        header["arrays"].append(meta)
+        padding = -len(data) % 8
+        buffers.append(data + b"\0" * padding)
+        offset += len(data) + padding
+
+    header_bytes = json.dumps(header, separators=(",", ":")).encode()
+    prefix_length = len(FRAMES_MAGIC) + 4 + len(header_bytes)
+    return b"".join([
+        FRAMES_MAGIC,
+        struct.pack("<I", len(header_bytes)),
+        header_bytes,
+        b"\0" * (-prefix_length % 8),
+        *buffers,
+    ])
+
+
+def decode_frames(data: bytes) -> dict:
+    if data[:4] != FRAMES_MAGIC:
+        raise ValueError("Not a GTZF frame")
+    (header_length,) = struct.unpack_from("<I", data, 4)
+    header = json.loads(data[8:8 + header_length])
+    base = 8 + header_length
+    base += -base % 8
+    result = header["result"]
+    for meta in header["arrays"]:
+        start = base + meta["offset"]
+        _insert(result, meta["path"], dequantize_array(data[start:start + meta["length"]], meta))
+    return result
+
+
+def encode_msgpack(result: dict, quantize: str = "float16") -> bytes:
+    if msgpack is None:
+        raise RuntimeError("msgpack is not installed")
+
+    def pack(value):
+        if isinstance(value, np.ndarray):
+            data, meta = quantize_array(value, quantize)
+            meta["data"] = data
+            return meta
+        if isinstance(value, np.generic):
+            return value.item()
+        raise TypeError(f"Cannot encode {type(value).__name__}")
+
+    return msgpack.packb(result, default=pack, use_bin_type=True)
+
+
+def decode_msgpack(data: bytes) -> dict:
+    if msgpack is None:
+        raise RuntimeError("msgpack is not installed")
+
+    def unpack(value):
+        if isinstance(value, dict) and "data" in value and "shape" in value and "dtype" in value:
+            return dequantize_array(value["data"], value)
+        if isinstance(value, dict):
+            return {key: unpack(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [unpack(item) for item in value]
+        return value
+
+    return unpack(msgpack.unpackb(data, raw=False))
+
+
+def encode(result: dict, media_type: str, quantize: str = "float16") -> bytes:
+    """Encode ``result`` as FRAMES_MEDIA_TYPE or MSGPACK_MEDIA_TYPE."""
+    if media_type == FRAMES_MEDIA_TYPE:
+        return encode_frames(result, quantize)
+    if media_type == MSGPACK_MEDIA_TYPE:
+        return encode_msgpack(result, quantize)
+    raise ValueError(f"No binary encoder for {media_type!r}")
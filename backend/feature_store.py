@@ -0,0 +1,366 @@
+"""
+Persisted per-track features in memory-mapped arrays
+
+Decoding is the expensive part of classifying a library. This store keeps
+what decoding produces, so a new model or a new mood mapping can run again
+without touching the audio:
+
+* ``mels.f16``: the model-ready log-mel segments of every track, back to
+  back, as one ``(segments, N_MELS, EXPECTED_TIME_FRAMES)`` float16 array.
+* ``summary.f32``: one ``(tracks, len(SUMMARY_COLUMNS))`` float32 row per
+  track (tempo, mean spectral centroid/rolloff/RMS, chroma and MFCC means).
+* ``index.jsonl``: one line per track with its path, size and mtime, its
+  first segment and segment count in ``mels.f16``, and its summary row.
+* ``store.json``: the layout and the front-end parameters the mels were
+  computed with. A store built with different parameters is refused.
+
+Both array files are opened with ``np.memmap``, so reads are zero-copy
+views that the OS pages in on demand. Writes are append-only. The index is
+written only after the array data it points to is on disk. Opening a
+store skips a torn last index line, and opening it for writing truncates
+that line and any unindexed array tail. A track that is stored
+again (because its file changed) gets new rows, and the index points at
+the latest ones.
+
+Usage:
+    python backend/feature_store.py build /music --store features/
+    python backend/feature_store.py build --manifest tracks.txt --store features/ --workers 16
+    python backend/feature_store.py info --store features/
+    python backend/classify_library.py /music --output tags.jsonl --feature-store features/
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+import main
+from classify_library import file_signature, find_tracks, read_manifest
+
+STORE_VERSION = 1
+MEL_SHAPE = (main.N_MELS, main.EXPECTED_TIME_FRAMES)
+MEL_DTYPE = np.float16
+SUMMARY_DTYPE = np.float32
+N_CHROMA = 12
+N_MFCC = 13
+SUMMARY_COLUMNS = (
+    ("tempo", "spectralCentroidMean", "spectralRolloffMean", "rmsMean")
+    + tuple(f"chroma{i}" for i in range(N_CHROMA))
+    + tuple(f"mfcc{i}" for i in range(N_MFCC))
+)
+FLUSH_INTERVAL_SECONDS = 10.0
+
+
+def frontend_params() -> dict:
+    """Parameters that determine the stored mels; a mismatch means they must be rebuilt."""
+    return {
+        "sampleRate": main.SAMPLE_RATE,
+        "nMels": main.N_MELS,
+        "nFft": main.N_FFT,
+        "hopLength": main.HOP_LENGTH,
+        "segmentDuration": main.SEGMENT_DURATION,
+        "timeFrames": main.EXPECTED_TIME_FRAMES,
+        "topDb": main.TOP_DB,
+    }
+
+
+def summarize(visualization: dict) -> np.ndarray:
+    """Reduce an extract_visualization_data bundle to one SUMMARY_COLUMNS row."""
+    return np.concatenate([
+        [
+            float(visualization["tempo"]),
+            np.mean(visualization["spectralCentroid"]),
+            np.mean(visualization["spectralRolloff"]),
+            np.mean(visualization["rms"]),
+        ],
+        np.mean(visualization["chromagram"], axis=1),
+        np.mean(visualization["mfcc"], axis=1),
+    ]).astype(SUMMARY_DTYPE)
+
+
+def extract_track(path: str) -> dict:
+    """Worker job: stored features for one track, or an error message."""
+    try:
+        features = main.extract_features(path)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    if features["numSegments"] == 0:
+        return {"error": "Audio file too short. Minimum duration is ~1.5 seconds."}
+    return {
+        "duration": features["duration"],
+        "mel": features["batch"][..., 0].astype(MEL_DTYPE),
+        "summary": summarize(features["visualization"]),
+    }
+
+
+class FeatureStore:
+    """Index plus memory-mapped mel and summary arrays in ``directory``.
+
+    ``mode`` is "r" (read-only) or "a" (read and append; creates the store).
+    """
+
+    def __init__(self, directory: str, mode: str = "r"):
+        self.directory = directory
+        self.mode = mode
+        self.mels_path = os.path.join(directory, "mels.f16")
+        self.summary_path = os.path.join(directory, "summary.f32")
+        self.index_path = os.path.join(directory, "index.jsonl")
+        self.meta_path = os.path.join(directory, "store.json")
+        self.meta = {
+            "version": STORE_VERSION,
+            "melShape": list(MEL_SHAPE),
+            "melDtype": np.dtype(MEL_DTYPE).name,
+            "summaryColumns": list(SUMMARY_COLUMNS),
+            "frontend": frontend_params(),
+        }
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                stored = json.load(f)
+            if stored != self.meta:
+                raise ValueError(
+                    f"{directory} was built with a different layout or front-end "
+                    f"({stored.get('frontend')}); rebuild it into a new directory"
+                )
+        elif mode == "a":
+            os.makedirs(directory, exist_ok=True)
+            with open(self.meta_path, "w") as f:
+                json.dump(self.meta, f, indent=2)
+        else:
+            raise FileNotFoundError(f"No feature store in {directory}")
+
+        self.records = {}
+        self.segments = 0
+        self.rows = 0
+        if os.path.exists(self.index_path):
+            self._read_index()
+        self._mels = None
+        self._summaries = None
+        self._pending_index = []
+        if mode == "a":
+            # Drop array data written after the last index flush
+            for path, size in ((self.mels_path, self.segments * self._mel_bytes()),
+                               (self.summary_path, self.rows * self._summary_bytes())):
+                with open(path, "ab") as f:
+                    if f.tell() > size:
+                        f.truncate(size)
+            self._mel_file = open(self.mels_path, "ab")
+            self._summary_file = open(self.summary_path, "ab")
+
+    def _read_index(self):
+        """Load index records up to the first torn line, dropping the rest from the file in append mode."""
+        with open(self.index_path, "rb") as f:
+            data = f.read()
+        offset = 0
+        while offset < len(data):
+            end = data.find(b"\n", offset)
+            if end < 0:
+                break
+            try:
+                record = json.loads(data[offset:end])
+            except ValueError:
+                break
+            self.records[record["path"]] = record
+            self.segments = max(self.segments, record["offset"] + record["count"])
+            self.rows = max(self.rows, record["row"] + 1)
+            offset = end + 1
+        if offset < len(data):
+            # A crash mid-flush; the array tails it pointed at are dropped with it
+            print(f"Discarding {len(data) - offset} bytes of {self.index_path} after the last complete record")
+            if self.mode == "a":
+                with open(self.index_path, "r+b") as f:
+                    f.truncate(offset)
+
+    @staticmethod
+    def _mel_bytes() -> int:
+        return int(np.prod(MEL_SHAPE)) * np.dtype(MEL_DTYPE).itemsize
+
+    @staticmethod
+    def _summary_bytes() -> int:
+        return len(SUMMARY_COLUMNS) * np.dtype(SUMMARY_DTYPE).itemsize
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.records
+
+    def is_current(self, path: str, signature: dict) -> bool:
+        """True if ``path`` is stored and its file has not changed since."""
+        record = self.records.get(path)
+        return record is not None and record["size"] == signature["size"] and record["mtimeNs"] == signature["mtimeNs"]
+
+    @property
+    def mels(self) -> np.ndarray:
+        """All stored segments, ``(segments, *MEL_SHAPE)`` float16, memory-mapped read-only."""
+        self.flush()
+        if self._mels is None or len(self._mels) != self.segments:
+            self._mels = self._map(self.mels_path, MEL_DTYPE, (self.segments, *MEL_SHAPE))
+        return self._mels
+
+    @property
+    def summaries(self) -> np.ndarray:
+        """All summary rows, ``(rows, len(SUMMARY_COLUMNS))`` float32, memory-mapped read-only."""
+        self.flush()
+        if self._summaries is None or len(self._summaries) != self.rows:
+            self._summaries = self._map(self.summary_path, SUMMARY_DTYPE, (self.rows, len(SUMMARY_COLUMNS)))
+        return self._summaries
+
+    @staticmethod
+    def _map(path: str, dtype, shape: tuple) -> np.ndarray:
+        if shape[0] == 0:
+            # np.memmap cannot map an empty file
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+    def mel(self, path: str) -> np.ndarray:
+        """The stored segments of one track: a zero-copy float16 view."""
+        record = self.records[path]
+        return self.mels[record["offset"]:record["offset"] + record["count"]]
+
+    def summary(self, path: str) -> np.ndarray:
+        return self.summaries[self.records[path]["row"]]
+
+    def model_batch(self, path: str) -> np.ndarray:
+        """One track's segments as a float32 ``(n, N_MELS, EXPECTED_TIME_FRAMES, 1)`` model batch."""
+        return self.mel(path).astype(np.float32)[..., np.newaxis]
+
+    def current_summaries(self) -> tuple:
+        """``(paths, rows)`` for the latest version of every track, in index order."""
+        paths = list(self.records)
+        rows = np.array([self.records[path]["row"] for path in paths], dtype=np.int64)
+        return paths, self.summaries[rows]
+
+    def add(self, path: str, mel: np.ndarray, summary: np.ndarray, duration: float, signature: dict):
+        """Append one track. It becomes visible once flush() has run."""
+        mel = np.ascontiguousarray(mel, dtype=MEL_DTYPE)
+        if mel.shape[1:] != MEL_SHAPE:
+            raise ValueError(f"Expected mel segments of shape (n, {MEL_SHAPE[0]}, {MEL_SHAPE[1]}), got {mel.shape}")
+        self._mel_file.write(mel.tobytes())
+        self._summary_file.write(np.ascontiguousarray(summary, dtype=SUMMARY_DTYPE).tobytes())
+        self._pending_index.append({
+            "path": path,
+            "offset": self.segments,
+            "count": len(mel),
+            "row": self.rows,
+            "duration": duration,
+            **signature,
+        })
+        self.segments += len(mel)
+        self.rows += 1
+
+    def flush(self):
+        """Make appended arrays durable, then index them."""
+        if not self._pending_index:
+            return
+        for f in (self._mel_file, self._summary_file):
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.index_path, "a") as f:
+            for record in self._pending_index:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+                self.records[record["path"]] = record
+            f.flush()
+            os.fsync(f.fileno())
+        self._pending_index = []
+
+    def close(self):
+        if self.mode == "a":
+            self.flush()
+            self._mel_file.close()
+            self._summary_file.close()
+
+    def stats(self) -> dict:
+        return {
+            "tracks": len(self.records),
+            "segments": self.segments,
+            "rows": self.rows,
+            "melBytes": self.segments * self._mel_bytes(),
+            "summaryBytes": self.rows * self._summary_bytes(),
+        }
+
+
+def build(args):
+    tracks = read_manifest(args.manifest) if args.manifest else find_tracks(args.root)
+    base = args.root or ""
+    store = FeatureStore(args.store, mode="a")
+    signatures = {}
+    for path in tracks:
+        try:
+            signatures[path] = file_signature(os.path.join(base, path))
+        except OSError as e:
+            print(f"Skipping {path}: {e}")
+    todo = [path for path, signature in signatures.items() if not store.is_current(path, signature)]
+    print(f"{len(tracks)} tracks, {len(signatures) - len(todo)} already stored, {len(todo)} to extract "
+          f"with {args.workers} workers")
+
+    executor = ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"))
+    in_flight = {}
+    queue = iter(todo)
+    done = errors = 0
+    start = last_flush = time.perf_counter()
+    try:
+        while True:
+            while len(in_flight) < args.prefetch:
+                path = next(queue, None)
+                if path is None:
+                    break
+                in_flight[executor.submit(extract_track, os.path.join(base, path))] = path
+            if not in_flight:
+                break
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                path = in_flight.pop(future)
+                features = future.result()
+                done += 1
+                if "error" in features:
+                    errors += 1
+                    print(f"Skipping {path}: {features['error']}")
+                    continue
+                store.add(path, features["mel"], features["summary"], features["duration"], signatures[path])
+            if time.perf_counter() - last_flush >= FLUSH_INTERVAL_SECONDS:
+                store.flush()
+                last_flush = time.perf_counter()
+                elapsed = last_flush - start
+                print(f"{done}/{len(todo)} tracks  {done / elapsed:.1f} tracks/s  {errors} errors")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        store.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Extracted {done - errors} tracks ({errors} errors) in {elapsed:.1f} s")
+    print(json.dumps(store.stats()))
+
+
+def info(args):
+    store = FeatureStore(args.store)
+    print(json.dumps({**store.stats(), "frontend": store.meta["frontend"]}, indent=2))
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="Decode tracks and append their features")
+    build_parser.add_argument("root", nargs="?", help="Directory to scan for audio files (paths are stored relative to it)")
+    build_parser.add_argument("--manifest", help="File listing audio paths, one per line (relative to root if given)")
+    build_parser.add_argument("--store", required=True, help="Feature store directory")
+    build_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Feature extraction processes")
+    build_parser.add_argument("--prefetch", type=int, help="Tracks extracted ahead of writing (default: 4 per worker)")
+    info_parser = commands.add_parser("info", help="Print store statistics")
+    info_parser.add_argument("--store", required=True, help="Feature store directory")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        if args.root is None and args.manifest is None:
+            parser.error("give a directory to scan or --manifest")
+        args.prefetch = args.prefetch or 4 * args.workers
+        build(args)
+    else:
+        info(args)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,79 @@
+"""
+TFLite inference backend
+
+Wraps a ``.tflite`` export of the CRNN (see convert_model.py) behind the
+subset of the Keras model API the server uses: ``predict``, ``input_shape``
+and ``output_shape``. Uses the standalone ``tflite_runtime`` package when it
+is installed, so workers need not load TensorFlow, and falls back to
+``tf.lite`` otherwise.
+"""
+
+from typing import Optional
+
+import numpy as np
+
+try:
+    from tflite_runtime.interpreter import Interpreter
+except ImportError:
+    Interpreter = None
+
+
+def _interpreter_class():
+    if Interpreter is not None:
+        return Interpreter
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+
+class TFLiteModel:
+    """A TFLite interpreter with a Keras-like ``predict``.
+
+    Not thread-safe: the server only calls it from the single inference thread.
+    """
+
+    def __init__(self, model_path: str, num_threads: Optional[int] = None):
+        self.model_path = model_path
+        self.interpreter = _interpreter_class()(model_path=model_path, num_threads=num_threads)
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch = None
+        self.input_shape = (None,) + tuple(int(d) for d in self._input["shape"][1:])
+        self.output_shape = (None,) + tuple(int(d) for d in self._output["shape"][1:])
+
+    def _resize(self, batch: int):
+        if batch != self._batch:
+            self.interpreter.resize_tensor_input(self._input["index"], [batch, *self.input_shape[1:]])
+            self.interpreter.allocate_tensors()
+            # Details (including quantization params) are only final after allocation
+            self._input = self.interpreter.get_input_details()[0]
+            self._output = self.interpreter.get_output_details()[0]
+            self._batch = batch
+
+    def _invoke(self, batch: np.ndarray, max_batch: int) -> np.ndarray:
+        # Pad to a power-of-two bucket so varying micro-batch sizes reuse a few allocations
+        count = len(batch)
+        bucket = min(max_batch, 1 << (count - 1).bit_length())
+        if bucket > count:
+            batch = np.concatenate([batch, np.zeros((bucket - count, *batch.shape[1:]), dtype=batch.dtype)])
+        self._resize(bucket)
+        if self._input["dtype"] != np.float32:
+            # Integer-only exports take quantized inputs
+            scale, zero_point = self._input["quantization"]
+            batch = np.round(batch / scale + zero_point)
+            info = np.iinfo(self._input["dtype"])
+            batch = np.clip(batch, info.min, info.max)
+        self.interpreter.set_tensor(self._input["index"], np.ascontiguousarray(batch, dtype=self._input["dtype"]))
+        self.interpreter.invoke()
+        output = self.interpreter.get_tensor(self._output["index"])
+        if self._output["dtype"] != np.float32:
+            scale, zero_point = self._output["quantization"]
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output[:count]
+
+    def predict(self, batch: np.ndarray, batch_size: int = 64, verbose: int = 0) -> np.ndarray:
+        """Per-segment probabilities for ``batch``, run ``batch_size`` segments per invoke."""
+        batch = np.asarray(batch, dtype=np.float32)
+        outputs = [
+            self._invoke(batch[start:start + batch_size], batch_size) for start in range(0, len(batch), batch_size)
+        ]
+        return outputs[0] if len(outputs) == 1 else np.concatenate(outputs, axis=0)
@@ -6,26 +6,118 @@ This server loads the Keras model directly and exposes an API for audio classifi
 
 import os
 import io
+import json
+import time
+import random
+import tempfile
+import tarfile
+import zipfile
+import asyncio
+import functools
+import threading
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 import numpy as np
 import librosa
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import scipy.fft
+import soundfile as sf
+import soxr
+from fastapi import FastAPI, UploadFile, File, Header, HTTPException, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 
-# Suppress TF warnings
+# Suppress TF warnings; TensorFlow itself is imported lazily by load_model()
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 
-import keras
+import encoding
+import playlist
+import vector_index
+from analysis_store import AnalysisStore
+from batching import InferenceScheduler, SegmentStacker
+from cache import ResultCache, new_key_hasher
+from lite_model import TFLiteModel
+from metrics import Registry
+from model_server import RemoteInference
 
 # Configuration
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "model", "crnn_gtzan_model_best.h5")
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "keras")  # "keras" or "tflite"
+TFLITE_MODEL_PATH = os.environ.get(
+    "TFLITE_MODEL_PATH", os.path.join(os.path.dirname(__file__), "..", "model", "crnn_gtzan_model_best.tflite")
+)
+TFLITE_THREADS = int(os.environ.get("TFLITE_THREADS", "0"))  # 0 lets the runtime decide
 SAMPLE_RATE = 22050
 N_MELS = 128
 N_FFT = 2048
 HOP_LENGTH = 512
 SEGMENT_DURATION = 3  # seconds
 EXPECTED_TIME_FRAMES = 130
+FRONTEND_CHUNK_SEGMENTS = 4  # segments framed per STFT call in the batched front-end
+TOP_DB = 80.0
+VIZ_N_MELS = 64
+VIZ_CHUNK_FRAMES = 1024  # frames per rFFT call in the visualization onset pass
+VIZ_MAX_FRAMES = 200
+VIZ_FEATURE_SAMPLES = 100
+VIZ_WAVEFORM_SAMPLES = 1000
+TEMPO_CHUNK_FRAMES = 2048  # onset frames per tempogram chunk
+VIZ_FEATURES = ("melSpectrogram", "waveform", "spectralCentroid", "spectralRolloff", "rms",
+                "tempo", "beats", "chromagram", "mfcc", "timeAxis")
+VIZ_FULL_PASS_FEATURES = {"melSpectrogram", "tempo", "beats", "mfcc"}  # need every frame, not just the kept ones
+
+# Uploads and streaming decode
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(512 * 1024 * 1024)))
+UPLOAD_SPOOL_BYTES = int(os.environ.get("UPLOAD_SPOOL_BYTES", str(8 * 1024 * 1024)))  # kept in memory below this
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+DECODE_BLOCK_FRAMES = 65536  # input frames decoded per block
+
+# Batch classification (/classify/batch)
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", "256"))
+BATCH_MAX_IN_FLIGHT = int(os.environ.get("BATCH_MAX_IN_FLIGHT", "32"))  # files decoded or awaiting inference at once
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".ogg", ".flac")
+
+# Segment sampling
+SAMPLING_STRATEGIES = ("all", "uniform", "energy", "random")
+DEFAULT_SAMPLE_WINDOWS = 8
+WINDOW_MARGIN_SECONDS = 0.1  # extra audio read around each window to settle the resampler
+MAX_TIME_WINDOWS = int(os.environ.get("MAX_TIME_WINDOWS", "16"))  # offset:duration ranges per /classify call
+
+# Progressive classification (/classify/stream)
+PROGRESSIVE_BATCH_SEGMENTS = int(os.environ.get("PROGRESSIVE_BATCH_SEGMENTS", "8"))
+PROGRESSIVE_MIN_SEGMENTS = int(os.environ.get("PROGRESSIVE_MIN_SEGMENTS", "4"))
+
+# Concurrency
+CLASSIFY_EXECUTOR = os.environ.get("CLASSIFY_EXECUTOR", "thread")  # "thread" or "process"
+CLASSIFY_WORKERS = int(os.environ.get("CLASSIFY_WORKERS", str(os.cpu_count() or 1)))
+CLASSIFY_MAX_PENDING = int(os.environ.get("CLASSIFY_MAX_PENDING", str(4 * CLASSIFY_WORKERS)))
+RETRY_AFTER_SECONDS = int(os.environ.get("RETRY_AFTER_SECONDS", "2"))
+INFERENCE_MAX_BATCH_SIZE = int(os.environ.get("INFERENCE_MAX_BATCH_SIZE", "64"))
+INFERENCE_MAX_WAIT_MS = float(os.environ.get("INFERENCE_MAX_WAIT_MS", "5"))
+MODEL_SERVER_SLOTS = int(os.environ.get("MODEL_SERVER_SLOTS", "4"))  # shared-memory batches per serve.py worker
+
+# Result cache
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+CACHE_DIR = os.environ.get("CACHE_DIR", "")  # empty disables the on-disk tier
+
+# Decoded audio kept for /visualize
+ANALYSIS_TTL_SECONDS = float(os.environ.get("ANALYSIS_TTL_SECONDS", "300"))
+ANALYSIS_STORE_MAX_BYTES = int(os.environ.get("ANALYSIS_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+ANALYSIS_RETAIN_MAX_BYTES = int(os.environ.get("ANALYSIS_RETAIN_MAX_BYTES", str(4 * 1024 * 1024)))  # larger signals are re-decoded
+ANALYSIS_PURGE_INTERVAL_SECONDS = 30
+INCLUDE_OPTIONS = ("visualization", "embedding")  # optional /classify response parts
+
+# Embeddings and /similar
+EMBEDDING_LAYER = os.environ.get("EMBEDDING_LAYER", "")  # empty: the input of the final (softmax) layer
+SIMILARITY_INDEX_DIR = os.environ.get("SIMILARITY_INDEX_DIR", "")  # empty disables /similar
+SIMILARITY_MAX_K = 100
+
+# /playlist
+PLAYLIST_CATALOG = os.environ.get("PLAYLIST_CATALOG", "")  # JSON or .npz song catalog; empty disables /playlist
+PLAYLIST_MAX_LENGTH = 100
+
+# Metrics
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
 
 # GTZAN genres
 GTZAN_GENRES = ["blues", "classical", "country", "disco", "hiphop", "jazz", "metal", "pop", "reggae", "rock"]
@@ -44,6 +136,27 @@ app.add_middleware(
 
 # Global model variable
 model = None
+model_lock = threading.Lock()
+embedding_model = None  # the model with its penultimate layer as an extra output
+embedding_checked = False
+similarity_index = None  # loaded on startup when SIMILARITY_INDEX_DIR is set
+playlist_catalog = None  # loaded on startup when PLAYLIST_CATALOG is set
+
+# Startup progress reported by /health; "ready" once the model is loaded and warmed up
+readiness = {"state": "starting", "model": "pending", "features": "pending", "error": None, "warmupMs": None}
+warmup_task = None
+purge_task = None
+
+# Worker pools, created on startup
+model_connection = None  # set by serve.py in its HTTP workers: the model then lives in the model process
+feature_executor = None
+inference_executor = None
+inference_scheduler = None
+
+# Precomputed front-end constants (shared by every request)
+MEL_BASIS = librosa.filters.mel(sr=SAMPLE_RATE, n_fft=N_FFT, n_mels=N_MELS).astype(np.float32)
+VIZ_MEL_BASIS = librosa.filters.mel(sr=SAMPLE_RATE, n_fft=N_FFT, n_mels=VIZ_N_MELS).astype(np.float32)
+STFT_WINDOW = librosa.filters.get_window("hann", N_FFT, fftbins=True).astype(np.float32)
 
 
 class GenrePrediction(BaseModel):
@@ -52,39 +165,196 @@ class GenrePrediction(BaseModel):
 
 
 class VisualizationData(BaseModel):
-    melSpectrogram: List[List[float]]  # 2D array for heatmap
-    waveform: List[float]  # 1D array for waveform
-    spectralCentroid: List[float]  # Brightness over time
-    spectralRolloff: List[float]  # Frequency rolloff over time
-    rms: List[float]  # Energy over time
-    tempo: float
-    beats: List[float]  # Beat positions in seconds
-    chromagram: List[List[float]]  # Pitch class distribution
-    mfcc: List[List[float]]  # MFCCs for timbre
-    timeAxis: List[float]  # Time axis for plots
+    # Every field is present unless /visualize was asked for a subset
+    melSpectrogram: Optional[List[List[float]]] = None  # 2D array for heatmap
+    waveform: Optional[List[float]] = None  # 1D array for waveform
+    spectralCentroid: Optional[List[float]] = None  # Brightness over time
+    spectralRolloff: Optional[List[float]] = None  # Frequency rolloff over time
+    rms: Optional[List[float]] = None  # Energy over time
+    tempo: Optional[float] = None
+    beats: Optional[List[float]] = None  # Beat positions in seconds
+    chromagram: Optional[List[List[float]]] = None  # Pitch class distribution
+    mfcc: Optional[List[List[float]]] = None  # MFCCs for timbre
+    timeAxis: Optional[List[float]] = None  # Time axis for plots
+    windows: Optional[List[List[float]]] = None  # Sampled/windowed runs: [start, end] track seconds of each stretch, joined back to back on timeAxis
+
+
+class WindowPrediction(BaseModel):
+    start: float  # seconds
+    end: float
+    numSegments: int
+    predictions: List[GenrePrediction]
+    topGenre: str
+    topConfidence: float
 
 
 class ClassificationResult(BaseModel):
     predictions: List[GenrePrediction]
     topGenre: str
     topConfidence: float
-    processingTime: float
+    processingTime: float  # of the run that computed the result; cache hits (X-Cache) replay it
     audioInfo: dict
+    windows: Optional[List[WindowPrediction]] = None  # only with windows=offset:duration,...
+    visualization: Optional[VisualizationData] = None  # only with include=visualization
+    analysisId: Optional[str] = None  # pass to /visualize when visualization was not included
+    embedding: Optional[List[float]] = None  # only with include=embedding
+
+
+class BatchItem(BaseModel):
+    filename: str
+    status: int  # what /classify would have answered for this file
+    cache: Optional[str] = None  # as the X-Cache header of /classify
+    result: Optional[ClassificationResult] = None
+    error: Optional[str] = None
+
+
+class BatchClassificationResult(BaseModel):
+    results: List[BatchItem]  # in upload (or archive) order
+    failed: int
+    processingTime: float
+
+
+class VisualizationResult(BaseModel):
+    analysisId: str
     visualization: VisualizationData
 
 
+class SimilarTrack(BaseModel):
+    track: str
+    score: float  # cosine similarity
+
+
+class SimilarResult(BaseModel):
+    query: Optional[str] = None  # catalog id, for GET /similar
+    results: List[SimilarTrack]
+    searchMs: float
+    index: dict
+
+
+class PlaylistPreferences(BaseModel):
+    preferredGenres: List[str] = []
+    favoriteArtists: List[str] = []
+    preferredLanguages: List[str] = []
+    likedSongIds: List[str] = []
+
+
+class PlaylistRequest(BaseModel):
+    currentMood: str
+    targetMood: str
+    preferences: PlaylistPreferences = PlaylistPreferences()
+    playlistLength: int = 8
+
+
+class PlaylistSong(BaseModel):
+    id: str
+    title: str
+    artist: str
+    genre: str
+    language: str
+    valence: float
+    energy: float
+    tempo: float
+    crnnConfidence: Optional[float] = None
+    moodScore: float
+    genreMatch: bool
+    artistMatch: bool
+    languageMatch: bool
+    explanation: str
+    targetValence: float
+    targetArousal: float
+
+
+class PlaylistMetrics(BaseModel):
+    smoothnessScore: int
+    preferenceMatchPercentage: Optional[int] = None  # None for an empty playlist
+    avgMoodDistance: Optional[float] = None
+
+
+class MoodPathPoint(BaseModel):
+    valence: float
+    arousal: float
+    step: int
+
+
+class PlaylistResult(BaseModel):
+    songs: List[PlaylistSong]
+    metrics: PlaylistMetrics
+    moodPath: List[MoodPathPoint]
+
+
+def model_path() -> str:
+    """Path of the model artifact for the configured INFERENCE_BACKEND."""
+    if INFERENCE_BACKEND == "tflite":
+        return TFLITE_MODEL_PATH
+    if INFERENCE_BACKEND == "keras":
+        return MODEL_PATH
+    raise ValueError(f"Unknown INFERENCE_BACKEND: {INFERENCE_BACKEND!r} (expected 'keras' or 'tflite')")
+
+
 def load_model():
-    """Load the Keras model."""
+    """Load the model for the configured INFERENCE_BACKEND.
+
+    Keras (and with it TensorFlow) is imported here rather than at module
+    import, so startup and feature-extraction worker processes stay light.
+    """
     global model
     if model is None:
-        print(f"Loading model from {MODEL_PATH}...")
-        if not os.path.exists(MODEL_PATH):
-            raise FileNotFoundError(f"Model not found at {MODEL_PATH}")
-        model = keras.models.load_model(MODEL_PATH)
-        print(f"Model loaded. Input shape: {model.input_shape}, Output shape: {model.output_shape}")
+        with model_lock:
+            if model is None:
+                path = model_path()
+                print(f"Loading {INFERENCE_BACKEND} model from {path}...")
+                if not os.path.exists(path):
+                    raise FileNotFoundError(f"Model not found at {path}")
+                if INFERENCE_BACKEND == "tflite":
+                    model = TFLiteModel(path, num_threads=TFLITE_THREADS or None)
+                else:
+                    import keras
+                    model = keras.models.load_model(path)
+                print(f"Model loaded. Input shape: {model.input_shape}, Output shape: {model.output_shape}")
     return model
 
 
+def load_embedding_model():
+    """The loaded model with its embedding layer as an extra output, or None.
+
+    Built once from the Keras model, with two outputs: the EMBEDDING_LAYER
+    output (by default the input of the final softmax layer, i.e. the
+    BiLSTM/attention features) and the probabilities, so one forward pass
+    yields both. The TFLite backend and models without a layer graph have
+    no embedding.
+    """
+    global embedding_model, embedding_checked
+    base = load_model()
+    if not embedding_checked:
+        with model_lock:
+            if not embedding_checked:
+                embedding_model = _build_embedding_model(base)
+                embedding_checked = True
+    return embedding_model
+
+
+def _build_embedding_model(base):
+    if INFERENCE_BACKEND != "keras" or not hasattr(base, "layers"):
+        return None
+    import keras
+    try:
+        layer_output = base.get_layer(EMBEDDING_LAYER).output if EMBEDDING_LAYER else base.layers[-1].input
+        return keras.Model(inputs=base.inputs, outputs=[layer_output, base.outputs[0]])
+    except Exception as e:
+        print(f"Warning: Embeddings unavailable: {e}")
+        return None
+
+
+def model_identity() -> str:
+    """Identify the model file so cached results are invalidated when it changes."""
+    path = os.path.abspath(model_path())
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return path
+    return f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
 def extract_mel_spectrogram(audio: np.ndarray, sr: int = SAMPLE_RATE) -> np.ndarray:
     """Extract mel spectrogram from audio signal."""
     mel_spec = librosa.feature.melspectrogram(
@@ -108,44 +378,118 @@ def pad_or_truncate(mel_spec: np.ndarray, target_frames: int = EXPECTED_TIME_FRA
     elif current_frames > target_frames:
         return mel_spec[:, :target_frames]
     else:
-        # Pad with minimum value
-        padding = np.full((mel_spec.shape[0], target_frames - current_frames), mel_spec.min())
-        return np.concatenate([mel_spec, padding], axis=1)
+        # Pad with minimum value, in one allocation of the input's dtype
+        padded = np.empty((mel_spec.shape[0], target_frames), dtype=mel_spec.dtype)
+        padded[:, :current_frames] = mel_spec
+        padded[:, current_frames:] = mel_spec.min()
+        return padded
 
 
-def process_audio_file(audio_bytes: bytes) -> tuple:
-    """Process audio file and return segments for classification."""
-    # Load audio from bytes
-    audio, sr = librosa.load(io.BytesIO(audio_bytes), sr=SAMPLE_RATE)
-    duration = len(audio) / sr
+def decode_audio(audio_bytes: bytes) -> tuple:
+    """Decode and resample audio bytes once into a mono float32 buffer at SAMPLE_RATE."""
+    audio, sr = librosa.load(io.BytesIO(audio_bytes), sr=SAMPLE_RATE, dtype=np.float32)
+    return np.ascontiguousarray(audio, dtype=np.float32), sr
+
+
+def segment_audio(audio: np.ndarray) -> tuple:
+    """Split a decoded buffer into fixed-length segments.
+
+    Full segments are views into ``audio``; only a padded tail segment is copied.
+    """
+    duration = len(audio) / SAMPLE_RATE
     
     # Calculate segment length in samples
     segment_samples = SAMPLE_RATE * SEGMENT_DURATION
-    
-    # Split into segments
-    segments = []
     num_segments = int(len(audio) / segment_samples)
     
     if num_segments == 0 and len(audio) >= segment_samples // 2:
         # If audio is shorter than segment but at least half, use it anyway
         num_segments = 1
     
-    for i in range(max(1, num_segments)):
-        start = i * segment_samples
-        end = start + segment_samples
-        
-        if end <= len(audio):
-            segment = audio[start:end]
-        else:
-            # Pad the last segment if needed
-            segment = np.zeros(segment_samples)
-            segment[:len(audio) - start] = audio[start:]
-        
+    full_segments = len(audio) // segment_samples
+    if full_segments > 0:
+        # (num_full, segment_samples) view over the contiguous buffer
+        segments = list(audio[:full_segments * segment_samples].reshape(full_segments, segment_samples))
+    else:
+        segments = []
+    
+    if len(segments) < max(1, num_segments):
+        # Pad the last segment if needed
+        start = len(segments) * segment_samples
+        segment = np.zeros(segment_samples, dtype=np.float32)
+        segment[:len(audio) - start] = audio[start:]
         segments.append(segment)
     
     return segments, duration, num_segments
 
 
+def process_audio_file(audio_bytes: bytes) -> tuple:
+    """Process audio file and return segments for classification."""
+    audio, _ = decode_audio(audio_bytes)
+    return segment_audio(audio)
+
+
+def open_audio_stream(source, block_frames: int = DECODE_BLOCK_FRAMES) -> tuple:
+    """Open audio for block-wise decoding.
+
+    ``source`` may be bytes, a path or a binary file object. Returns
+    ``(total_samples, blocks)`` where ``blocks`` yields mono float32 chunks at
+    SAMPLE_RATE, resampled through a streaming soxr resampler, and
+    ``total_samples`` equals the length ``librosa.load`` would produce.
+    Formats libsndfile cannot read fall back to a full ``decode_audio``.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    
+    try:
+        info = sf.info(source)
+    except RuntimeError:
+        if isinstance(source, str):
+            with open(source, "rb") as f:
+                audio_bytes = f.read()
+        else:
+            source.seek(0)
+            audio_bytes = source.read()
+        audio, _ = decode_audio(audio_bytes)
+        
+        def whole():
+            yield audio
+        
+        return len(audio), whole()
+    if not isinstance(source, str):
+        source.seek(0)
+    
+    total_samples = int(np.ceil(info.frames * SAMPLE_RATE / info.samplerate))
+    
+    def blocks():
+        emitted = 0
+        resampler = None
+        if info.samplerate != SAMPLE_RATE:
+            resampler = soxr.ResampleStream(info.samplerate, SAMPLE_RATE, 1, dtype="float32", quality="HQ")
+        
+        with sf.SoundFile(source) as f:
+            for block in f.blocks(blocksize=block_frames, dtype="float32", always_2d=True):
+                mono = block.mean(axis=1) if block.shape[1] > 1 else np.ascontiguousarray(block[:, 0])
+                if resampler is not None:
+                    mono = resampler.resample_chunk(mono)
+                mono = mono[:total_samples - emitted]
+                emitted += len(mono)
+                if len(mono):
+                    yield mono
+            if resampler is not None:
+                tail = resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+                tail = tail[:total_samples - emitted]
+                emitted += len(tail)
+                if len(tail):
+                    yield tail
+        
+        # Match librosa's fixed output length
+        if emitted < total_samples:
+            yield np.zeros(total_samples - emitted, dtype=np.float32)
+    
+    return total_samples, blocks()
+
+
 def prepare_segment_for_model(segment: np.ndarray) -> np.ndarray:
     """Prepare a single audio segment for model input."""
     # Extract mel spectrogram
@@ -160,85 +504,1078 @@ def prepare_segment_for_model(segment: np.ndarray) -> np.ndarray:
     return mel_spec
 
 
-def extract_visualization_data(audio: np.ndarray, sr: int = SAMPLE_RATE) -> dict:
-    """Extract various audio features for visualization."""
-    # Downsample for visualization (reduce data size)
-    hop_viz = 512
-    
-    # Mel spectrogram (downsampled for visualization)
-    mel_spec = librosa.feature.melspectrogram(y=audio, sr=sr, n_mels=64, hop_length=hop_viz)
-    mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
-    
-    # Downsample mel spectrogram for frontend (max 200 time frames)
-    max_frames = 200
-    if mel_spec_db.shape[1] > max_frames:
-        indices = np.linspace(0, mel_spec_db.shape[1] - 1, max_frames, dtype=int)
-        mel_spec_db = mel_spec_db[:, indices]
-    
-    # Waveform (downsampled)
-    waveform_samples = 1000
-    indices = np.linspace(0, len(audio) - 1, waveform_samples, dtype=int)
-    waveform = audio[indices]
-    
-    # Spectral features
-    spectral_centroid = librosa.feature.spectral_centroid(y=audio, sr=sr, hop_length=hop_viz)[0]
-    spectral_rolloff = librosa.feature.spectral_rolloff(y=audio, sr=sr, hop_length=hop_viz)[0]
-    rms = librosa.feature.rms(y=audio, hop_length=hop_viz)[0]
-    
-    # Downsample spectral features
-    feature_samples = 100
-    if len(spectral_centroid) > feature_samples:
-        indices = np.linspace(0, len(spectral_centroid) - 1, feature_samples, dtype=int)
-        spectral_centroid = spectral_centroid[indices]
-        spectral_rolloff = spectral_rolloff[indices]
-        rms = rms[indices]
-    
-    # Normalize spectral features for visualization
-    spectral_centroid = spectral_centroid / (sr / 2)  # Normalize to 0-1
-    spectral_rolloff = spectral_rolloff / (sr / 2)
-    rms = rms / (np.max(rms) + 1e-8)
-    
-    # Tempo and beats
-    tempo, beats = librosa.beat.beat_track(y=audio, sr=sr)
-    beat_times = librosa.frames_to_time(beats, sr=sr)
-    
-    # Chromagram (pitch class)
-    chromagram = librosa.feature.chroma_stft(y=audio, sr=sr, hop_length=hop_viz)
-    if chromagram.shape[1] > max_frames:
-        indices = np.linspace(0, chromagram.shape[1] - 1, max_frames, dtype=int)
-        chromagram = chromagram[:, indices]
-    
-    # MFCCs (timbre)
-    mfcc = librosa.feature.mfcc(y=audio, sr=sr, n_mfcc=13, hop_length=hop_viz)
-    if mfcc.shape[1] > max_frames:
-        indices = np.linspace(0, mfcc.shape[1] - 1, max_frames, dtype=int)
-        mfcc = mfcc[:, indices]
-    
-    # Time axis
-    duration = len(audio) / sr
-    time_axis = np.linspace(0, duration, len(spectral_centroid))
+class FrontendWorkspace:
+    """Reusable float32 scratch buffers for mel_spectrogram_batch.
+
+    Holds one ``chunk`` of centre-padded segments, their windowed frames,
+    spectrum, power and mel energies, so steady-state calls allocate only
+    small per-segment reductions. Not safe to share between threads; see
+    ``frontend_workspace``.
+    """
+
+    def __init__(self, chunk: int = FRONTEND_CHUNK_SEGMENTS):
+        segment_samples = SAMPLE_RATE * SEGMENT_DURATION
+        num_frames = 1 + segment_samples // HOP_LENGTH
+        bins = N_FFT // 2 + 1
+        self.chunk = chunk
+        # The centre padding on both sides stays zero; only segment samples are written
+        self.padded = np.zeros((chunk, segment_samples + 2 * (N_FFT // 2)), dtype=np.float32)
+        self.windowed = np.empty((chunk, num_frames, N_FFT), dtype=np.float32)
+        self.spectrum = np.empty((chunk, num_frames, bins), dtype=np.complex64)
+        self.power = np.empty((chunk, num_frames, bins), dtype=np.float32)
+        self.mel = np.empty((chunk, num_frames, N_MELS), dtype=np.float32)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(buffer.nbytes for buffer in (self.padded, self.windowed, self.spectrum, self.power, self.mel))
+
+
+_workspaces = threading.local()
+
+
+def frontend_workspace() -> FrontendWorkspace:
+    """The calling thread's FrontendWorkspace (each pool worker, thread or process, gets its own)."""
+    workspace = getattr(_workspaces, "frontend", None)
+    if workspace is None:
+        workspace = _workspaces.frontend = FrontendWorkspace()
+    return workspace
+
+
+def mel_spectrogram_batch(segments, out: np.ndarray = None, workspace: FrontendWorkspace = None) -> np.ndarray:
+    """Compute model-ready log-mel spectrograms for many segments at once.
+
+    Frames every segment with a strided view, runs one rFFT and one mel
+    filterbank matmul per chunk, and applies per-segment
+    ``power_to_db(ref=np.max)``. Intermediates live in ``workspace``
+    (default: this thread's). Returns a float32 array of shape
+    ``(num_segments, N_MELS, EXPECTED_TIME_FRAMES, 1)``, written into ``out``
+    when given.
+    """
+    num_segments = len(segments)
+    segment_samples = SAMPLE_RATE * SEGMENT_DURATION
+    pad = N_FFT // 2
+    num_frames = 1 + segment_samples // HOP_LENGTH
+    if out is None:
+        out = np.empty((num_segments, N_MELS, EXPECTED_TIME_FRAMES, 1), dtype=np.float32)
+    if workspace is None:
+        workspace = frontend_workspace()
     
-    return {
-        "melSpectrogram": mel_spec_db.tolist(),
-        "waveform": waveform.tolist(),
-        "spectralCentroid": spectral_centroid.tolist(),
-        "spectralRolloff": spectral_rolloff.tolist(),
-        "rms": rms.tolist(),
-        "tempo": float(tempo) if isinstance(tempo, (int, float, np.number)) else float(tempo[0]) if len(tempo) > 0 else 120.0,
-        "beats": beat_times.tolist()[:50],  # Limit beats
-        "chromagram": chromagram.tolist(),
-        "mfcc": mfcc.tolist(),
-        "timeAxis": time_axis.tolist()
+    for chunk_start in range(0, num_segments, workspace.chunk):
+        chunk = segments[chunk_start:chunk_start + workspace.chunk]
+        n = len(chunk)
+        
+        # Copy each segment between the zero centre padding, like librosa's centered STFT
+        padded = workspace.padded[:n]
+        for i, segment in enumerate(chunk):
+            padded[i, pad:pad + len(segment)] = segment
+            padded[i, pad + len(segment):pad + segment_samples] = 0.0
+        
+        # (chunk, frames, n_fft) strided view -> windowed power spectrum
+        frames = np.lib.stride_tricks.sliding_window_view(padded, N_FFT, axis=1)[:, ::HOP_LENGTH]
+        windowed = np.multiply(frames, STFT_WINDOW, out=workspace.windowed[:n])
+        # scipy keeps float32 as complex64; one segment at a time bounds its output to (frames, bins)
+        spectrum = workspace.spectrum[:n]
+        for i in range(n):
+            spectrum[i] = scipy.fft.rfft(windowed[i], axis=-1)
+        power = np.square(spectrum.real, out=workspace.power[:n])
+        # The windowed frames are spent; reuse them for the imaginary part
+        imag_sq = workspace.windowed.reshape(-1)[:power.size].reshape(power.shape)
+        power += np.square(spectrum.imag, out=imag_sq)
+        
+        # (chunk, frames, n_mels)
+        mel = np.matmul(power, MEL_BASIS.T, out=workspace.mel[:n])
+        
+        # power_to_db(ref=np.max) per segment, in place
+        ref_db = 10.0 * np.log10(np.maximum(mel.max(axis=(1, 2), keepdims=True), 1e-10))
+        log_mel = np.log10(np.maximum(mel, 1e-10, out=mel), out=mel)
+        log_mel *= 10.0
+        log_mel -= ref_db
+        np.maximum(log_mel, log_mel.max(axis=(1, 2), keepdims=True) - TOP_DB, out=log_mel)
+        
+        # Pad or truncate to the expected number of frames; (chunk, frames, n_mels) -> (chunk, n_mels, frames)
+        frames_kept = min(num_frames, EXPECTED_TIME_FRAMES)
+        dest = out[chunk_start:chunk_start + n, :, :, 0]
+        dest[:, :, :frames_kept] = log_mel[:, :frames_kept, :].transpose(0, 2, 1)
+        if frames_kept < EXPECTED_TIME_FRAMES:
+            dest[:, :, frames_kept:] = log_mel.min(axis=(1, 2))[:, None, None]
+    
+    return out
+
+
+def _sound_source(source):
+    """Return something soundfile can open for bytes, a path or a file object."""
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    if not isinstance(source, str):
+        source.seek(0)
+    return source
+
+
+def select_segment_windows(num_segments: int, strategy: str, k: int, seed: int = None,
+                           energies: np.ndarray = None) -> np.ndarray:
+    """Sorted indices of the segments to classify under a sampling strategy.
+
+    ``all`` keeps every segment; ``uniform`` takes the centre of ``k`` equal
+    strata; ``random`` draws ``k`` without replacement from ``seed``;
+    ``energy`` draws ``k`` with probability proportional to segment RMS.
+    """
+    if strategy not in SAMPLING_STRATEGIES:
+        raise ValueError(f"Unknown sampling strategy: {strategy!r}")
+    if strategy == "all" or k >= num_segments:
+        return np.arange(num_segments)
+    if strategy == "uniform":
+        return np.unique(((np.arange(k) + 0.5) * num_segments / k).astype(int))
+    
+    rng = np.random.default_rng(seed)
+    if strategy == "random":
+        return np.sort(rng.choice(num_segments, size=k, replace=False))
+    weights = np.asarray(energies[:num_segments], dtype=np.float64) + 1e-12
+    return np.sort(rng.choice(num_segments, size=k, replace=False, p=weights / weights.sum()))
+
+
+def segment_energies(source, num_segments: int) -> np.ndarray:
+    """RMS of each segment, read at the file's native rate without resampling.
+
+    This reads (and for compressed formats decodes) the whole file once, so
+    the ``energy`` strategy costs a full pass even though only the chosen
+    windows are resampled and classified afterwards.
+    """
+    with sf.SoundFile(_sound_source(source)) as f:
+        segment_frames = SEGMENT_DURATION * f.samplerate
+        energies = [
+            np.sqrt(np.mean(block ** 2))
+            for block in f.blocks(blocksize=segment_frames, dtype="float32", always_2d=True)
+        ]
+    energies = np.array(energies[:num_segments], dtype=np.float64)
+    return np.pad(energies, (0, num_segments - len(energies)))
+
+
+def _read_resampled(f: sf.SoundFile, start: int, frames: int) -> np.ndarray:
+    """Seek to native frame ``start`` and read ``frames`` frames as mono float32 at SAMPLE_RATE.
+
+    A small margin is read on both sides and trimmed after resampling, so the
+    resampler has settled by the first sample kept.
+    """
+    sr_in = f.samplerate
+    margin = int(WINDOW_MARGIN_SECONDS * sr_in) if sr_in != SAMPLE_RATE else 0
+    read_start = max(0, start - margin)
+    f.seek(read_start)
+    block = f.read(frames + (start - read_start) + margin, dtype="float32", always_2d=True)
+    mono = block.mean(axis=1) if block.shape[1] > 1 else np.ascontiguousarray(block[:, 0])
+    if sr_in != SAMPLE_RATE:
+        mono = soxr.resample(mono, sr_in, SAMPLE_RATE, quality="HQ")
+    offset = int(round((start - read_start) * SAMPLE_RATE / sr_in))
+    return mono[offset:offset + int(round(frames * SAMPLE_RATE / sr_in))]
+
+
+def decode_segment_windows(source, indices: np.ndarray) -> np.ndarray:
+    """Decode only the given segments by seeking, returning ``(len(indices), segment_samples)`` float32.
+
+    Each window is read with a small margin at the native rate and resampled
+    on its own, so the cost scales with the number of windows, not the file.
+    """
+    segment_samples = SAMPLE_RATE * SEGMENT_DURATION
+    windows = np.zeros((len(indices), segment_samples), dtype=np.float32)
+    with sf.SoundFile(_sound_source(source)) as f:
+        segment_frames = SEGMENT_DURATION * f.samplerate
+        for row, index in enumerate(indices):
+            window = _read_resampled(f, int(index) * segment_frames, segment_frames)
+            windows[row, :len(window)] = window
+    return windows
+
+
+class WindowRangeError(ValueError):
+    """A requested time window does not cover enough audio to classify."""
+
+
+def decode_time_windows(source, windows) -> tuple:
+    """Decode only the given ``(offset, duration)`` second ranges by seeking.
+
+    Returns ``(total_samples, clips)``: the track length at SAMPLE_RATE and
+    one mono float32 clip per window, cut short at the end of the track.
+    Formats libsndfile cannot read are decoded once in full and sliced.
+    """
+    try:
+        info = sf.info(_sound_source(source))
+    except RuntimeError:
+        info = None
+    if info is None:
+        total_samples, blocks = open_audio_stream(source)
+        audio = np.concatenate(list(blocks)) if total_samples else np.zeros(0, dtype=np.float32)
+        return total_samples, [
+            audio[int(round(offset * SAMPLE_RATE)):int(round((offset + duration) * SAMPLE_RATE))]
+            for offset, duration in windows
+        ]
+    
+    total_samples = int(np.ceil(info.frames * SAMPLE_RATE / info.samplerate))
+    clips = []
+    with sf.SoundFile(_sound_source(source)) as f:
+        for offset, duration in windows:
+            start = min(int(round(offset * f.samplerate)), info.frames)
+            frames = min(int(round(duration * f.samplerate)), info.frames - start)
+            clips.append(_read_resampled(f, start, frames) if frames > 0 else np.zeros(0, dtype=np.float32))
+    return total_samples, clips
+
+
+class SegmentAccumulator:
+    """Cuts decoded blocks into segments and runs the mel front-end chunk by chunk.
+
+    Only ``FRONTEND_CHUNK_SEGMENTS`` segments of raw audio are buffered at a
+    time; segmentation follows the same rules as ``segment_audio``.
+    """
+
+    def __init__(self, total_samples: int):
+        self.segment_samples = SAMPLE_RATE * SEGMENT_DURATION
+        self.num_segments = int(total_samples / self.segment_samples)
+        if self.num_segments == 0 and total_samples >= self.segment_samples // 2:
+            # If audio is shorter than segment but at least half, use it anyway
+            self.num_segments = 1
+        
+        count = max(1, self.num_segments)
+        self.batch = np.empty((count, N_MELS, EXPECTED_TIME_FRAMES, 1), dtype=np.float32)
+        self._pending = np.zeros((min(count, FRONTEND_CHUNK_SEGMENTS), self.segment_samples), dtype=np.float32)
+        self._filled = 0
+        self._done = 0
+        self._emitted = 0
+        self.frontend_ms = 0.0
+
+    @property
+    def complete(self) -> bool:
+        """Whether every segment has been converted."""
+        return self._done == len(self.batch)
+
+    @property
+    def ready_count(self) -> int:
+        """Segments converted but not yet returned by ``take_ready``."""
+        return self._done - self._emitted
+
+    def take_ready(self) -> np.ndarray:
+        """Return the segments converted since the last call, as a view into ``batch``."""
+        ready = self.batch[self._emitted:self._done]
+        self._emitted = self._done
+        return ready
+
+    def _rows_needed(self) -> int:
+        return min(len(self._pending), len(self.batch) - self._done)
+
+    def update(self, block: np.ndarray):
+        """Consume the next decoded block; samples past the last segment are ignored."""
+        flat = self._pending.reshape(-1)
+        while len(block) and self._done < len(self.batch):
+            limit = self._rows_needed() * self.segment_samples
+            take = min(len(block), limit - self._filled)
+            flat[self._filled:self._filled + take] = block[:take]
+            self._filled += take
+            block = block[take:]
+            if self._filled == limit:
+                self._flush()
+
+    def _flush(self):
+        rows = self._rows_needed()
+        stage_start = time.perf_counter()
+        mel_spectrogram_batch(self._pending[:rows], out=self.batch[self._done:self._done + rows])
+        self.frontend_ms += (time.perf_counter() - stage_start) * 1000
+        self._done += rows
+        self._filled = 0
+
+    def finalize(self) -> np.ndarray:
+        """Zero-pad any partial tail segment and return the model batch."""
+        if self._done < len(self.batch):
+            self._pending.reshape(-1)[self._filled:] = 0.0
+            self._flush()
+        return self.batch
+
+
+def open_segment_stream(source, batch_segments: int = PROGRESSIVE_BATCH_SEGMENTS) -> tuple:
+    """Open audio for progressive classification.
+
+    Returns ``(num_segments, duration, batches)`` where ``batches`` yields
+    model-ready segment batches of at least ``batch_segments`` (except the
+    last) as decoding proceeds. Decoding stops when the caller stops
+    iterating, so an early exit also skips the rest of the decode.
+    """
+    total_samples, blocks = open_audio_stream(source)
+    segments = SegmentAccumulator(total_samples)
+    
+    def batches():
+        for block in blocks:
+            segments.update(block)
+            if segments.ready_count >= batch_segments:
+                yield segments.take_ready()
+            if segments.complete:
+                break
+        blocks.close()
+        segments.finalize()
+        if segments.ready_count:
+            yield segments.take_ready()
+    
+    return segments.num_segments, total_samples / SAMPLE_RATE, batches()
+
+
+def _select_frames(num_frames: int, max_frames: int) -> np.ndarray:
+    """Frame indices kept by the visualization downsampling."""
+    if num_frames > max_frames:
+        return np.linspace(0, num_frames - 1, max_frames, dtype=int)
+    return np.arange(num_frames)
+
+
+def estimate_tempo(onset_envelope: np.ndarray, sr: int = SAMPLE_RATE) -> np.ndarray:
+    """Global tempo, as ``librosa.feature.tempo(aggregate=np.mean)``.
+
+    The tempogram is averaged chunk by chunk instead of being materialized
+    for every frame, which would need ~3 KB per frame on long tracks.
+    """
+    win_length = librosa.time_to_frames(8.0, sr=sr, hop_length=HOP_LENGTH).item()
+    ac_window = librosa.filters.get_window("hann", win_length, fftbins=True)
+    num_frames = len(onset_envelope)
+    
+    padded = np.pad(onset_envelope, win_length // 2, mode="linear_ramp", end_values=[0, 0])
+    odf_frames = librosa.util.frame(padded, frame_length=win_length, hop_length=1)[:, :num_frames]
+    
+    tempogram_sum = np.zeros(win_length)
+    for start in range(0, num_frames, TEMPO_CHUNK_FRAMES):
+        chunk = odf_frames[:, start:start + TEMPO_CHUNK_FRAMES] * ac_window[:, np.newaxis]
+        autocorr = librosa.autocorrelate(chunk, axis=0)
+        tempogram_sum += librosa.util.normalize(autocorr, norm=np.inf, axis=0).sum(axis=1)
+    
+    mean_tempogram = (tempogram_sum / num_frames)[:, np.newaxis]
+    return librosa.feature.tempo(tg=mean_tempogram, sr=sr, hop_length=HOP_LENGTH, aggregate=None)
+
+
+class VisualizationAccumulator:
+    """Builds the visualization bundle incrementally from decoded blocks.
+
+    The track length must be known up front so the downsampled frame and
+    waveform positions can be picked as blocks stream past. One centered STFT
+    feeds every feature: each frame contributes to the 128-band mel onset
+    envelope used for tempo and beats, and only the frames that survive the
+    200-frame / 100-sample downsampling are kept for the other features.
+    
+    ``features`` limits the bundle to a subset of VIZ_FEATURES. Unless the mel
+    heatmap (whose dB scale is referenced to the loudest frame in the track),
+    tempo, beats or mfcc are requested, only the kept frames are transformed.
+    """
+
+    def __init__(self, total_samples: int, sr: int = SAMPLE_RATE, features=VIZ_FEATURES):
+        self.sr = sr
+        self.total_samples = total_samples
+        self.features = set(features)
+        self.full_pass = bool(self.features & VIZ_FULL_PASS_FEATURES)
+        self.num_frames = 1 + total_samples // HOP_LENGTH
+        self.frame_indices = _select_frames(self.num_frames, VIZ_MAX_FRAMES)
+        self.feature_indices = _select_frames(self.num_frames, VIZ_FEATURE_SAMPLES)
+        self.kept = np.union1d(self.frame_indices, self.feature_indices)
+        self.waveform_indices = np.linspace(0, total_samples - 1, VIZ_WAVEFORM_SAMPLES, dtype=int)
+        
+        self.waveform = np.zeros(len(self.waveform_indices), dtype=np.float32)
+        self.onset = np.zeros(self.num_frames, dtype=np.float32)
+        self.magnitude = np.zeros((len(self.kept), N_FFT // 2 + 1), dtype=np.float32)
+        self.log_mel = np.zeros((len(self.kept), N_MELS), dtype=np.float32)
+        self.rms = np.zeros(len(self.kept), dtype=np.float32)
+        self.db_max = -np.inf
+        self.viz_mel_max = 0.0
+        
+        self._prev_log_mel = None
+        self._samples_seen = 0
+        self._buffer = np.zeros(N_FFT // 2, dtype=np.float32)  # leading centre padding
+        self._buffer_start = 0  # index of _buffer[0] in the padded signal
+        self._next_frame = 0
+        self._kept_pos = 0
+
+    def update(self, block: np.ndarray):
+        """Consume the next decoded block."""
+        start = self._samples_seen
+        end = start + len(block)
+        lo, hi = np.searchsorted(self.waveform_indices, [start, end])
+        self.waveform[lo:hi] = block[self.waveform_indices[lo:hi] - start]
+        self._samples_seen = end
+        
+        self._buffer = np.concatenate([self._buffer, block])
+        self._process()
+
+    def _process(self):
+        available = (self._buffer_start + len(self._buffer) - N_FFT) // HOP_LENGTH + 1
+        end_frame = min(self.num_frames, available)
+        if end_frame <= self._next_frame:
+            return
+        
+        frames = np.lib.stride_tricks.sliding_window_view(self._buffer, N_FFT)[::HOP_LENGTH]
+        offset = self._buffer_start // HOP_LENGTH
+        if self.full_pass:
+            for start in range(self._next_frame, end_frame, VIZ_CHUNK_FRAMES):
+                stop = min(start + VIZ_CHUNK_FRAMES, end_frame)
+                chunk = frames[start - offset:stop - offset]
+                magnitude = np.abs(np.fft.rfft(chunk * STFT_WINDOW, axis=-1))
+                power = magnitude ** 2
+                log_mel = 10.0 * np.log10(np.maximum(power @ MEL_BASIS.T, 1e-10))
+                self._update_onset(start, stop, log_mel)
+                if "melSpectrogram" in self.features:
+                    self.viz_mel_max = max(self.viz_mel_max, float((power @ VIZ_MEL_BASIS.T).max()))
+                
+                # Keep only frames that survive the downsampling
+                lo = self._kept_pos
+                hi = np.searchsorted(self.kept, stop)
+                if hi > lo:
+                    rows = self.kept[lo:hi] - start
+                    self.magnitude[lo:hi] = magnitude[rows]
+                    self.log_mel[lo:hi] = log_mel[rows]
+                    self.rms[lo:hi] = np.sqrt(np.mean(chunk[rows] ** 2, axis=-1))
+                    self._kept_pos = hi
+        else:
+            # No onset envelope needed: transform the kept frames only
+            lo = self._kept_pos
+            hi = np.searchsorted(self.kept, end_frame)
+            if hi > lo:
+                chunk = frames[self.kept[lo:hi] - offset]
+                self.magnitude[lo:hi] = np.abs(np.fft.rfft(chunk * STFT_WINDOW, axis=-1))
+                self.rms[lo:hi] = np.sqrt(np.mean(chunk ** 2, axis=-1))
+                self._kept_pos = hi
+        self._next_frame = end_frame
+        
+        # Drop samples no later frame needs
+        drop = self._next_frame * HOP_LENGTH - self._buffer_start
+        self._buffer = self._buffer[drop:]
+        self._buffer_start += drop
+
+    def _update_onset(self, start: int, stop: int, log_mel: np.ndarray):
+        """Spectral-flux onset strength, as librosa.onset.onset_strength(aggregate=np.median).
+
+        The top_db floor follows the running maximum rather than the
+        whole-track maximum, so only a quiet lead-in can differ.
+        """
+        self.db_max = max(self.db_max, float(log_mel.max()))
+        if self._prev_log_mel is not None:
+            log_mel_with_prev = np.vstack([self._prev_log_mel, log_mel])
+            first = start
+        else:
+            log_mel_with_prev = log_mel
+            first = start + 1
+        self._prev_log_mel = log_mel[-1]
+        
+        clipped = np.maximum(log_mel_with_prev, self.db_max - TOP_DB)
+        flux = np.median(np.maximum(0.0, clipped[1:] - clipped[:-1]), axis=1)
+        
+        # librosa pads by lag + n_fft // (2 * hop) frames when centering, and the
+        # flux ending at frame k starts at frame k - lag
+        positions = np.arange(first, stop) + N_FFT // (2 * HOP_LENGTH)
+        valid = positions < self.num_frames
+        self.onset[positions[valid]] = flux[valid]
+
+    def finalize(self) -> dict:
+        """Flush the trailing centre padding and assemble the requested visualization features."""
+        sr = self.sr
+        wanted = self.features
+        self._buffer = np.concatenate([self._buffer, np.zeros(N_FFT // 2, dtype=np.float32)])
+        self._process()
+        
+        frame_cols = np.searchsorted(self.kept, self.frame_indices)
+        feature_cols = np.searchsorted(self.kept, self.feature_indices)
+        power = (self.magnitude ** 2).T
+        out = {}
+        
+        # Mel spectrogram (64 bands for the heatmap)
+        if "melSpectrogram" in wanted:
+            # power_to_db(ref=np.max) over every frame, not just the plotted ones
+            mel_db = librosa.power_to_db(VIZ_MEL_BASIS @ power[:, frame_cols], ref=self.viz_mel_max, top_db=None)
+            out["melSpectrogram"] = np.maximum(mel_db, -TOP_DB)
+        if "waveform" in wanted:
+            out["waveform"] = self.waveform
+        
+        # Spectral features, normalized for visualization
+        feature_magnitude = self.magnitude[feature_cols].T
+        if "spectralCentroid" in wanted:
+            spectral_centroid = librosa.feature.spectral_centroid(S=feature_magnitude, sr=sr, n_fft=N_FFT)[0]
+            out["spectralCentroid"] = spectral_centroid / (sr / 2)  # Normalize to 0-1
+        if "spectralRolloff" in wanted:
+            spectral_rolloff = librosa.feature.spectral_rolloff(S=feature_magnitude, sr=sr, n_fft=N_FFT)[0]
+            out["spectralRolloff"] = spectral_rolloff / (sr / 2)
+        if "rms" in wanted:
+            rms = self.rms[feature_cols]
+            out["rms"] = rms / (np.max(rms) + 1e-8)
+        
+        # Tempo and beats from the shared onset envelope
+        if "tempo" in wanted or "beats" in wanted:
+            bpm = estimate_tempo(self.onset, sr) if self.onset.any() else None
+            tempo, beats = librosa.beat.beat_track(onset_envelope=self.onset, sr=sr, hop_length=HOP_LENGTH, bpm=bpm)
+            if "tempo" in wanted:
+                out["tempo"] = float(tempo) if isinstance(tempo, (int, float, np.number)) else float(tempo[0]) if len(tempo) > 0 else 120.0
+            if "beats" in wanted:
+                out["beats"] = librosa.frames_to_time(beats, sr=sr, hop_length=HOP_LENGTH)[:50]  # Limit beats
+        
+        # Chromagram (pitch class)
+        if "chromagram" in wanted:
+            out["chromagram"] = librosa.feature.chroma_stft(S=power[:, frame_cols], sr=sr, n_fft=N_FFT)
+        
+        # MFCCs (timbre) from the 128-band log-mel, floored against the whole track
+        if "mfcc" in wanted:
+            log_mel = np.maximum(self.log_mel[frame_cols], self.db_max - TOP_DB).T
+            out["mfcc"] = librosa.feature.mfcc(S=log_mel, sr=sr, n_mfcc=13)
+        
+        # Time axis
+        if "timeAxis" in wanted:
+            duration = self.total_samples / sr
+            out["timeAxis"] = np.linspace(0, duration, len(self.feature_indices))
+        
+        # Arrays stay numpy until the response is encoded (see encode_result)
+        return out
+
+
+def extract_visualization_data(audio: np.ndarray, sr: int = SAMPLE_RATE, features=VIZ_FEATURES) -> dict:
+    """Extract visualization features (all, or the named subset) from a decoded buffer as numpy arrays."""
+    accumulator = VisualizationAccumulator(len(audio), sr, features)
+    for start in range(0, len(audio), DECODE_BLOCK_FRAMES):
+        accumulator.update(audio[start:start + DECODE_BLOCK_FRAMES])
+    return accumulator.finalize()
+
+
+def predict_segments(batch: np.ndarray) -> np.ndarray:
+    """Run the loaded model over a batch of model-ready segments."""
+    return load_model().predict(batch, batch_size=INFERENCE_MAX_BATCH_SIZE, verbose=0)
+
+
+def predict_outputs(batch: np.ndarray) -> np.ndarray:
+    """Per-segment probabilities followed by the segment embeddings, when the model has them.
+
+    One ``(n, len(GTZAN_GENRES) + embedding size)`` array, so the inference
+    scheduler batches and splits it like plain predictions; split_outputs
+    separates the two.
+    """
+    combined = load_embedding_model()
+    if combined is None:
+        return predict_segments(batch)
+    embeddings, probabilities = combined.predict(batch, batch_size=INFERENCE_MAX_BATCH_SIZE, verbose=0)
+    return np.concatenate(
+        [probabilities, np.reshape(embeddings, (len(embeddings), -1))], axis=1
+    ).astype(np.float32, copy=False)
+
+
+def split_outputs(outputs: np.ndarray) -> tuple:
+    """``(probabilities, embeddings)`` from predict_outputs; embeddings have width 0 without a model layer."""
+    return outputs[:, :len(GTZAN_GENRES)], outputs[:, len(GTZAN_GENRES):]
+
+
+def track_embedding(segment_embeddings: np.ndarray) -> np.ndarray:
+    """Mean segment embedding, L2-normalized: the vector /similar compares."""
+    return vector_index.normalize(np.mean(segment_embeddings, axis=0))
+
+
+def warm_up_model():
+    """Load the model and run one dummy batch so graph tracing happens before real traffic."""
+    predict_outputs(np.zeros((1, N_MELS, EXPECTED_TIME_FRAMES, 1), dtype=np.float32))
+
+
+def warm_up_features():
+    """Run one decode/resample/mel/visualization pass over a short synthetic clip.
+
+    Pays librosa's and numba's first-call costs (and, in process mode, the
+    worker spawn) and allocates the worker's FrontendWorkspace before the
+    first real request does.
+    """
+    sr = 44100
+    t = np.arange(4 * sr) / sr
+    clip = 0.3 * np.sin(2 * np.pi * 440 * t) + 0.05 * np.random.default_rng(0).standard_normal(len(t))
+    buffer = io.BytesIO()
+    sf.write(buffer, clip.astype(np.float32), sr, format="WAV")
+    extract_features(buffer.getvalue())
+
+
+def extract_features_timed(submitted_at: float, source, strategy: str = "all",
+                           k: int = DEFAULT_SAMPLE_WINDOWS, seed: int = None,
+                           visualize: bool = True, retain_audio_bytes: int = 0, windows: tuple = None) -> dict:
+    """extract_features, also reporting how long the job waited for a worker.
+
+    ``submitted_at`` is wall-clock time so it is comparable across processes.
+    """
+    queue_wait_ms = (time.time() - submitted_at) * 1000
+    features = extract_features(source, strategy, k, seed, visualize, retain_audio_bytes, windows)
+    features["timings"]["queueWait"] = max(queue_wait_ms, 0.0)
+    return features
+
+
+def extract_features(source, strategy: str = "all", k: int = DEFAULT_SAMPLE_WINDOWS, seed: int = None,
+                     visualize: bool = True, retain_audio_bytes: int = 0, windows: tuple = None) -> dict:
+    """Run the CPU-bound stages (decode, segmentation, visualization, mel front-end).
+
+    ``source`` is bytes, a path or a binary file object. With the ``all``
+    strategy, audio is decoded in blocks that feed segmentation, the mel
+    front-end and visualization as they arrive, so no full-length decoded
+    copy of the track is held. The signal visualization would cover is
+    returned as ``features["audio"]`` only if it is at most
+    ``retain_audio_bytes`` (decode_analysis_audio recovers it later). Other
+    strategies decode only the selected windows, and ``windows`` (a tuple
+    of ``(offset, duration)`` seconds) only those time ranges.
+    ``visualize=False`` skips the visualization bundle. Top-level and
+    picklable so it can run in a thread or process pool.
+    """
+    if windows:
+        return _extract_window_features(source, windows, visualize, retain_audio_bytes)
+    if strategy != "all":
+        total_samples = _seekable_total_samples(source)
+        if total_samples is not None:
+            return _extract_sampled_features(source, total_samples, strategy, k, seed, visualize, retain_audio_bytes)
+    
+    timings = {}
+    
+    stage_start = time.perf_counter()
+    total_samples, blocks = open_audio_stream(source)
+    decode_ms = (time.perf_counter() - stage_start) * 1000
+    
+    segments = SegmentAccumulator(total_samples)
+    features = {
+        "duration": total_samples / SAMPLE_RATE,
+        "numSegments": segments.num_segments,
+        "timings": timings,
     }
+    if segments.num_segments == 0:
+        timings["decode"] = decode_ms
+        return features
+    
+    visualization = VisualizationAccumulator(total_samples) if visualize else None
+    retain_audio = total_samples * np.dtype(np.float32).itemsize <= retain_audio_bytes
+    audio = np.empty(total_samples, dtype=np.float32) if retain_audio else None
+    position = 0
+    segmentation_ms = 0.0
+    visualization_ms = 0.0
+    while True:
+        stage_start = time.perf_counter()
+        block = next(blocks, None)
+        if block is not None and audio is not None:
+            audio[position:position + len(block)] = block
+            position += len(block)
+        decode_ms += (time.perf_counter() - stage_start) * 1000
+        if block is None:
+            break
+        
+        stage_start = time.perf_counter()
+        segments.update(block)
+        segmentation_ms += (time.perf_counter() - stage_start) * 1000
+        
+        if visualization is not None:
+            stage_start = time.perf_counter()
+            visualization.update(block)
+            visualization_ms += (time.perf_counter() - stage_start) * 1000
+    
+    stage_start = time.perf_counter()
+    features["batch"] = segments.finalize()
+    segmentation_ms += (time.perf_counter() - stage_start) * 1000
+    
+    if visualization is not None:
+        stage_start = time.perf_counter()
+        features["visualization"] = visualization.finalize()
+        visualization_ms += (time.perf_counter() - stage_start) * 1000
+        timings["visualization"] = visualization_ms
+    if audio is not None:
+        features["audio"] = audio
+    
+    timings["decode"] = decode_ms
+    timings["segmentation"] = segmentation_ms - segments.frontend_ms
+    timings["frontend"] = segments.frontend_ms
+    return features
+
+
+def _seekable_total_samples(source):
+    """Length of ``source`` at SAMPLE_RATE from its header, or None if libsndfile cannot read it."""
+    try:
+        info = sf.info(_sound_source(source))
+    except RuntimeError:
+        # Not seekable through libsndfile; callers classify every segment instead
+        return None
+    return int(np.ceil(info.frames * SAMPLE_RATE / info.samplerate))
+
+
+def _sampled_segment_indices(source, num_segments: int, strategy: str, k: int, seed: int) -> np.ndarray:
+    """select_segment_windows for ``source``, measuring segment energies when the strategy needs them."""
+    energies = segment_energies(source, num_segments) if strategy == "energy" and k < num_segments else None
+    return select_segment_windows(num_segments, strategy, k, seed, energies)
+
+
+def _extract_sampled_features(source, total_samples: int, strategy: str, k: int, seed: int,
+                              visualize: bool = True, retain_audio_bytes: int = 0) -> dict:
+    """extract_features for sampling strategies: decode, segment and visualize only the chosen windows."""
+    timings = {}
+    num_segments = int(total_samples / (SAMPLE_RATE * SEGMENT_DURATION))
+    if num_segments <= 1:
+        # Nothing to sample from; the exhaustive path also handles short clips
+        return extract_features(source, visualize=visualize, retain_audio_bytes=retain_audio_bytes)
+    features = {"duration": total_samples / SAMPLE_RATE, "numSegments": num_segments, "timings": timings}
+    
+    stage_start = time.perf_counter()
+    indices = _sampled_segment_indices(source, num_segments, strategy, k, seed)
+    timings["segmentation"] = (time.perf_counter() - stage_start) * 1000
+    
+    stage_start = time.perf_counter()
+    windows = decode_segment_windows(source, indices)
+    timings["decode"] = (time.perf_counter() - stage_start) * 1000
+    
+    features["windows"] = _segment_spans(indices)
+    # Visualization covers the analysed windows back to back
+    features["signalWindows"] = features["windows"]
+    if visualize:
+        stage_start = time.perf_counter()
+        features["visualization"] = extract_visualization_data(windows.reshape(-1))
+        features["visualization"]["windows"] = features["signalWindows"]
+        timings["visualization"] = (time.perf_counter() - stage_start) * 1000
+    if windows.nbytes <= retain_audio_bytes:
+        features["audio"] = windows.reshape(-1)
+    
+    stage_start = time.perf_counter()
+    features["batch"] = mel_spectrogram_batch(windows)
+    timings["frontend"] = (time.perf_counter() - stage_start) * 1000
+    return features
+
+
+def _extract_window_features(source, windows: tuple, visualize: bool = True, retain_audio_bytes: int = 0) -> dict:
+    """extract_features for time windows: decode and segment only the requested ranges.
+
+    Raises WindowRangeError when a window holds less than half a segment of audio.
+    """
+    timings = {}
+    segment_samples = SAMPLE_RATE * SEGMENT_DURATION
+    
+    stage_start = time.perf_counter()
+    total_samples, clips = decode_time_windows(source, windows)
+    timings["decode"] = (time.perf_counter() - stage_start) * 1000
+    
+    stage_start = time.perf_counter()
+    segments, spans, counts = [], [], []
+    for (offset, duration), clip in zip(windows, clips):
+        clip_segments, clip_duration, count = segment_audio(clip)
+        if count == 0:
+            raise WindowRangeError(
+                f"Window {offset:g}:{duration:g} covers {clip_duration:.2f} s of a "
+                f"{total_samples / SAMPLE_RATE:.2f} s track; each window needs at least "
+                f"{SEGMENT_DURATION / 2:g} s of audio."
+            )
+        segments.extend(clip_segments[:count])
+        spans.append([float(offset), float(offset + min(count * SEGMENT_DURATION, clip_duration))])
+        counts.append(count)
+    num_segments = int(total_samples / segment_samples)
+    if num_segments == 0 and total_samples >= segment_samples // 2:
+        num_segments = 1
+    features = {"duration": total_samples / SAMPLE_RATE, "numSegments": num_segments, "timings": timings,
+                "windows": spans, "windowSegments": counts, "signalWindows": _clip_spans(windows, clips)}
+    timings["segmentation"] = (time.perf_counter() - stage_start) * 1000
+    
+    # Visualization covers the requested windows back to back
+    retain_audio = sum(clip.nbytes for clip in clips) <= retain_audio_bytes
+    audio = np.concatenate(clips) if visualize or retain_audio else None
+    if visualize:
+        stage_start = time.perf_counter()
+        features["visualization"] = extract_visualization_data(audio)
+        features["visualization"]["windows"] = features["signalWindows"]
+        timings["visualization"] = (time.perf_counter() - stage_start) * 1000
+    if retain_audio:
+        features["audio"] = audio
+    
+    stage_start = time.perf_counter()
+    features["batch"] = mel_spectrogram_batch(segments)
+    timings["frontend"] = (time.perf_counter() - stage_start) * 1000
+    return features
+
+
+def _segment_spans(indices: np.ndarray) -> list:
+    """``[start, end]`` track seconds of each selected segment."""
+    return [[float(i * SEGMENT_DURATION), float((i + 1) * SEGMENT_DURATION)] for i in indices]
+
+
+def _clip_spans(windows: tuple, clips: list) -> list:
+    """``[start, end]`` track seconds of each decoded time-window clip."""
+    return [[float(offset), float(offset + len(clip) / SAMPLE_RATE)] for (offset, _), clip in zip(windows, clips)]
+
+
+def decode_analysis_audio(source, strategy: str = "all", k: int = DEFAULT_SAMPLE_WINDOWS, seed: int = None,
+                          windows: tuple = None) -> tuple:
+    """Decode the signal extract_features would visualize for these options, skipping the mel front-end.
+
+    Returns ``(audio, signal_windows)``, the second being the ``[start,
+    end]`` track seconds of each stretch of a sampled or windowed signal
+    (None for the whole track). Used by /visualize when only the upload
+    was kept. Top-level and picklable so it can run in a thread or process
+    pool.
+    """
+    if windows:
+        _, clips = decode_time_windows(source, windows)
+        return np.concatenate(clips), _clip_spans(windows, clips)
+    if strategy != "all":
+        total_samples = _seekable_total_samples(source)
+        num_segments = int(total_samples / (SAMPLE_RATE * SEGMENT_DURATION)) if total_samples is not None else 0
+        if num_segments > 1:
+            indices = _sampled_segment_indices(source, num_segments, strategy, k, seed)
+            return decode_segment_windows(source, indices).reshape(-1), _segment_spans(indices)
+    
+    total_samples, blocks = open_audio_stream(source)
+    audio = np.empty(total_samples, dtype=np.float32)
+    position = 0
+    for block in blocks:
+        audio[position:position + len(block)] = block
+        position += len(block)
+    return audio[:position], None
+
+
+def rank_genres(avg_predictions: np.ndarray) -> List[GenrePrediction]:
+    """Genre predictions sorted by confidence."""
+    genre_predictions = []
+    for i, genre in enumerate(GTZAN_GENRES):
+        genre_predictions.append(GenrePrediction(
+            genre=genre,
+            confidence=float(avg_predictions[i])
+        ))
+    
+    # Sort by confidence
+    genre_predictions.sort(key=lambda x: x.confidence, reverse=True)
+    return genre_predictions
+
+
+def predictions_converged(mean: np.ndarray, mean_sq: np.ndarray, n: int, z: float) -> bool:
+    """True once the top genre's confidence interval no longer overlaps the runner-up's."""
+    if n < 2:
+        return False
+    variance = np.maximum(mean_sq - mean ** 2, 0.0) * n / (n - 1)
+    std_err = np.sqrt(variance / n)
+    second, top = np.argsort(mean)[-2:]
+    return mean[top] - z * std_err[top] > mean[second] + z * std_err[second]
+
+
+def create_feature_executor() -> Executor:
+    """Create the pool that runs extract_features, as configured by CLASSIFY_EXECUTOR."""
+    if CLASSIFY_EXECUTOR == "process":
+        # TensorFlow is not fork-safe, so workers are spawned fresh
+        return ProcessPoolExecutor(
+            max_workers=CLASSIFY_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    if CLASSIFY_EXECUTOR == "thread":
+        return ThreadPoolExecutor(max_workers=CLASSIFY_WORKERS, thread_name_prefix="features")
+    raise ValueError(f"Unknown CLASSIFY_EXECUTOR: {CLASSIFY_EXECUTOR!r} (expected 'thread' or 'process')")
+
+
+class AdmissionQueue:
+    """Bounded count of in-flight classifications.
+
+    Requests beyond ``max_pending`` are rejected instead of queueing without
+    limit. Only touched from the event loop, so no lock is needed.
+    """
+
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self.pending = 0
+
+    def try_acquire(self) -> bool:
+        if self.pending >= self.max_pending:
+            return False
+        self.pending += 1
+        return True
+
+    def release(self):
+        self.pending -= 1
+
+
+admission = AdmissionQueue(CLASSIFY_MAX_PENDING)
+result_cache = ResultCache(CACHE_MAX_BYTES, CACHE_DIR)
+analysis_store = AnalysisStore(ANALYSIS_TTL_SECONDS, ANALYSIS_STORE_MAX_BYTES)
+
+# Prometheus metrics; with METRICS_ENABLED=0 every update is a no-op
+metrics = Registry(enabled=METRICS_ENABLED)
+STAGE_SECONDS = metrics.histogram(
+    "classify_stage_seconds", "Time spent in each /classify pipeline stage", ["stage"]
+)
+SEGMENTS_PER_REQUEST = metrics.histogram(
+    "classify_segments_per_request", "Segments classified per request",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024),
+)
+INFERENCE_BATCH_SIZE = metrics.histogram(
+    "inference_batch_size", "Segments per model predict call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+INFERENCE_QUEUE_WAIT = metrics.histogram(
+    "inference_queue_wait_seconds", "Time a request's segments waited for a predict call"
+)
+INFERENCE_PREDICT = metrics.histogram("inference_predict_seconds", "Duration of each model predict call")
+HTTP_REQUESTS = metrics.counter("http_requests_total", "HTTP requests by route and status", ["method", "path", "status"])
+HTTP_DURATION = metrics.histogram("http_request_duration_seconds", "HTTP request latency by route", ["method", "path"])
+REJECTED = metrics.counter("classify_rejected_total", "Requests rejected with 503 because the admission queue was full")
+metrics.gauge("classify_pending", "Classifications currently admitted", lambda: admission.pending)
+metrics.gauge("cache_hits_total", "Result cache hits (memory and disk)",
+              lambda: result_cache.hits + result_cache.disk_hits, kind="counter")
+metrics.gauge("cache_misses_total", "Result cache misses", lambda: result_cache.misses, kind="counter")
+metrics.gauge("cache_deduplicated_total", "Requests that joined an identical in-flight classification",
+              lambda: result_cache.deduplicated, kind="counter")
+metrics.gauge("cache_bytes", "Bytes held in the in-memory result cache", lambda: result_cache.stats()["bytes"])
+metrics.gauge("analysis_store_entries", "Analyses kept for /visualize", lambda: analysis_store.stats()["entries"])
+metrics.gauge("analysis_store_bytes", "Bytes of decoded audio and uploads kept for /visualize",
+              lambda: analysis_store.stats()["bytes"])
+
+
+def observe_inference_batch(batch_size: int, queue_waits: List[float], predict_seconds: float):
+    """InferenceScheduler observer: record batch fill, queue wait and predict time."""
+    INFERENCE_BATCH_SIZE.observe(batch_size)
+    INFERENCE_PREDICT.observe(predict_seconds)
+    for wait in queue_waits:
+        INFERENCE_QUEUE_WAIT.observe(wait)
+
+
+STAGE_NAMES = {"queueWait": "queue_wait"}
+
+
+def observe_stage_timings(timings: dict):
+    """Record a per-request ``timings`` dict (milliseconds, camelCase keys) as stage histograms."""
+    for stage, ms in timings.items():
+        STAGE_SECONDS.observe(ms / 1000, stage=STAGE_NAMES.get(stage, stage))
+
+
+def reject_busy():
+    """Count and raise the 503 returned when the admission queue is full."""
+    REJECTED.inc()
+    raise HTTPException(
+        status_code=503,
+        detail="Server busy, please retry shortly.",
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+    )
+
+
+@app.middleware("http")
+async def record_request_metrics(request, call_next):
+    """Count requests and their latency, labelled by route template."""
+    if not metrics.enabled:
+        return await call_next(request)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Route templates keep label cardinality bounded; unmatched paths share one label
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        HTTP_REQUESTS.inc(method=request.method, path=path, status=status)
+        HTTP_DURATION.observe(time.perf_counter() - start, method=request.method, path=path)
 
 
 @app.on_event("startup")
 async def startup_event():
-    """Load model on startup."""
+    """Create worker pools, start the inference scheduler and load model on startup."""
+    global feature_executor, inference_executor, inference_scheduler
+    feature_executor = create_feature_executor()
+    if model_connection is not None:
+        # Batches go to serve.py's model process through shared memory
+        inference_scheduler = RemoteInference(model_connection)
+    else:
+        # The model is shared; a single thread keeps predict calls serialized
+        inference_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        inference_scheduler = InferenceScheduler(
+            predict_outputs,
+            max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+            max_wait_ms=INFERENCE_MAX_WAIT_MS,
+            executor=inference_executor,
+            observer=observe_inference_batch if METRICS_ENABLED else None,
+        )
+    inference_scheduler.start()
+    # Load and warm up in the background so the server starts answering /health at once
+    load_similarity_index()
+    load_playlist_catalog()
+    global warmup_task, purge_task
+    warmup_task = asyncio.get_running_loop().create_task(warm_up())
+    purge_task = asyncio.get_running_loop().create_task(purge_analyses())
+
+
+def load_similarity_index():
+    """Memory-map the /similar catalog index, if SIMILARITY_INDEX_DIR is set."""
+    global similarity_index
+    if not SIMILARITY_INDEX_DIR:
+        return
     try:
-        load_model()
+        similarity_index = vector_index.load_index(SIMILARITY_INDEX_DIR)
     except Exception as e:
-        print(f"Warning: Could not load model on startup: {e}")
+        print(f"Warning: Could not load similarity index from {SIMILARITY_INDEX_DIR}: {e}")
+        return
+    built_with = similarity_index.meta.get("model")
+    if built_with and built_with != model_identity():
+        print(f"Warning: Similarity index was built with {built_with}, not {model_identity()}")
+    print(f"Similarity index loaded: {similarity_index.stats()}")
+
+
+def load_playlist_catalog():
+    """Load the /playlist song catalog, if PLAYLIST_CATALOG is set."""
+    global playlist_catalog
+    if not PLAYLIST_CATALOG:
+        return
+    try:
+        playlist_catalog = playlist.Catalog.load(PLAYLIST_CATALOG)
+    except Exception as e:
+        print(f"Warning: Could not load playlist catalog from {PLAYLIST_CATALOG}: {e}")
+        return
+    print(f"Playlist catalog loaded: {playlist_catalog.size} songs, {playlist_catalog.grid}x{playlist_catalog.grid} grid")
+
+
+async def purge_analyses():
+    """Periodically drop expired /visualize entries (and their spooled uploads)."""
+    while True:
+        await asyncio.sleep(ANALYSIS_PURGE_INTERVAL_SECONDS)
+        analysis_store.purge()
+
+
+async def warm_up():
+    """Load the model and warm the model and feature workers, then mark the server ready."""
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    readiness["model"] = "loading"
+    readiness["features"] = "warming"
+    
+    async def model_part():
+        if model_connection is not None:
+            await inference_scheduler.wait_ready()
+        else:
+            await loop.run_in_executor(inference_executor, warm_up_model)
+        readiness["model"] = "ready"
+    
+    async def features_part():
+        # One pass per worker so each process/thread has paid its first-call costs
+        await asyncio.gather(*(
+            loop.run_in_executor(feature_executor, warm_up_features) for _ in range(CLASSIFY_WORKERS)
+        ))
+        readiness["features"] = "ready"
+    
+    model_result, features_result = await asyncio.gather(model_part(), features_part(), return_exceptions=True)
+    if isinstance(features_result, Exception):
+        readiness["features"] = "failed"
+        print(f"Warning: Feature warm-up failed: {features_result}")
+    if isinstance(model_result, Exception):
+        readiness["model"] = "failed"
+        readiness["state"] = "failed"
+        readiness["error"] = str(model_result)
+        print(f"Warning: Could not load model on startup: {model_result}")
+        return
+    readiness["state"] = "ready"
+    readiness["warmupMs"] = (time.perf_counter() - start) * 1000
+    print(f"Model loaded and warmed up in {readiness['warmupMs']:.0f} ms")
+
+
+async def ensure_model():
+    """Wait for any in-progress startup load, then fail fast if the model is unavailable."""
+    if warmup_task is not None and not warmup_task.done():
+        await asyncio.shield(warmup_task)
+    if model_connection is not None:
+        await inference_scheduler.wait_ready()
+    elif model is None:
+        # A retry after a failed startup load imports and reads the model; keep that off the event loop
+        await asyncio.get_running_loop().run_in_executor(inference_executor, load_model)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the inference scheduler and shut down worker pools."""
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    if purge_task is not None:
+        purge_task.cancel()
+    analysis_store.clear()
+    if inference_scheduler is not None:
+        await inference_scheduler.stop()
+    if feature_executor is not None:
+        feature_executor.shutdown(wait=False, cancel_futures=True)
+    if inference_executor is not None:
+        inference_executor.shutdown(wait=False, cancel_futures=True)
 
 
 @app.get("/")
@@ -249,99 +1586,935 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
+    """Health check endpoint with liveness and readiness details."""
     global model
     return {
         "status": "healthy",
-        "model_loaded": model is not None
+        "live": True,
+        "ready": readiness["state"] == "ready",
+        "readiness": readiness,
+        "model_loaded": model is not None or (model_connection is not None and readiness["model"] == "ready"),
+        "inference_backend": INFERENCE_BACKEND,
+        "pending": admission.pending,
+        "max_pending": admission.max_pending,
+        "inference": inference_scheduler.stats() if inference_scheduler is not None else None,
+        "cache": result_cache.stats(),
+        "analysis_store": analysis_store.stats(),
+        "similarity_index": similarity_index.stats() if similarity_index is not None else None,
+        "playlist_catalog": playlist_catalog.size if playlist_catalog is not None else None,
     }
 
 
-@app.post("/classify", response_model=ClassificationResult)
-async def classify_audio(file: UploadFile = File(...)):
-    """
-    Classify the genre of an uploaded audio file.
-    
-    Accepts: WAV, MP3, OGG, FLAC audio files
-    Returns: Genre predictions with confidence scores
-    """
-    import time
-    start_time = time.time()
-    
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: the process is up and serving requests."""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness probe: 200 once the model is loaded and warmed up, 503 before (or if loading failed)."""
+    if readiness["state"] != "ready":
+        return JSONResponse(status_code=503, content={"status": readiness["state"], "readiness": readiness})
+    return {"status": "ready", "readiness": readiness}
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics in the text exposition format."""
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (METRICS_ENABLED=0)")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def validate_upload(file: UploadFile):
+    """Reject uploads that are clearly not audio."""
     # Validate file type
     allowed_types = ["audio/wav", "audio/mpeg", "audio/mp3", "audio/ogg", "audio/flac", "audio/x-wav"]
     content_type = file.content_type or ""
     
     if not any(t in content_type for t in ["audio", "octet-stream"]):
         # Also check file extension
-        if not file.filename or not file.filename.lower().endswith(('.wav', '.mp3', '.ogg', '.flac')):
+        if not file.filename or not file.filename.lower().endswith(AUDIO_EXTENSIONS):
             raise HTTPException(status_code=400, detail="Invalid file type. Please upload an audio file (WAV, MP3, OGG, or FLAC)")
+
+
+def parse_windows(value: str) -> tuple:
+    """Parse ``offset:duration,...`` (seconds) into ``(offset, duration)`` pairs, with a 400 on bad input."""
+    windows = []
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        try:
+            offset, duration = (float(part) for part in item.split(":"))
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid window {item.strip()!r}. Use offset:duration in seconds, e.g. 30:15")
+        if not (np.isfinite(offset) and np.isfinite(duration)) or offset < 0 or duration <= 0:
+            raise HTTPException(status_code=400, detail=f"Invalid window {item.strip()!r}: offset must be >= 0 and duration > 0")
+        windows.append((offset, duration))
+    if len(windows) > MAX_TIME_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"Too many windows. At most {MAX_TIME_WINDOWS} per request.")
+    return tuple(windows)
+
+
+def parse_list(value: str, allowed, name: str) -> tuple:
+    """Split a comma-separated query parameter, rejecting names outside ``allowed`` with a 400."""
+    items = tuple(item.strip() for item in (value or "").split(",") if item.strip())
+    unknown = [item for item in items if item not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid {name}: {', '.join(unknown)}. Choose from: {', '.join(allowed)}",
+        )
+    return items
+
+
+class UploadSpool:
+    """Collects upload bytes in memory, or in a temporary file past UPLOAD_SPOOL_BYTES, while hashing them.
+
+    ``append`` may write to disk, so async callers run it in a thread.
+    More than MAX_UPLOAD_BYTES in total raises a 413.
+    """
+
+    def __init__(self, model_id: str, suffix: str = ""):
+        self.hasher = new_key_hasher(model_id)
+        self.suffix = suffix
+        self.buffer = bytearray()
+        self.file = None
+        self.size = 0
+
+    def append(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > MAX_UPLOAD_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File too large. Maximum upload size is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB."
+            )
+        self.hasher.update(chunk)
+        if self.file is None:
+            self.buffer += chunk
+            if len(self.buffer) > UPLOAD_SPOOL_BYTES:
+                self.file = tempfile.NamedTemporaryFile(suffix=self.suffix, delete=False)
+                self.file.write(self.buffer)
+                self.buffer = None
+        else:
+            self.file.write(chunk)
+
+    def finish(self) -> tuple:
+        """``(source, key)``: the bytes, or the temporary file's path (caller deletes it)."""
+        if self.file is not None:
+            self.file.close()
+            return self.file.name, self.hasher.hexdigest()
+        return bytes(self.buffer), self.hasher.hexdigest()
+
+    def discard(self):
+        if self.file is not None:
+            self.file.close()
+            os.unlink(self.file.name)
+
+
+async def spool_upload(file: UploadFile, model_id: str) -> tuple:
+    """Stream an upload into memory or a temporary file while hashing it.
+
+    Returns ``(source, key)``. ``source`` is the bytes of small uploads, or
+    the path of a temporary file (caller deletes it) once the upload grows
+    past UPLOAD_SPOOL_BYTES. Uploads over MAX_UPLOAD_BYTES are rejected.
+    """
+    spool = UploadSpool(model_id, os.path.splitext(file.filename or "")[1])
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            if spool.file is None and len(spool.buffer) + len(chunk) <= UPLOAD_SPOOL_BYTES:
+                spool.append(chunk)
+            else:
+                await asyncio.to_thread(spool.append, chunk)
+    except BaseException:
+        spool.discard()
+        raise
+    return spool.finish()
+
+
+async def run_classification(source, start_time: float, strategy: str = "all",
+                             k: int = DEFAULT_SAMPLE_WINDOWS, seed: int = None,
+                             include_timings: bool = False, include_visualization: bool = True,
+                             analysis_id: str = None, include_embedding: bool = False,
+                             windows: tuple = None, admit: bool = True, predict=None) -> dict:
+    """Run the full pipeline for one upload under admission control.
+
+    Returns the ClassificationResult fields as a dict whose visualization
+    arrays are still numpy; encode_result serializes it. Without
+    ``include_visualization`` the decoded audio, if it is at most
+    ANALYSIS_RETAIN_MAX_BYTES, is kept in analysis_store under
+    ``analysis_id`` for a later /visualize call instead (classify_spooled
+    keeps the upload otherwise).
+    ``include_embedding`` adds the track embedding as ``embedding``.
+    ``windows`` classifies only those ``(offset, duration)`` ranges and
+    adds per-window predictions as ``windows``. ``admit=False`` skips
+    admission control (the caller holds a slot), and ``predict`` replaces
+    ``inference_scheduler.predict``.
+    """
+    if admit and not admission.try_acquire():
+        reject_busy()
     
     try:
-        # Load model
-        model = load_model()
+        # Fail fast if the model is unavailable
+        await ensure_model()
         
-        # Read file
-        audio_bytes = await file.read()
-        
-        # Process audio
-        segments, duration, num_segments = process_audio_file(audio_bytes)
+        # Decode and extract features off the event loop
+        loop = asyncio.get_running_loop()
+        # Keep short signals for /visualize; longer ones are re-decoded from the kept upload
+        retain_audio_bytes = ANALYSIS_RETAIN_MAX_BYTES if not include_visualization and analysis_id is not None else 0
+        features = await loop.run_in_executor(
+            feature_executor,
+            functools.partial(extract_features_timed, time.time(), source, strategy, k, seed,
+                              include_visualization, retain_audio_bytes, windows),
+        )
+        duration = features["duration"]
+        num_segments = features["numSegments"]
+        timings = features["timings"]
         
         if num_segments == 0:
             raise HTTPException(status_code=400, detail="Audio file too short. Minimum duration is ~1.5 seconds.")
         
-        # Load full audio for visualization
-        full_audio, sr = librosa.load(io.BytesIO(audio_bytes), sr=SAMPLE_RATE)
+        # Run inference, batched with concurrent requests
+        stage_start = time.perf_counter()
+        predictions, segment_embeddings = split_outputs(await (predict or inference_scheduler.predict)(features["batch"]))
+        timings["inference"] = (time.perf_counter() - stage_start) * 1000
+        observe_stage_timings(timings)
+        SEGMENTS_PER_REQUEST.observe(len(predictions))
         
-        # Extract visualization data
-        viz_data = extract_visualization_data(full_audio, sr)
-        
-        # Prepare all segments
-        segment_inputs = []
-        for segment in segments:
-            mel_input = prepare_segment_for_model(segment)
-            segment_inputs.append(mel_input)
+        # Average predictions across segments
+        genre_predictions = rank_genres(np.mean(predictions, axis=0))
         
-        # Stack into batch
-        batch_input = np.stack(segment_inputs, axis=0)
+        processing_time = time.time() - start_time
         
-        # Run inference
-        predictions = model.predict(batch_input, verbose=0)
+        audio_info = {
+            "duration": duration,
+            "numSegments": num_segments,
+            "sampleRate": SAMPLE_RATE,
+        }
+        if include_timings:
+            audio_info["timings"] = timings
+        if "windows" in features:
+            # Which [start, end] second ranges were classified
+            audio_info["strategy"] = "windows" if windows else strategy
+            audio_info["windows"] = features["windows"]
+            audio_info["segmentsAnalyzed"] = len(predictions)
+            if strategy in ("random", "energy"):
+                # Drawn by classify_options when not given; passing it back repeats the selection
+                audio_info["seed"] = seed
         
-        # Average predictions across segments
-        avg_predictions = np.mean(predictions, axis=0)
+        result = {
+            "predictions": [p.model_dump() for p in genre_predictions],
+            "topGenre": genre_predictions[0].genre,
+            "topConfidence": genre_predictions[0].confidence,
+            "processingTime": processing_time * 1000,  # Convert to ms
+            "audioInfo": audio_info,
+        }
+        if windows:
+            # Each window's own average; the top-level predictions average every segment
+            bounds = np.cumsum(features["windowSegments"])[:-1]
+            result["windows"] = []
+            for span, count, window_predictions in zip(features["windows"], features["windowSegments"],
+                                                       np.split(predictions, bounds)):
+                ranked = rank_genres(np.mean(window_predictions, axis=0))
+                result["windows"].append({
+                    "start": span[0],
+                    "end": span[1],
+                    "numSegments": count,
+                    "predictions": [p.model_dump() for p in ranked],
+                    "topGenre": ranked[0].genre,
+                    "topConfidence": ranked[0].confidence,
+                })
+        if include_visualization:
+            result["visualization"] = features["visualization"]
+        elif analysis_id is not None:
+            if "audio" in features:
+                options = {"strategy": strategy, "k": k, "seed": seed, "windows": windows,
+                           "signalWindows": features.get("signalWindows")}
+                analysis_store.put_audio(analysis_id, features["audio"], options)
+            result["analysisId"] = analysis_id
+        if include_embedding:
+            if segment_embeddings.shape[1] == 0:
+                raise HTTPException(status_code=501, detail="The loaded model does not expose embeddings.")
+            result["embedding"] = track_embedding(segment_embeddings)
+        return result
         
-        # Create result
-        genre_predictions = []
-        for i, genre in enumerate(GTZAN_GENRES):
-            genre_predictions.append(GenrePrediction(
-                genre=genre,
-                confidence=float(avg_predictions[i])
-            ))
+    except HTTPException:
+        raise
+    except WindowRangeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Classification error: {e}")
+        raise HTTPException(status_code=500, detail=f"Classification failed: {str(e)}")
+    finally:
+        if admit:
+            admission.release()
+
+
+def encode_result(result: dict, media_type: str = encoding.JSON_MEDIA_TYPE, quantize: str = "float16") -> bytes:
+    """Serialize a run_classification result.
+
+    JSON goes through the Pydantic models as before; binary media types skip
+    validation and send the visualization arrays as typed buffers.
+    """
+    if media_type != encoding.JSON_MEDIA_TYPE:
+        return encoding.encode(result, media_type, quantize)
+    fields = dict(result)
+    if "visualization" in result:
+        fields["visualization"] = _visualization_model(result["visualization"])
+    if "embedding" in result:
+        fields["embedding"] = result["embedding"].tolist()
+    return ClassificationResult(**fields).model_dump_json(exclude_none=True).encode()
+
+
+def _visualization_model(visualization: dict) -> VisualizationData:
+    return VisualizationData(**{
+        name: value.tolist() if isinstance(value, np.ndarray) else value
+        for name, value in visualization.items()
+    })
+
+
+@app.post("/classify", response_model=ClassificationResult)
+async def classify_audio(
+    file: UploadFile = File(...),
+    strategy: str = Query("all", description="Segment sampling: all, uniform, energy or random"),
+    k: int = Query(DEFAULT_SAMPLE_WINDOWS, ge=1, description="Windows to classify for sampled strategies"),
+    seed: int = Query(None, description="Seed for the random and energy strategies"),
+    timings: bool = Query(False, description="Include per-stage timings (ms) in audioInfo"),
+    quantize: str = Query("float16", description="Array encoding for binary responses: float16, uint8 or float32"),
+    include: str = Query("", description="Comma-separated extras: visualization, embedding"),
+    windows: str = Query("", description="Comma-separated offset:duration time windows (seconds) to classify"),
+    accept: str = Header(None),
+):
+    """
+    Classify the genre of an uploaded audio file.
+    
+    Accepts: WAV, MP3, OGG, FLAC audio files
+    Returns: Genre predictions with confidence scores
+    
+    ``strategy`` picks which 3-second segments are classified: ``all``
+    (default), ``uniform`` (k evenly spaced), ``energy`` (k drawn by RMS) or
+    ``random`` (k drawn with ``seed``). Sampled strategies decode only the
+    chosen windows and list them in ``audioInfo.windows``. ``timings=true``
+    adds a per-stage breakdown in milliseconds as ``audioInfo.timings``.
+    
+    ``windows=30:15,120:30`` classifies only those time ranges (offset and
+    duration in seconds), decoding just them by seeking. The response adds
+    per-window ``windows`` predictions; the top-level predictions aggregate
+    every segment of every window.
+    
+    Visualization features are left out unless ``include=visualization``;
+    the response carries an ``analysisId`` instead, and GET
+    /visualize/{analysisId} computes them from the kept audio on demand.
+    ``include=embedding`` adds the L2-normalized track embedding (the
+    model's penultimate layer, averaged over segments) that /similar uses.
+    
+    JSON is the default. Send ``Accept: application/x-gtzan-frames`` or
+    ``application/x-msgpack`` for a compact binary response where the
+    visualization arrays are ``quantize``-typed buffers (see encoding.py).
+    
+    Results are cached by content; the X-Cache header reports "memory",
+    "disk", "shared" (joined an identical in-flight upload) or "computed".
+    Anything but "computed" replays the stored bytes, so ``processingTime``
+    is that of the original run.
+    """
+    start_time = time.time()
+    
+    validate_upload(file)
+    options = classify_options(strategy, k, seed, timings, include, windows)
+    media_type = encoding.negotiate(accept)
+    if media_type != encoding.JSON_MEDIA_TYPE and quantize not in encoding.QUANTIZATIONS:
+        raise HTTPException(status_code=400, detail=f"Invalid quantize. Choose one of: {', '.join(encoding.QUANTIZATIONS)}")
+    
+    # Stream the upload to a spool, hashing as it arrives; sampling options are part of the key
+    source, key = await spool_upload(file, classification_identity(options, media_type, quantize))
+    content, cache_source = await classify_spooled(source, key, start_time, options, media_type, quantize)
+    return Response(content=content, media_type=media_type, headers={"X-Cache": cache_source, "Vary": "Accept"})
+
+
+def classify_options(strategy: str, k: int, seed: int, timings: bool, include: str, windows: str) -> dict:
+    """Validate the /classify query options into a dict, with a 400 on bad values."""
+    if strategy not in SAMPLING_STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"Invalid strategy. Choose one of: {', '.join(SAMPLING_STRATEGIES)}")
+    time_windows = parse_windows(windows)
+    if time_windows and strategy != "all":
+        raise HTTPException(status_code=400, detail="windows cannot be combined with a sampling strategy")
+    extras = parse_list(include, INCLUDE_OPTIONS, "include")
+    if seed is None and strategy in ("random", "energy"):
+        # Draw the seed here so the response can report it and /visualize can repeat the selection
+        seed = random.randrange(2 ** 31)
+    return {
+        "strategy": strategy, "k": k, "seed": seed, "windows": time_windows, "timings": timings,
+        "visualization": "visualization" in extras, "embedding": "embedding" in extras,
+    }
+
+
+def classification_identity(options: dict, media_type: str = encoding.JSON_MEDIA_TYPE,
+                            quantize: str = "float16") -> str:
+    """Model identity plus every option that changes the response: the seed of the cache key."""
+    identity = model_identity()
+    if options["strategy"] != "all":
+        identity += f"|strategy={options['strategy']}|k={options['k']}|seed={options['seed']}"
+    if options["windows"]:
+        identity += "|windows=" + ",".join(f"{offset!r}:{duration!r}" for offset, duration in options["windows"])
+    if options["timings"]:
+        identity += "|timings"
+    if options["visualization"]:
+        identity += "|visualization"
+    if options["embedding"]:
+        identity += "|embedding"
+    if media_type != encoding.JSON_MEDIA_TYPE:
+        identity += f"|format={media_type}|quantize={quantize}"
+    return identity
+
+
+async def classify_spooled(source, key: str, start_time: float, options: dict,
+                           media_type: str = encoding.JSON_MEDIA_TYPE, quantize: str = "float16",
+                           admit: bool = True, predict=None) -> tuple:
+    """Classify a spooled upload through the result cache and return ``(content, cache_source)``.
+
+    Deletes ``source`` when it is a temporary file, unless analysis_store
+    keeps it for /visualize. ``admit`` and ``predict`` are passed on to
+    run_classification.
+    """
+    # The cache key doubles as the analysis id: same upload and options, same audio
+    analysis_id = None if options["visualization"] else key
+    
+    async def compute() -> bytes:
+        result = await run_classification(source, start_time, options["strategy"], options["k"], options["seed"],
+                                          options["timings"], options["visualization"], analysis_id,
+                                          options["embedding"], options["windows"], admit, predict)
+        stage_start = time.perf_counter()
+        content = encode_result(result, media_type, quantize)
+        STAGE_SECONDS.observe(time.perf_counter() - stage_start, stage="serialization")
+        return content
+    
+    kept_source = False
+    try:
+        content, cache_source = await result_cache.get_or_compute(key, compute)
+        if analysis_id is not None and analysis_id not in analysis_store:
+            # Cached result, or audio over the store budget: keep the upload to decode on demand
+            stored = {name: options[name] for name in ("strategy", "k", "seed", "windows")}
+            kept_source = analysis_store.put_source(analysis_id, source, stored)
+    except asyncio.CancelledError:
+        # The computation carries on for other callers and may still be reading this upload
+        pending = result_cache.pending(key)
+        if isinstance(source, str) and pending is not None:
+            pending.add_done_callback(lambda _: os.unlink(source))
+            kept_source = True
+        raise
+    finally:
+        if isinstance(source, str) and not kept_source:
+            os.unlink(source)
+    return content, cache_source
+
+
+class ArchiveReader:
+    """Audio members of an uploaded zip or tar archive, copied out one at a time on demand.
+
+    Opening reads only the member headers, so the file count can be checked
+    before any data is decompressed. Raises ValueError when ``fileobj`` is
+    neither a zip nor a tar archive.
+    """
+
+    def __init__(self, fileobj):
+        fileobj.seek(0)
+        if zipfile.is_zipfile(fileobj):
+            self._archive = zipfile.ZipFile(fileobj)
+            members = [(info.filename, info) for info in self._archive.infolist() if not info.is_dir()]
+            self._open = self._archive.open
+        else:
+            fileobj.seek(0)
+            try:
+                self._archive = tarfile.open(fileobj=fileobj, mode="r:*")
+            except tarfile.TarError:
+                raise ValueError("Archive must be a zip or tar file")
+            members = [(info.name, info) for info in self._archive.getmembers() if info.isfile()]
+            self._open = self._archive.extractfile
+        self.members = [(name, info) for name, info in members if name.lower().endswith(AUDIO_EXTENSIONS)]
+        # Members share the archive's file position
+        self._lock = threading.Lock()
+
+    def spool(self, name: str, info, identity: str) -> tuple:
+        """Copy one member out like spool_upload and return ``(source, key)``.
+
+        The size limit applies to the bytes actually decompressed, not the
+        size the header claims. Blocking; run it in a thread.
+        """
+        spool = UploadSpool(identity, os.path.splitext(name)[1])
+        try:
+            with self._lock, self._open(info) as member:
+                while True:
+                    chunk = member.read(UPLOAD_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    spool.append(chunk)
+        except BaseException:
+            spool.discard()
+            raise
+        return spool.finish()
+
+    def close(self):
+        self._archive.close()
+
+
+@app.post("/classify/batch", response_model=BatchClassificationResult)
+async def classify_batch(
+    files: List[UploadFile] = File(None),
+    archive: UploadFile = File(None),
+    strategy: str = Query("all", description="Segment sampling: all, uniform, energy or random"),
+    k: int = Query(DEFAULT_SAMPLE_WINDOWS, ge=1, description="Windows to classify for sampled strategies"),
+    seed: int = Query(None, description="Seed for the random and energy strategies"),
+    timings: bool = Query(False, description="Include per-stage timings (ms) in audioInfo"),
+    include: str = Query("", description="Comma-separated extras: visualization, embedding"),
+    windows: str = Query("", description="Comma-separated offset:duration time windows (seconds) to classify"),
+):
+    """
+    Classify many audio files in one request.
+    
+    Send the files as repeated ``files`` multipart fields, or as one zip or
+    tar ``archive`` whose audio members are classified. The options are
+    those of /classify and apply to every file. Up to BATCH_MAX_IN_FLIGHT
+    files are decoded concurrently, and their segments are stacked into
+    shared inference batches. The whole batch takes one admission slot.
+    
+    ``results`` holds one entry per file (``files`` fields first, then
+    archive members, each in order) with the ClassificationResult that
+    /classify would return (served from and stored in the same cache) or
+    the ``status`` and ``error`` it would have failed with. Only a bad
+    request as a whole (options, archive, file count) fails the batch.
+    """
+    start_time = time.time()
+    options = classify_options(strategy, k, seed, timings, include, windows)
+    
+    uploads = [("file", upload) for upload in files or []]
+    reader = None
+    if archive is not None:
+        try:
+            reader = await asyncio.to_thread(ArchiveReader, archive.file)
+        except (ValueError, zipfile.BadZipFile, tarfile.TarError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        uploads += [("archive", member) for member in reader.members]
+    try:
+        if not uploads:
+            raise HTTPException(status_code=400, detail="No audio files. Send files fields or a zip/tar archive.")
+        if len(uploads) > BATCH_MAX_FILES:
+            raise HTTPException(status_code=400, detail=f"Too many files. At most {BATCH_MAX_FILES} per request.")
+        return await classify_uploads(uploads, reader, options, start_time)
+    finally:
+        if reader is not None:
+            reader.close()
+
+
+async def classify_uploads(uploads: list, reader, options: dict, start_time: float) -> Response:
+    """Body of /classify/batch once the file count has been checked."""
+    identity = classification_identity(options)
+    in_flight = asyncio.Semaphore(BATCH_MAX_IN_FLIGHT)
+    # Segments of files decoded together go to the scheduler as one stack
+    stacker = SegmentStacker(inference_scheduler.predict, INFERENCE_MAX_BATCH_SIZE)
+    
+    async def classify_one(kind: str, upload) -> tuple:
+        """``(ok, item JSON)`` for one file."""
+        async with in_flight, stacker.job() as predict:
+            if kind == "file":
+                filename = upload.filename or ""
+            else:
+                filename, info = upload
+            item = {"filename": filename}
+            try:
+                if kind == "file":
+                    validate_upload(upload)
+                    source, key = await spool_upload(upload, identity)
+                else:
+                    source, key = await asyncio.to_thread(reader.spool, filename, info, identity)
+                content, cache_source = await classify_spooled(source, key, time.time(), options,
+                                                               admit=False, predict=predict)
+                item.update(status=200, cache=cache_source)
+            except HTTPException as e:
+                item["status"] = e.status_code
+                item["error"] = e.detail
+                return False, json.dumps(item).encode()
+            except Exception as e:
+                print(f"Batch classification error ({filename}): {e}")
+                item["status"] = 500
+                item["error"] = f"Classification failed: {str(e)}"
+                return False, json.dumps(item).encode()
+        # The cached bytes are a ClassificationResult already; splice them in rather than re-encode
+        return True, json.dumps(item).encode()[:-1] + b', "result": ' + content + b"}"
+    
+    if not admission.try_acquire():
+        reject_busy()
+    try:
+        try:
+            # Fail the batch as a whole, not every file, if the model is unavailable
+            await ensure_model()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Classification failed: {str(e)}")
+        items = await asyncio.gather(*(classify_one(kind, upload) for kind, upload in uploads))
+    finally:
+        admission.release()
+    
+    failed = sum(not ok for ok, _ in items)
+    content = (
+        b'{"results": [' + b", ".join(item for _, item in items) + b"], "
+        + f'"failed": {failed}, "processingTime": {(time.time() - start_time) * 1000}}}'.encode()
+    )
+    return Response(content=content, media_type=encoding.JSON_MEDIA_TYPE)
+
+
+ANALYSIS_NOT_FOUND = "Analysis not found or expired. Classify the file again."
+
+
+async def analysis_audio(analysis_id: str) -> tuple:
+    """``(audio, signal_windows)`` for a stored analysis, re-decoding the kept upload if that is all there is.
+
+    ``signal_windows`` is as returned by decode_analysis_audio.
+    """
+    entry = analysis_store.get(analysis_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=ANALYSIS_NOT_FOUND)
+    if entry.audio is not None:
+        return entry.audio, entry.options.get("signalWindows")
+    
+    options = entry.options
+    stage_start = time.perf_counter()
+    try:
+        audio, signal_windows = await asyncio.get_running_loop().run_in_executor(
+            feature_executor,
+            functools.partial(decode_analysis_audio, entry.source, options["strategy"], options["k"],
+                              options["seed"], options.get("windows")),
+        )
+    except FileNotFoundError:
+        # A concurrent call promoted the entry (or it was evicted) while we waited for a worker
+        entry = analysis_store.get(analysis_id)
+        if entry is None or entry.audio is None:
+            raise HTTPException(status_code=404, detail=ANALYSIS_NOT_FOUND)
+        return entry.audio, entry.options.get("signalWindows")
+    STAGE_SECONDS.observe(time.perf_counter() - stage_start, stage="decode")
+    options["signalWindows"] = signal_windows
+    analysis_store.promote(analysis_id, audio)
+    return audio, signal_windows
+
+
+@app.get("/visualize/{analysis_id}", response_model=VisualizationResult)
+async def visualize(
+    analysis_id: str,
+    features: str = Query("", description="Comma-separated visualization features (default: all)"),
+    quantize: str = Query("float16", description="Array encoding for binary responses: float16, uint8 or float32"),
+    accept: str = Header(None),
+):
+    """
+    Compute visualization features for an earlier /classify call.
+    
+    ``analysis_id`` is the ``analysisId`` of a /classify response made
+    without ``include=visualization``; it stays valid for
+    ANALYSIS_TTL_SECONDS (404 afterwards). ``features`` limits the work to
+    the named arrays. Supports the same Accept negotiation as /classify.
+    """
+    wanted = parse_list(features, VIZ_FEATURES, "features") or VIZ_FEATURES
+    media_type = encoding.negotiate(accept)
+    if media_type != encoding.JSON_MEDIA_TYPE and quantize not in encoding.QUANTIZATIONS:
+        raise HTTPException(status_code=400, detail=f"Invalid quantize. Choose one of: {', '.join(encoding.QUANTIZATIONS)}")
+    if analysis_id not in analysis_store:
+        raise HTTPException(status_code=404, detail=ANALYSIS_NOT_FOUND)
+    
+    if not admission.try_acquire():
+        reject_busy()
+    try:
+        audio, signal_windows = await analysis_audio(analysis_id)
+        stage_start = time.perf_counter()
+        visualization = await asyncio.get_running_loop().run_in_executor(
+            feature_executor, functools.partial(extract_visualization_data, audio, SAMPLE_RATE, wanted)
+        )
+        STAGE_SECONDS.observe(time.perf_counter() - stage_start, stage="visualization")
+        if signal_windows is not None:
+            visualization["windows"] = signal_windows
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Visualization error: {e}")
+        raise HTTPException(status_code=500, detail=f"Visualization failed: {str(e)}")
+    finally:
+        admission.release()
+    
+    result = {"analysisId": analysis_id, "visualization": visualization}
+    if media_type == encoding.JSON_MEDIA_TYPE:
+        content = VisualizationResult(
+            analysisId=analysis_id, visualization=_visualization_model(visualization)
+        ).model_dump_json(exclude_none=True).encode()
+    else:
+        content = encoding.encode(result, media_type, quantize)
+    return Response(content=content, media_type=media_type, headers={"Vary": "Accept"})
+
+
+def require_similarity_index():
+    if similarity_index is None:
+        raise HTTPException(status_code=503, detail="No similarity index is loaded. Set SIMILARITY_INDEX_DIR.")
+    return similarity_index
+
+
+async def search_similar(query: np.ndarray, k: int, n_probe: int = None, exclude: str = None) -> SimilarResult:
+    """Top-``k`` catalog neighbours of an embedding, searched off the event loop."""
+    index = require_similarity_index()
+    if len(query) != index.dim:
+        raise HTTPException(
+            status_code=409,
+            detail=f"The similarity index holds {index.dim}-dimensional embeddings but the model produces {len(query)}.",
+        )
+    start = time.perf_counter()
+    # One extra neighbour so the query track itself can be dropped
+    ids, scores = await asyncio.get_running_loop().run_in_executor(
+        None, functools.partial(index.search, query, k + (exclude is not None), n_probe=n_probe)
+    )
+    search_seconds = time.perf_counter() - start
+    STAGE_SECONDS.observe(search_seconds, stage="similarity_search")
+    results = [SimilarTrack(track=track, score=float(score)) for track, score in zip(ids, scores) if track != exclude]
+    return SimilarResult(query=exclude, results=results[:k], searchMs=search_seconds * 1000, index=index.stats())
+
+
+@app.get("/similar", response_model=SimilarResult)
+async def similar_to_track(
+    track: str = Query(..., description="Catalog id of the query track"),
+    k: int = Query(10, ge=1, le=SIMILARITY_MAX_K, description="Neighbours to return"),
+    n_probe: int = Query(None, ge=1, description="IVF lists to scan (more is slower and more exact)"),
+):
+    """Tracks most similar to a catalog track, by cosine similarity of their embeddings."""
+    index = require_similarity_index()
+    # The first lookup sorts every id in the index; keep it off the event loop
+    query = await asyncio.get_running_loop().run_in_executor(None, index.vector, track)
+    if query is None:
+        raise HTTPException(status_code=404, detail=f"Track not in the similarity index: {track}")
+    return await search_similar(query, k, n_probe, exclude=track)
+
+
+@app.post("/similar", response_model=SimilarResult)
+async def similar_to_upload(
+    file: UploadFile = File(...),
+    k: int = Query(10, ge=1, le=SIMILARITY_MAX_K, description="Neighbours to return"),
+    n_probe: int = Query(None, ge=1, description="IVF lists to scan (more is slower and more exact)"),
+):
+    """Catalog tracks most similar to an uploaded audio file."""
+    start_time = time.time()
+    validate_upload(file)
+    require_similarity_index()
+    source, _ = await spool_upload(file, model_identity())
+    try:
+        result = await run_classification(source, start_time, include_visualization=False, include_embedding=True)
+    finally:
+        if isinstance(source, str):
+            os.unlink(source)
+    return await search_similar(result["embedding"], k, n_probe)
+
+
+def build_playlist(request: PlaylistRequest) -> dict:
+    preferences = request.preferences
+    prefs = playlist.Preferences(
+        playlist_catalog,
+        preferred_genres=preferences.preferredGenres,
+        favorite_artists=preferences.favoriteArtists,
+        preferred_languages=preferences.preferredLanguages,
+        liked_song_ids=preferences.likedSongIds,
+    )
+    return playlist.generate_playlist(
+        playlist_catalog, request.currentMood, request.targetMood, prefs, request.playlistLength
+    )
+
+
+@app.post("/playlist", response_model=PlaylistResult)
+async def create_playlist(request: PlaylistRequest):
+    """A mood-transition playlist from the server catalog, as generateMoodPlaylist builds it in the browser."""
+    if playlist_catalog is None:
+        raise HTTPException(status_code=503, detail="No playlist catalog is loaded. Set PLAYLIST_CATALOG.")
+    for mood in (request.currentMood, request.targetMood):
+        if mood not in playlist.MOOD_POINTS:
+            raise HTTPException(
+                status_code=400, detail=f"Unknown mood: {mood}. Choose from {', '.join(playlist.MOOD_POINTS)}."
+            )
+    if not 1 <= request.playlistLength <= PLAYLIST_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail=f"playlistLength must be between 1 and {PLAYLIST_MAX_LENGTH}.")
+    start = time.perf_counter()
+    result = await asyncio.get_running_loop().run_in_executor(None, build_playlist, request)
+    STAGE_SECONDS.observe(time.perf_counter() - start, stage="playlist")
+    return result
+
+
+def _sse_event(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+class ProgressiveStream:
+    """The admission slot, spooled upload and batch generator held by one /classify/stream response.
+
+    ``next_batch`` advances the generator in a worker thread. ``release``
+    frees everything exactly once; while a ``next_batch`` is still running
+    (say the client went away mid-decode) it waits for it to return, since
+    closing a running generator raises ``ValueError``.
+    """
+
+    def __init__(self, source, batches):
+        self.source = source
+        self.batches = batches
+        self._busy = False
+        self._released = False
+
+    async def next_batch(self):
+        """The next model-ready batch, or None at the end."""
+        loop = asyncio.get_running_loop()
+        executor = feature_executor if isinstance(feature_executor, ThreadPoolExecutor) else None
         
-        # Sort by confidence
-        genre_predictions.sort(key=lambda x: x.confidence, reverse=True)
+        def step():
+            try:
+                return next(self.batches, None)
+            finally:
+                loop.call_soon_threadsafe(self._stepped)
         
-        processing_time = time.time() - start_time
+        self._busy = True
+        # Shielded so a cancelled request still lets the step run and report back
+        return await asyncio.shield(loop.run_in_executor(executor, step))
+
+    def _stepped(self):
+        self._busy = False
+        if self._released:
+            self._close()
+
+    def release(self):
+        """Close the generator, free the admission slot and delete the spooled upload, once."""
+        if self._released:
+            return
+        self._released = True
+        if not self._busy:
+            self._close()
+
+    def _close(self):
+        try:
+            self.batches.close()
+        except Exception as e:
+            print(f"Progressive decode cleanup error: {e}")
+        finally:
+            admission.release()
+            if isinstance(self.source, str):
+                os.unlink(self.source)
+
+
+class ReleasingStreamingResponse(StreamingResponse):
+    """StreamingResponse that calls ``release()`` however sending ends, even before the body starts."""
+
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
+
+async def progressive_events(stream: ProgressiveStream, num_segments: int, duration: float, start_time: float,
+                             early_exit: bool, min_segments: int, z: float):
+    """Classify batch by batch, yielding running averages as Server-Sent Events."""
+    prob_sum = np.zeros(len(GTZAN_GENRES))
+    prob_sq_sum = np.zeros(len(GTZAN_GENRES))
+    processed = 0
+    converged = False
+    try:
+        while True:
+            batch = await stream.next_batch()
+            if batch is None:
+                break
+            predictions, _ = split_outputs(await inference_scheduler.predict(batch))
+            prob_sum += predictions.sum(axis=0)
+            prob_sq_sum += (predictions.astype(np.float64) ** 2).sum(axis=0)
+            processed += len(predictions)
+            
+            mean = prob_sum / processed
+            genre_predictions = rank_genres(mean)
+            yield _sse_event("progress", {
+                "predictions": [p.model_dump() for p in genre_predictions],
+                "topGenre": genre_predictions[0].genre,
+                "topConfidence": genre_predictions[0].confidence,
+                "segmentsProcessed": processed,
+                "totalSegments": num_segments,
+                "elapsedMs": (time.time() - start_time) * 1000,
+            })
+            
+            if early_exit and processed >= min_segments and predictions_converged(
+                mean, prob_sq_sum / processed, processed, z
+            ):
+                converged = True
+                break
         
-        return ClassificationResult(
-            predictions=genre_predictions,
-            topGenre=genre_predictions[0].genre,
-            topConfidence=genre_predictions[0].confidence,
-            processingTime=processing_time * 1000,  # Convert to ms
-            audioInfo={
+        yield _sse_event("result", {
+            "predictions": [p.model_dump() for p in genre_predictions],
+            "topGenre": genre_predictions[0].genre,
+            "topConfidence": genre_predictions[0].confidence,
+            "processingTime": (time.time() - start_time) * 1000,
+            "earlyExit": converged,
+            "audioInfo": {
                 "duration": duration,
                 "numSegments": num_segments,
-                "sampleRate": SAMPLE_RATE
+                "segmentsProcessed": processed,
+                "sampleRate": SAMPLE_RATE,
             },
-            visualization=VisualizationData(**viz_data)
-        )
-        
-    except HTTPException:
-        raise
+        })
     except Exception as e:
         print(f"Classification error: {e}")
+        yield _sse_event("error", {"detail": f"Classification failed: {str(e)}"})
+    finally:
+        stream.release()
+
+
+@app.post("/classify/stream")
+async def classify_audio_stream(
+    file: UploadFile = File(...),
+    early_exit: bool = False,
+    min_segments: int = PROGRESSIVE_MIN_SEGMENTS,
+    z: float = 1.96,
+):
+    """
+    Classify progressively, streaming running predictions as Server-Sent Events.
+    
+    Emits a ``progress`` event with the running averaged predictions after
+    each batch of segments, then a final ``result`` event. With
+    ``early_exit=true`` decoding and inference stop once at least
+    ``min_segments`` are in and the top genre's ``z``-score confidence
+    interval no longer overlaps the runner-up's. No visualization is computed.
+    """
+    start_time = time.time()
+    validate_upload(file)
+    source, _ = await spool_upload(file, model_identity())
+    
+    def discard_source():
+        if isinstance(source, str):
+            os.unlink(source)
+    
+    if not admission.try_acquire():
+        discard_source()
+        reject_busy()
+    
+    try:
+        await ensure_model()
+        num_segments, duration, batches = await asyncio.to_thread(open_segment_stream, source)
+        if num_segments == 0:
+            raise HTTPException(status_code=400, detail="Audio file too short. Minimum duration is ~1.5 seconds.")
+    except BaseException as e:
+        admission.release()
+        discard_source()
+        if isinstance(e, HTTPException) or not isinstance(e, Exception):
+            raise
+        print(f"Classification error: {e}")
         raise HTTPException(status_code=500, detail=f"Classification failed: {str(e)}")
+    
+    stream = ProgressiveStream(source, batches)
+    return ReleasingStreamingResponse(
+        progressive_events(stream, num_segments, duration, start_time, early_exit, min_segments, z),
+        stream.release,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
 
 
 if __name__ == "__main__":
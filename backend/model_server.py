@@ -0,0 +1,287 @@
+"""
+Dedicated model process with shared-memory tensor handoff
+
+``serve.py`` runs N HTTP workers (each one a copy of main.app that decodes
+audio and computes model inputs) and one model process that holds the only
+copy of the model. Once the model is loaded, the model process creates a
+shared-memory segment per worker with a few slots, each holding one batch
+of inputs and its outputs. A worker copies a mel batch into a free slot and
+sends ``("predict", id, slot, rows)`` down its pipe; the model process reads
+the inputs in place, writes the outputs back into the slot and replies
+``(id, error)``. Only those small tuples are pickled.
+
+The model process runs an InferenceScheduler over the requests of every
+worker, so batches fill across workers as well as across requests.
+"""
+
+import asyncio
+import itertools
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import List
+
+import numpy as np
+
+from batching import InferenceScheduler
+
+
+class SlotBuffers:
+    """Inputs and outputs for ``slots`` batches of up to ``capacity`` segments, in one shared-memory segment."""
+
+    def __init__(self, shm: SharedMemory, slots: int, capacity: int, input_shape: tuple, width: int):
+        self.shm = shm
+        self.slots = slots
+        self.capacity = capacity
+        self.input_shape = tuple(input_shape)
+        self.width = width
+        self.inputs = np.ndarray((slots, capacity) + self.input_shape, dtype=np.float32, buffer=shm.buf)
+        self.outputs = np.ndarray((slots, capacity, width), dtype=np.float32, buffer=shm.buf,
+                                  offset=self.inputs.nbytes)
+
+    @classmethod
+    def create(cls, slots: int, capacity: int, input_shape: tuple, width: int) -> "SlotBuffers":
+        size = slots * capacity * (int(np.prod(input_shape)) + width) * np.dtype(np.float32).itemsize
+        return cls(SharedMemory(create=True, size=size), slots, capacity, input_shape, width)
+
+    @classmethod
+    def attach(cls, spec: dict) -> "SlotBuffers":
+        return cls(_attach_shared_memory(spec["name"]), spec["slots"], spec["capacity"], spec["inputShape"],
+                   spec["width"])
+
+    def spec(self) -> dict:
+        return {"name": self.shm.name, "slots": self.slots, "capacity": self.capacity,
+                "inputShape": list(self.input_shape), "width": self.width}
+
+    def close(self, unlink: bool = False):
+        # The array views must go before the mapping can be closed
+        self.inputs = self.outputs = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _attach_shared_memory(name: str) -> SharedMemory:
+    """Map a segment the model process created (and will unlink) without registering it with the resource tracker.
+
+    Before Python 3.13 attaching registers it too. serve.py's processes share
+    one tracker, so unregistering afterwards would drop the creator's entry.
+    """
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        pass  # Python < 3.13
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def run_model_process(connections: list):
+    """Model process entry point: load the model, then serve every worker connection until all close."""
+    import main
+
+    input_shape = (main.N_MELS, main.EXPECTED_TIME_FRAMES, 1)
+    start = time.perf_counter()
+    try:
+        main.warm_up_model()
+        width = main.predict_outputs(np.zeros((1,) + input_shape, dtype=np.float32)).shape[1]
+    except Exception as e:
+        print(f"Model process: could not load the model: {e}")
+        for connection in connections:
+            connection.send(("failed", str(e)))
+        return
+    # Unlink the shared memory on terminate too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    warmup_ms = (time.perf_counter() - start) * 1000
+    print(f"Model process: model loaded and warmed up in {warmup_ms:.0f} ms, serving {len(connections)} workers")
+
+    buffers = [
+        SlotBuffers.create(main.MODEL_SERVER_SLOTS, main.INFERENCE_MAX_BATCH_SIZE, input_shape, width)
+        for _ in connections
+    ]
+    try:
+        for connection, worker_buffers in zip(connections, buffers):
+            connection.send(("ready", worker_buffers.spec(), warmup_ms))
+        asyncio.run(_serve(connections, buffers, main))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for worker_buffers in buffers:
+            worker_buffers.close(unlink=True)
+
+
+async def _serve(connections: list, buffers: List[SlotBuffers], main):
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+    scheduler = InferenceScheduler(
+        main.predict_outputs,
+        max_batch_size=main.INFERENCE_MAX_BATCH_SIZE,
+        max_wait_ms=main.INFERENCE_MAX_WAIT_MS,
+        executor=executor,
+    )
+    scheduler.start()
+    open_workers = set(range(len(connections)))
+    all_closed = asyncio.Event()
+
+    async def predict(worker: int, request_id: int, slot: int, rows: int):
+        worker_buffers = buffers[worker]
+        try:
+            # A view into the worker's slot; the worker leaves it alone until the reply
+            outputs = await scheduler.predict(worker_buffers.inputs[slot, :rows])
+            worker_buffers.outputs[slot, :rows] = outputs
+            reply = (request_id, None)
+        except Exception as e:
+            reply = (request_id, f"{type(e).__name__}: {e}")
+        try:
+            connections[worker].send(reply)
+        except OSError:
+            pass  # the worker has gone
+
+    def on_readable(worker: int):
+        connection = connections[worker]
+        try:
+            while connection.poll():
+                kind, *message = connection.recv()
+                if kind == "predict":
+                    loop.create_task(predict(worker, *message))
+        except (EOFError, OSError):
+            loop.remove_reader(connection.fileno())
+            open_workers.discard(worker)
+            if not open_workers:
+                all_closed.set()
+
+    for worker, connection in enumerate(connections):
+        loop.add_reader(connection.fileno(), on_readable, worker)
+    await all_closed.wait()
+    await scheduler.stop()
+    executor.shutdown(wait=False)
+
+
+class RemoteInference:
+    """InferenceScheduler stand-in for an HTTP worker: predictions run in the model process."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.buffers = None
+        self.ready = None
+        self._loop = None
+        self._free = None
+        self._pending = {}  # request id -> (future, slot, rows)
+        self._ids = itertools.count()
+        self.model_warmup_ms = None
+
+        self.requests = 0
+        self.chunks = 0
+        self.segments = 0
+        self.slot_wait_ms = 0.0
+
+    def start(self):
+        """Start listening for the model process on the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self.ready = self._loop.create_future()
+        self._free = asyncio.Queue()
+        self._loop.add_reader(self.connection.fileno(), self._on_readable)
+
+    async def stop(self):
+        """Disconnect from the model process and fail any outstanding predictions."""
+        if self._loop is not None:
+            self._loop.remove_reader(self.connection.fileno())
+        self._fail(RuntimeError("Inference stopped"))
+        self.connection.close()
+        if self.buffers is not None:
+            self.buffers.close()
+            self.buffers = None
+
+    async def wait_ready(self):
+        """Wait until the model process has loaded the model; raises if it could not."""
+        await asyncio.shield(self.ready)
+
+    async def predict(self, batch: np.ndarray) -> np.ndarray:
+        """Return per-segment outputs for ``batch`` from the model process."""
+        await self.wait_ready()
+        capacity = self.buffers.capacity
+        self.requests += 1
+        results = await asyncio.gather(*(
+            self._predict_chunk(batch[start:start + capacity]) for start in range(0, len(batch), capacity)
+        ))
+        return results[0] if len(results) == 1 else np.concatenate(results, axis=0)
+
+    async def _predict_chunk(self, chunk: np.ndarray) -> np.ndarray:
+        start = time.perf_counter()
+        slot = await self._free.get()
+        self.slot_wait_ms += (time.perf_counter() - start) * 1000
+        rows = len(chunk)
+        self.buffers.inputs[slot, :rows] = chunk
+        request_id = next(self._ids)
+        future = self._loop.create_future()
+        # The slot is returned when the reply arrives, even if this request is cancelled first
+        self._pending[request_id] = (future, slot, rows)
+        try:
+            self.connection.send(("predict", request_id, slot, rows))
+        except OSError as e:
+            del self._pending[request_id]
+            self._free.put_nowait(slot)
+            raise RuntimeError(f"Model process unavailable: {e}")
+        self.chunks += 1
+        self.segments += rows
+        return await future
+
+    def _on_readable(self):
+        try:
+            while self.connection.poll():
+                self._dispatch(self.connection.recv())
+        except (EOFError, OSError):
+            self._loop.remove_reader(self.connection.fileno())
+            self._fail(RuntimeError("Model process exited"))
+
+    def _dispatch(self, message: tuple):
+        if message[0] == "ready":
+            self.buffers = SlotBuffers.attach(message[1])
+            self.model_warmup_ms = message[2]
+            for slot in range(self.buffers.slots):
+                self._free.put_nowait(slot)
+            self.ready.set_result(None)
+        elif message[0] == "failed":
+            self.ready.set_exception(RuntimeError(message[1]))
+        else:
+            request_id, error = message
+            entry = self._pending.pop(request_id, None)
+            if entry is None:
+                # A late reply after _fail() has already failed every pending request
+                return
+            future, slot, rows = entry
+            if not future.done():
+                if error is None:
+                    future.set_result(self.buffers.outputs[slot, :rows].copy())
+                else:
+                    future.set_exception(RuntimeError(error))
+            self._free.put_nowait(slot)
+
+    def _fail(self, error: Exception):
+        if self.ready is not None and not self.ready.done():
+            self.ready.set_exception(error)
+        for future, _, _ in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+
+    def stats(self) -> dict:
+        """Handoff statistics for this worker since startup."""
+        return {
+            "mode": "model-process",
+            "ready": self.buffers is not None,
+            "slots": self.buffers.slots if self.buffers is not None else None,
+            "slotCapacity": self.buffers.capacity if self.buffers is not None else None,
+            "freeSlots": self._free.qsize() if self._free is not None else 0,
+            "requests": self.requests,
+            "chunks": self.chunks,
+            "segments": self.segments,
+            "avgSlotWaitMs": self.slot_wait_ms / self.chunks if self.chunks else 0.0,
+            "modelWarmupMs": self.model_warmup_ms,
+        }
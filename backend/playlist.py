@@ -0,0 +1,397 @@
+"""
+Mood playlist engine over a columnar song catalog
+
+A server-side port of ``generateMoodPlaylist`` from src/lib/moodEngine.ts
+that scales to catalogs of millions of songs. The rules stay the same:
+one song per step of the interpolated mood path, chosen by the same
+weighted score, with the same explanations and metrics. Ties go to the
+earlier catalog entry. The work per step is different:
+
+* The catalog is held as NumPy columns (valence and energy as float64, so
+  scores match the TypeScript engine bit for bit). Genre, artist and
+  language are stored as integer codes.
+* Songs are bucketed into a uniform grid on (valence, energy), stored
+  cell by cell, so a block of cells is a few contiguous slices.
+* Each step scores only the cells around its target, vectorized, and
+  grows the block until no song outside it could score higher. Liked
+  songs and songs by favourite artists are few, so they are scored at
+  every step; the genre and language bonuses left over are small, which
+  keeps the test exact and the block tight.
+* Preferences become boolean lookup tables over the genre, artist and
+  language codes. Liked and already-used songs are sets of catalog rows.
+
+Catalogs load from a JSON array of Song objects (the shape in
+src/data/songs.ts) or from a columnar ``.npz`` written by ``Catalog.save``.
+
+Usage:
+    python backend/playlist.py import-songs src/data/songs.ts catalog.json
+"""
+
+import argparse
+import json
+import math
+import re
+from typing import Dict, List
+
+import numpy as np
+
+# Mirrors moodPoints in src/data/songs.ts
+MOOD_POINTS = {
+    "sad": (0.15, 0.2),
+    "calm": (0.4, 0.25),
+    "happy": (0.8, 0.6),
+    "energetic": (0.7, 0.9),
+    "angry": (0.15, 0.85),
+}
+
+# Score weights and bonuses from scoreSong in moodEngine.ts
+MOOD_WEIGHT = 0.5
+GENRE_BONUS, GENRE_WEIGHT = 0.15, 0.15
+ARTIST_BONUS, ARTIST_WEIGHT = 0.15, 0.1
+LANGUAGE_BONUS, LANGUAGE_PENALTY, LANGUAGE_WEIGHT = 0.2, -0.3, 0.2
+LIKED_BONUS, LIKED_WEIGHT = 0.1, 0.05
+BOUND_MARGIN = 1e-9
+
+GRID_SONGS_PER_CELL = 32
+GRID_MAX_SIZE = 1024
+
+
+def _js_round(x: float) -> int:
+    """Math.round: halves round up, unlike Python's round()."""
+    return math.floor(x + 0.5)
+
+
+def _distance(v1: float, a1: float, v2: float, a2: float) -> float:
+    return math.sqrt((v1 - v2) ** 2 + (a1 - a2) ** 2)
+
+
+class Catalog:
+    """Songs as columns, bucketed into a (valence, energy) grid.
+
+    Rows are stored in grid order; ``order`` maps them back to the catalog
+    order used for tie-breaking.
+    """
+
+    TEXT_COLUMNS = ("id", "title")
+    CODED_COLUMNS = ("artist", "genre", "language")
+    NUMERIC_COLUMNS = ("valence", "energy", "tempo", "crnnConfidence")
+
+    def __init__(self, columns: Dict[str, np.ndarray], vocab: Dict[str, List[str]]):
+        n = len(columns["id"])
+        self.vocab = vocab
+        self.size = n
+        self.grid = max(1, min(GRID_MAX_SIZE, int(math.sqrt(n / GRID_SONGS_PER_CELL))))
+        cells = self._cell_index(columns["valence"], columns["energy"])
+        # Stable sort keeps catalog order within a cell
+        order = np.argsort(cells, kind="stable")
+        self.order = order
+        self.columns = {name: column[order] for name, column in columns.items()}
+        self.cell_offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(cells, minlength=self.grid * self.grid))]
+        ).astype(np.int64)
+        self._codes = {name: {value: code for code, value in enumerate(vocab[name])} for name in self.CODED_COLUMNS}
+        self._id_order = np.argsort(self.columns["id"], kind="stable")
+        self._sorted_ids = self.columns["id"][self._id_order]
+        # Rows grouped by artist, for favourite-artist lookups
+        self._artist_rows = np.argsort(self.columns["artist"], kind="stable")
+        self._artist_offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(self.columns["artist"], minlength=len(vocab["artist"])))]
+        ).astype(np.int64)
+
+    def _cell_coords(self, values: np.ndarray) -> np.ndarray:
+        # Values outside [0, 1] fall into the border cells
+        return np.clip((np.asarray(values) * self.grid).astype(np.int64), 0, self.grid - 1)
+
+    def _cell_index(self, valence: np.ndarray, energy: np.ndarray) -> np.ndarray:
+        return self._cell_coords(energy) * self.grid + self._cell_coords(valence)
+
+    @classmethod
+    def from_songs(cls, songs: List[dict]) -> "Catalog":
+        vocab = {name: sorted({song[name] for song in songs}) for name in cls.CODED_COLUMNS}
+        codes = {name: {value: code for code, value in enumerate(vocab[name])} for name in cls.CODED_COLUMNS}
+        columns = {name: np.array([str(song[name]) for song in songs], dtype=object) for name in cls.TEXT_COLUMNS}
+        for name in cls.CODED_COLUMNS:
+            columns[name] = np.array([codes[name][song[name]] for song in songs], dtype=np.int32)
+        for name in cls.NUMERIC_COLUMNS:
+            columns[name] = np.array([song.get(name, np.nan) for song in songs], dtype=np.float64)
+        return cls(columns, vocab)
+
+    @classmethod
+    def load(cls, path: str) -> "Catalog":
+        """Load a JSON array of songs or a ``.npz`` written by save()."""
+        if path.endswith(".npz"):
+            data = np.load(path, allow_pickle=True)
+            columns = {name: data[name] for name in cls.TEXT_COLUMNS + cls.CODED_COLUMNS + cls.NUMERIC_COLUMNS}
+            vocab = {name: list(data[f"vocab_{name}"]) for name in cls.CODED_COLUMNS}
+            return cls(columns, vocab)
+        with open(path) as f:
+            return cls.from_songs(json.load(f))
+
+    def save(self, path: str):
+        """Write the columns (in catalog order) and vocabularies as ``.npz``."""
+        inverse = np.empty_like(self.order)
+        inverse[self.order] = np.arange(self.size)
+        np.savez(
+            path,
+            **{name: column[inverse] for name, column in self.columns.items()},
+            **{f"vocab_{name}": np.array(values, dtype=object) for name, values in self.vocab.items()},
+        )
+
+    def code_mask(self, column: str, values) -> np.ndarray:
+        """Boolean lookup table over ``column``'s codes: True for the given values."""
+        mask = np.zeros(len(self.vocab[column]), dtype=bool)
+        codes = self._codes[column]
+        mask[[codes[value] for value in set(values) if value in codes]] = True
+        return mask
+
+    def rows_for_ids(self, ids) -> np.ndarray:
+        """Stored rows of the given song ids; unknown ids are skipped."""
+        ids = np.array(sorted(set(ids)), dtype=object)
+        if len(ids) == 0 or self.size == 0:
+            return np.empty(0, dtype=np.int64)
+        positions = np.searchsorted(self._sorted_ids, ids)
+        positions = np.minimum(positions, self.size - 1)
+        found = self._sorted_ids[positions] == ids
+        return np.sort(self._id_order[positions[found]])
+
+    def artist_rows(self, artist_mask: np.ndarray) -> np.ndarray:
+        """Stored rows of every artist whose code is set in ``artist_mask``."""
+        codes = np.flatnonzero(artist_mask)
+        return np.concatenate(
+            [self._artist_rows[self._artist_offsets[code]:self._artist_offsets[code + 1]] for code in codes]
+            + [np.empty(0, dtype=np.int64)]
+        )
+
+    def block_rows(self, cx0: int, cx1: int, cy0: int, cy1: int) -> np.ndarray:
+        """Rows in cells [cx0, cx1] x [cy0, cy1]: one contiguous slice per grid row."""
+        starts = self.cell_offsets[np.arange(cy0, cy1 + 1) * self.grid + cx0]
+        ends = self.cell_offsets[np.arange(cy0, cy1 + 1) * self.grid + cx1 + 1]
+        return np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+
+    def song(self, row: int) -> dict:
+        song = {
+            "id": self.columns["id"][row],
+            "title": self.columns["title"][row],
+            "artist": self.vocab["artist"][self.columns["artist"][row]],
+            "genre": self.vocab["genre"][self.columns["genre"][row]],
+            "language": self.vocab["language"][self.columns["language"][row]],
+            "valence": float(self.columns["valence"][row]),
+            "energy": float(self.columns["energy"][row]),
+            "tempo": float(self.columns["tempo"][row]),
+        }
+        confidence = self.columns["crnnConfidence"][row]
+        if not np.isnan(confidence):
+            song["crnnConfidence"] = float(confidence)
+        return song
+
+
+class Preferences:
+    """UserPreferences compiled against a catalog."""
+
+    def __init__(self, catalog: Catalog, preferred_genres=(), favorite_artists=(), preferred_languages=(),
+                 liked_song_ids=()):
+        self.genres = catalog.code_mask("genre", preferred_genres)
+        self.artists = catalog.code_mask("artist", favorite_artists)
+        # No language preference means every language matches
+        self.any_language = len(preferred_languages) == 0
+        self.languages = catalog.code_mask("language", preferred_languages)
+        self.liked_rows = catalog.rows_for_ids(liked_song_ids)
+        # Liked and favourite-artist songs are few; every search scores them directly,
+        # which caps the bonus any other song can reach at genre + language
+        self.special_rows = np.union1d(self.liked_rows, catalog.artist_rows(self.artists)).astype(np.int64)
+        self.regular_bonus = (GENRE_BONUS * GENRE_WEIGHT if self.genres.any() else 0.0) + LANGUAGE_BONUS * LANGUAGE_WEIGHT
+
+
+def score_rows(catalog: Catalog, rows: np.ndarray, valence: float, arousal: float, prefs: Preferences,
+               used_rows: np.ndarray) -> tuple:
+    """scoreSong for many rows at once: ``(scores, genre_match, artist_match, language_match)``."""
+    columns = catalog.columns
+    mood_score = 1 - np.sqrt((columns["valence"][rows] - valence) ** 2 + (columns["energy"][rows] - arousal) ** 2)
+    genre_match = prefs.genres[columns["genre"][rows]]
+    artist_match = prefs.artists[columns["artist"][rows]]
+    language_match = (np.ones(len(rows), dtype=bool) if prefs.any_language
+                      else prefs.languages[columns["language"][rows]])
+    liked = np.isin(rows, prefs.liked_rows)
+    # Same operation order as moodEngine.ts so equal inputs give equal floats
+    scores = (mood_score * MOOD_WEIGHT
+              + np.where(genre_match, GENRE_BONUS, 0.0) * GENRE_WEIGHT
+              + np.where(artist_match, ARTIST_BONUS, 0.0) * ARTIST_WEIGHT
+              + np.where(language_match, LANGUAGE_BONUS, LANGUAGE_PENALTY) * LANGUAGE_WEIGHT
+              + np.where(liked, LIKED_BONUS, 0.0) * LIKED_WEIGHT)
+    scores[np.isin(rows, used_rows)] = -np.inf
+    return scores, genre_match, artist_match, language_match
+
+
+def best_row(catalog: Catalog, valence: float, arousal: float, prefs: Preferences, used_rows: np.ndarray,
+             exhaustive: bool = False):
+    """The best-scoring unused song for one mood target, or None.
+
+    Scores the preference's special songs plus a block of grid cells around
+    the target, growing the block until the best score found beats anything
+    a song outside it could reach. ``exhaustive`` scores the whole catalog
+    instead (the reference scan).
+    """
+    if catalog.size == 0:
+        return None
+    grid = catalog.grid
+    cx, cy = int(catalog._cell_coords(valence)), int(catalog._cell_coords(arousal))
+    radius = grid if exhaustive else 0
+    while True:
+        cx0, cx1 = max(cx - radius, 0), min(cx + radius, grid - 1)
+        cy0, cy1 = max(cy - radius, 0), min(cy + radius, grid - 1)
+        rows = np.concatenate([prefs.special_rows, catalog.block_rows(cx0, cx1, cy0, cy1)])
+        whole_grid = cx0 == 0 and cy0 == 0 and cx1 == grid - 1 and cy1 == grid - 1
+        if len(rows):
+            scores, genre_match, artist_match, language_match = score_rows(
+                catalog, rows, valence, arousal, prefs, used_rows
+            )
+            best = scores.max()
+            if best > -np.inf:
+                # Songs outside the block are at least this far away (border sides have no outside)
+                gaps = [valence - cx0 / grid if cx0 > 0 else np.inf,
+                        (cx1 + 1) / grid - valence if cx1 < grid - 1 else np.inf,
+                        arousal - cy0 / grid if cy0 > 0 else np.inf,
+                        (cy1 + 1) / grid - arousal if cy1 < grid - 1 else np.inf]
+                outside_bound = MOOD_WEIGHT * (1 - max(min(gaps), 0.0)) + prefs.regular_bonus
+                # Strictly above, with room for rounding: an outside song could tie and come first
+                if whole_grid or best > outside_bound + BOUND_MARGIN:
+                    # Ties go to the earliest song in catalog order, as in the linear scan
+                    tied = np.flatnonzero(scores == best)
+                    pick = tied[np.argmin(catalog.order[rows[tied]])]
+                    return (int(rows[pick]), float(best), bool(genre_match[pick]), bool(artist_match[pick]),
+                            bool(language_match[pick]))
+        if whole_grid:
+            return None
+        radius = max(1, radius * 2)
+
+
+def interpolate_moods(start: tuple, end: tuple, steps: int) -> List[dict]:
+    path = []
+    for i in range(steps + 1):
+        t = i / steps if steps else 0.0
+        path.append({
+            "valence": start[0] + (end[0] - start[0]) * t,
+            "arousal": start[1] + (end[1] - start[1]) * t,
+        })
+    return path
+
+
+def explain(song: dict, target_valence: float, target_arousal: float, genre_match: bool, artist_match: bool,
+            step_index: int, total_steps: int) -> str:
+    """generateExplanation from moodEngine.ts."""
+    if step_index == 0:
+        parts = ["Starting your emotional journey"]
+    elif step_index == total_steps - 1:
+        parts = ["Reaching your target mood"]
+    else:
+        progress = _js_round(step_index / (total_steps - 1) * 100)
+        parts = [f"{progress}% through your mood transition"]
+
+    mood_distance = _distance(song["valence"], song["energy"], target_valence, target_arousal)
+    if mood_distance < 0.15:
+        parts.append("with perfect mood alignment")
+    elif mood_distance < 0.25:
+        parts.append("with excellent mood fit")
+    else:
+        parts.append("bridging to the next emotional state")
+
+    if artist_match:
+        parts.append(f"featuring {song['artist']}, one of your favorites")
+    elif genre_match:
+        parts.append(f"in your preferred {song['genre']} genre")
+    return " ".join(parts)
+
+
+def playlist_metrics(songs: List[dict], mood_path: List[dict]) -> dict:
+    """calculateMetrics from moodEngine.ts."""
+    total_transition_error = 0.0
+    for i in range(1, len(songs)):
+        expected = _distance(mood_path[i - 1]["valence"], mood_path[i - 1]["arousal"],
+                             mood_path[i]["valence"], mood_path[i]["arousal"])
+        actual = _distance(songs[i - 1]["valence"], songs[i - 1]["energy"], songs[i]["valence"], songs[i]["energy"])
+        total_transition_error += abs(expected - actual)
+    avg_transition_error = total_transition_error / max(1, len(songs) - 1)
+    smoothness = max(0.0, min(100.0, 100 - avg_transition_error * 70))
+
+    matches = sum(song["genreMatch"] for song in songs) + sum(song["artistMatch"] for song in songs)
+    count = len(songs)
+    preference_match = matches / (count * 2) * 100 if count else math.nan
+    avg_mood_distance = (sum(_distance(s["valence"], s["energy"], s["targetValence"], s["targetArousal"])
+                             for s in songs) / count) if count else math.nan
+    return {
+        "smoothnessScore": _js_round(smoothness),
+        "preferenceMatchPercentage": _js_round(preference_match) if count else None,
+        "avgMoodDistance": _js_round(avg_mood_distance * 100) / 100 if count else None,
+    }
+
+
+def generate_playlist(catalog: Catalog, current_mood: str, target_mood: str, prefs: Preferences,
+                      playlist_length: int = 8, exhaustive: bool = False) -> dict:
+    """generateMoodPlaylist: a PlaylistResult dict."""
+    mood_path = interpolate_moods(MOOD_POINTS[current_mood], MOOD_POINTS[target_mood], playlist_length - 1)
+    songs = []
+    used = []
+    for index, target in enumerate(mood_path):
+        used_rows = np.array(used, dtype=np.int64)
+        found = best_row(catalog, target["valence"], target["arousal"], prefs, used_rows, exhaustive)
+        if found is None:
+            continue
+        row, score, genre_match, artist_match, language_match = found
+        used.append(row)
+        song = catalog.song(row)
+        song.update({
+            "moodScore": score,
+            "genreMatch": genre_match,
+            "artistMatch": artist_match,
+            "languageMatch": language_match,
+            "explanation": explain(song, target["valence"], target["arousal"], genre_match, artist_match,
+                                   index, playlist_length),
+            "targetValence": target["valence"],
+            "targetArousal": target["arousal"],
+        })
+        songs.append(song)
+    return {
+        "songs": songs,
+        "metrics": playlist_metrics(songs, mood_path),
+        "moodPath": [{**point, "step": i} for i, point in enumerate(mood_path)],
+    }
+
+
+SONG_LINE = re.compile(r'\{\s*(id:\s*"[^"]*".*?)\}\s*,?\s*$')
+SONG_FIELD = re.compile(r'(\w+):\s*("(?:[^"\\]|\\.)*"|[-\d.]+)')
+
+
+def import_songs(ts_path: str) -> List[dict]:
+    """Read the mockSongs entries (one object literal per line) from src/data/songs.ts."""
+    songs = []
+    with open(ts_path, encoding="utf-8") as f:
+        for line in f:
+            match = SONG_LINE.search(line)
+            if not match:
+                continue
+            song = {}
+            for name, value in SONG_FIELD.findall(match.group(1)):
+                song[name] = json.loads(value) if value.startswith('"') else float(value)
+            songs.append(song)
+    return songs
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import-songs", help="Convert src/data/songs.ts to a JSON catalog")
+    import_parser.add_argument("songs_ts", help="Path to src/data/songs.ts")
+    import_parser.add_argument("output", help="JSON (or .npz) catalog to write")
+    args = parser.parse_args()
+
+    songs = import_songs(args.songs_ts)
+    if args.output.endswith(".npz"):
+        Catalog.from_songs(songs).save(args.output)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(songs, f, ensure_ascii=False, indent=1)
+    print(f"Wrote {len(songs)} songs to {args.output}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,95 @@
+"""
+Multi-process server: N HTTP workers sharing one model process
+
+`uvicorn main:app --workers N` gives every worker its own TensorFlow runtime
+and copy of the model, and each batches inference on its own. Here the N
+workers share one listening socket and only decode audio and compute model
+inputs; a single model process holds the model and batches inference for
+all of them, with mel batches passed through shared memory (see
+model_server.py).
+
+Configuration is the same environment variables main.py reads.
+CLASSIFY_WORKERS (feature threads per HTTP worker) defaults to 1 here, and
+MODEL_SERVER_SLOTS sets how many batches each worker can have in flight.
+
+Usage:
+    python serve.py --workers 4
+    python serve.py --workers 8 --host 0.0.0.0 --port 8000
+"""
+
+import argparse
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import sys
+
+
+def run_http_worker(connection, sock, host: str, port: int, log_level: str):
+    """HTTP worker entry point: serve main.app on the shared socket, predicting through ``connection``."""
+    import uvicorn
+
+    import main
+
+    main.model_connection = connection
+    uvicorn.Server(uvicorn.Config(main.app, host=host, port=port, log_level=log_level)).run(sockets=[sock])
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="HTTP/feature-extraction workers")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    # Read by main.py in every child; the workers already give one process per core
+    os.environ.setdefault("CLASSIFY_WORKERS", "1")
+    import uvicorn
+
+    import model_server
+
+    sock = uvicorn.Config("main:app", host=args.host, port=args.port).bind_socket()
+    context = multiprocessing.get_context("spawn")
+    pipes = [context.Pipe() for _ in range(args.workers)]
+    processes = [context.Process(target=model_server.run_model_process, args=([end for end, _ in pipes],),
+                                 name="model")]
+    processes += [
+        context.Process(target=run_http_worker, args=(end, sock, args.host, args.port, args.log_level),
+                        name=f"http-{index}")
+        for index, (_, end) in enumerate(pipes)
+    ]
+    for process in processes:
+        process.start()
+    # The children hold their own ends; closing ours lets each side see EOF when the other exits
+    for model_end, worker_end in pipes:
+        model_end.close()
+        worker_end.close()
+    sock.close()
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} HTTP workers and one model process "
+          f"(pid {processes[0].pid})")
+
+    # Shut the children down on terminate too, not just Ctrl-C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        # Run until any process exits, then take the rest down with it
+        multiprocessing.connection.wait([process.sentinel for process in processes])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes[1:]:
+            process.terminate()
+        # The model process exits on its own once every worker has disconnected
+        for process in processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+    failed = [process.name for process in processes if process.exitcode not in (0, None, -15)]
+    if failed:
+        print(f"Exited: {', '.join(failed)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main_cli())
@@ -0,0 +1,60 @@
+"""
+Shared fixtures for the backend tests
+
+The backend modules are imported from the parent directory, like the
+benchmarks do. App tests run against StubModel, a small deterministic
+stand-in for the Keras model, so the model file is not needed.
+
+Usage:
+    cd backend && python -m pytest -q
+"""
+
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+class StubModel:
+    """Softmax over the first ten mel values of each segment: cheap, deterministic, input-dependent."""
+
+    input_shape = (None, 128, 130, 1)
+    output_shape = (None, 10)
+
+    def predict(self, x, batch_size=None, verbose=0):
+        logits = np.asarray(x, dtype=np.float64).reshape(len(x), -1)[:, :10]
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return (exp / exp.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+def wav_bytes(seconds: float, sr: int = 22050, freq: float = 440.0) -> bytes:
+    """A tone plus a little seeded noise, encoded as WAV."""
+    t = np.arange(int(seconds * sr)) / sr
+    audio = 0.3 * np.sin(2 * np.pi * freq * t) + 0.05 * np.random.default_rng(0).standard_normal(len(t))
+    buffer = io.BytesIO()
+    sf.write(buffer, audio.astype(np.float32), sr, format="WAV")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def wav():
+    return wav_bytes
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """TestClient over main.app with StubModel loaded and an empty result cache."""
+    from fastapi.testclient import TestClient
+
+    import main
+    from cache import ResultCache
+
+    monkeypatch.setattr(main, "model", StubModel())
+    monkeypatch.setattr(main, "result_cache", ResultCache(max_bytes=64 * 1024 * 1024))
+    with TestClient(main.app) as test_client:
+        yield test_client
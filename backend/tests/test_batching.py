@@ -0,0 +1,99 @@
+import asyncio
+
+import numpy as np
+
+from batching import InferenceScheduler, SegmentStacker
+
+
+def tagged(rows: int, tag: int) -> np.ndarray:
+    """``(rows, 2)`` batch whose rows are ``(tag, row index)``, so outputs can be traced back."""
+    return np.stack([np.full(rows, tag), np.arange(rows)], axis=1).astype(np.float32)
+
+
+def double(batch: np.ndarray) -> np.ndarray:
+    return batch * 2
+
+
+def test_scheduler_returns_each_request_its_own_rows():
+    calls = []
+
+    def predict(batch):
+        calls.append(len(batch))
+        return double(batch)
+
+    async def run():
+        scheduler = InferenceScheduler(predict, max_batch_size=8, max_wait_ms=20)
+        scheduler.start()
+        try:
+            sizes = [3, 5, 1, 8, 2, 7]
+            results = await asyncio.gather(*(scheduler.predict(tagged(n, i)) for i, n in enumerate(sizes)))
+        finally:
+            await scheduler.stop()
+        return sizes, results, scheduler.stats()
+
+    sizes, results, stats = asyncio.run(run())
+    for i, (n, result) in enumerate(zip(sizes, results)):
+        np.testing.assert_array_equal(result, double(tagged(n, i)))
+    assert max(calls) <= 8
+    assert sum(calls) == sum(sizes)
+    assert stats["batches"] < len(sizes)
+
+
+def test_scheduler_splits_oversized_requests_and_reassembles_them():
+    calls = []
+
+    def predict(batch):
+        calls.append(len(batch))
+        return double(batch)
+
+    async def run():
+        scheduler = InferenceScheduler(predict, max_batch_size=4, max_wait_ms=1)
+        scheduler.start()
+        try:
+            return await scheduler.predict(tagged(11, 7))
+        finally:
+            await scheduler.stop()
+
+    result = asyncio.run(run())
+    np.testing.assert_array_equal(result, double(tagged(11, 7)))
+    assert calls == [4, 4, 3]
+
+
+def test_scheduler_fails_every_caller_of_a_failed_batch():
+    def predict(batch):
+        raise ValueError("model exploded")
+
+    async def run():
+        scheduler = InferenceScheduler(predict, max_batch_size=8, max_wait_ms=20)
+        scheduler.start()
+        try:
+            return await asyncio.gather(scheduler.predict(tagged(2, 0)), scheduler.predict(tagged(3, 1)),
+                                        return_exceptions=True)
+        finally:
+            await scheduler.stop()
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_stacker_stacks_jobs_into_one_call_and_splits_the_outputs():
+    calls = []
+
+    async def predict(batch):
+        calls.append(len(batch))
+        return double(batch)
+
+    async def job(stacker, tag, rows, delay):
+        async with stacker.job() as job_predict:
+            await asyncio.sleep(delay)
+            return await job_predict(tagged(rows, tag))
+
+    async def run():
+        # A long max_wait_ms: only "every running job has submitted" can flush
+        stacker = SegmentStacker(predict, max_batch_size=64, max_wait_ms=10_000)
+        return await asyncio.gather(*(job(stacker, i, rows, i * 0.01) for i, rows in enumerate([2, 5, 3])))
+
+    results = asyncio.run(run())
+    for i, (rows, result) in enumerate(zip([2, 5, 3], results)):
+        np.testing.assert_array_equal(result, double(tagged(rows, i)))
+    assert calls == [10]
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from cache import ResultCache, cache_key
+
+
+def test_followers_share_one_computation():
+    calls = 0
+
+    async def run():
+        cache = ResultCache()
+        release = asyncio.Event()
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return b"result"
+
+        callers = [asyncio.create_task(cache.get_or_compute("k", compute)) for _ in range(4)]
+        await asyncio.sleep(0.01)
+        release.set()
+        results = await asyncio.gather(*callers)
+        return results, await cache.get_or_compute("k", compute), cache.stats()
+
+    results, hit, stats = asyncio.run(run())
+    assert [source for _, source in results] == ["computed", "shared", "shared", "shared"]
+    assert {value for value, _ in results} == {b"result"}
+    assert hit == (b"result", "memory")
+    assert calls == 1
+    assert stats["deduplicated"] == 3
+
+
+def test_cancelling_the_leader_does_not_cancel_followers():
+    async def run():
+        cache = ResultCache()
+        release = asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            return b"result"
+
+        leader = asyncio.create_task(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        await asyncio.sleep(0.01)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower, cache.get("k")
+
+    follower_result, cached = asyncio.run(run())
+    assert follower_result == (b"result", "shared")
+    assert cached == b"result"
+
+
+def test_failures_reach_every_waiter_and_are_not_cached():
+    async def run():
+        cache = ResultCache()
+        release = asyncio.Event()
+
+        async def fail():
+            await release.wait()
+            raise ValueError("decode failed")
+
+        callers = [asyncio.create_task(cache.get_or_compute("k", fail)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        release.set()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+
+        async def succeed():
+            return b"second try"
+
+        return results, cache.pending("k"), await cache.get_or_compute("k", succeed)
+
+    results, pending, retry = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert pending is None
+    assert retry == (b"second try", "computed")
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    async def compute():
+        return b"stored"
+
+    async def run():
+        await ResultCache(disk_dir=str(tmp_path)).get_or_compute("k", compute)
+        restarted = ResultCache(disk_dir=str(tmp_path))
+        return await restarted.get_or_compute("k", compute), await restarted.get_or_compute("k", compute)
+
+    assert asyncio.run(run()) == ((b"stored", "disk"), (b"stored", "memory"))
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResultCache(max_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"
+    cache.put("c", b"cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"aaaa"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_key_depends_on_identity_and_content():
+    assert cache_key(b"audio", "model-1") == cache_key(b"audio", "model-1")
+    assert cache_key(b"audio", "model-1") != cache_key(b"audio", "model-2")
+    assert cache_key(b"audio", "model-1") != cache_key(b"other", "model-1")
@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+import encoding
+import main
+
+
+def classify(client, audio: bytes, headers=None, **params):
+    return client.post("/classify", params=params, headers=headers, files={"file": ("a.wav", audio, "audio/wav")})
+
+
+def test_uniform_sampling_classifies_k_windows(client, wav):
+    response = classify(client, wav(30), strategy="uniform", k=3, include="visualization")
+    assert response.status_code == 200
+    info = response.json()["audioInfo"]
+    assert (info["strategy"], info["numSegments"], info["segmentsAnalyzed"]) == ("uniform", 10, 3)
+    assert len(info["windows"]) == 3
+    assert all(end - start == main.SEGMENT_DURATION for start, end in info["windows"])
+    # The visualization covers the same windows back to back
+    assert response.json()["visualization"]["windows"] == info["windows"]
+
+
+@pytest.mark.parametrize("strategy", ["random", "energy"])
+def test_drawn_seed_repeats_the_selection(client, wav, strategy):
+    audio = wav(30)
+    first = classify(client, audio, strategy=strategy, k=2).json()["audioInfo"]
+    assert isinstance(first["seed"], int)
+    # timings=true changes the cache key, so the windows are drawn again
+    again = classify(client, audio, strategy=strategy, k=2, seed=first["seed"], timings=True)
+    assert again.headers["X-Cache"] == "computed"
+    assert again.json()["audioInfo"]["windows"] == first["windows"]
+
+
+def test_sampling_all_segments_matches_the_exhaustive_path(client, wav):
+    audio = wav(12)
+    exhaustive = classify(client, audio).json()
+    sampled = classify(client, audio, strategy="uniform", k=10).json()
+    assert sampled["audioInfo"]["segmentsAnalyzed"] == exhaustive["audioInfo"]["numSegments"]
+    assert sampled["topGenre"] == exhaustive["topGenre"]
+    assert abs(sampled["topConfidence"] - exhaustive["topConfidence"]) < 1e-4
+
+
+def test_invalid_strategy_is_rejected(client, wav):
+    response = classify(client, wav(5), strategy="loudest")
+    assert response.status_code == 400
+    assert "strategy" in response.json()["detail"]
+
+
+@pytest.mark.parametrize("media_type", [encoding.FRAMES_MEDIA_TYPE, encoding.MSGPACK_MEDIA_TYPE])
+@pytest.mark.parametrize("quantize", encoding.QUANTIZATIONS)
+def test_binary_encodings_round_trip(client, wav, media_type, quantize):
+    if media_type == encoding.MSGPACK_MEDIA_TYPE and encoding.msgpack is None:
+        pytest.skip("msgpack is not installed")
+    audio = wav(10)
+    expected = classify(client, audio, include="visualization").json()
+    response = classify(client, audio, headers={"Accept": media_type}, include="visualization", quantize=quantize)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == media_type
+    assert response.headers["X-Cache"] == "computed"  # not the JSON entry
+    decode = encoding.decode_frames if media_type == encoding.FRAMES_MEDIA_TYPE else encoding.decode_msgpack
+    result = decode(response.content)
+
+    assert result["predictions"] == expected["predictions"]
+    for name, value in expected["visualization"].items():
+        value = np.asarray(value, dtype=np.float32)
+        if value.ndim == 0:
+            assert result["visualization"][name] == pytest.approx(value)
+            continue
+        # Half a uint8 step, or float16's relative precision
+        spread = float(value.max() - value.min()) if value.size else 0.0
+        atol = {"uint8": spread / 255 / 2, "float16": 1e-3 * float(np.abs(value).max(initial=0)), "float32": 0}[quantize]
+        np.testing.assert_allclose(result["visualization"][name], value, rtol=0, atol=atol * 1.001, err_msg=name)
+
+
+def test_unsupported_accept_falls_back_to_json(client, wav):
+    response = classify(client, wav(5), headers={"Accept": "text/html, application/x-unknown"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == encoding.JSON_MEDIA_TYPE
+    assert "Accept" in response.headers["Vary"]
+
+
+def test_invalid_quantize_is_rejected(client, wav):
+    response = classify(client, wav(5), headers={"Accept": encoding.FRAMES_MEDIA_TYPE}, quantize="int4")
+    assert response.status_code == 400
+    assert "quantize" in response.json()["detail"]
+
+
+def test_time_windows_are_classified_separately(client, wav):
+    response = classify(client, wav(20), windows="0:6,12:6")
+    assert response.status_code == 200
+    result = response.json()
+    info = result["audioInfo"]
+    assert (info["strategy"], info["segmentsAnalyzed"]) == ("windows", 4)
+    assert info["windows"] == [[0.0, 6.0], [12.0, 18.0]]
+    assert [(w["start"], w["end"], w["numSegments"]) for w in result["windows"]] == [(0.0, 6.0, 2), (12.0, 18.0, 2)]
+    # The top-level predictions average every segment of every window
+    top = {p["genre"]: p["confidence"] for p in result["predictions"]}
+    for genre, confidence in top.items():
+        per_window = [next(p["confidence"] for p in w["predictions"] if p["genre"] == genre) for w in result["windows"]]
+        assert confidence == pytest.approx(np.mean(per_window), abs=1e-6)
+
+
+def test_whole_track_window_matches_plain_classify(client, wav):
+    audio = wav(12)
+    plain = classify(client, audio).json()
+    windowed = classify(client, audio, windows="0:12").json()
+    assert windowed["windows"][0]["numSegments"] == plain["audioInfo"]["numSegments"]
+    for expected, actual in zip(plain["predictions"], windowed["predictions"]):
+        assert actual["genre"] == expected["genre"]
+        assert actual["confidence"] == pytest.approx(expected["confidence"], abs=1e-4)
+
+
+@pytest.mark.parametrize("params", [
+    {"windows": "30:5"},  # past the end of a 10 s track
+    {"windows": "abc"},
+    {"windows": "0:-1"},
+    {"windows": "0:5", "strategy": "uniform"},
+])
+def test_invalid_time_windows_are_rejected(client, wav, params):
+    response = classify(client, wav(10), **params)
+    assert response.status_code == 400
@@ -0,0 +1,90 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+import main
+
+
+def post_batch(client, files=None, archive=None, **params):
+    fields = [("files", (name, data, "audio/wav")) for name, data in files or []]
+    if archive is not None:
+        fields.append(("archive", ("music", archive, "application/octet-stream")))
+    return client.post("/classify/batch", params=params, files=fields)
+
+
+def zip_bytes(members: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("album/", b"")
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def tar_bytes(members: dict) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def test_batch_matches_classify_per_file(client, wav):
+    long, short = wav(9, freq=440.0), wav(0.5)
+    single = client.post("/classify", files={"file": ("a.wav", long, "audio/wav")}).json()
+    response = post_batch(client, [("a.wav", long), ("b.wav", wav(6, freq=880.0)), ("c.wav", short)])
+    assert response.status_code == 200
+    body = response.json()
+    assert [item["filename"] for item in body["results"]] == ["a.wav", "b.wav", "c.wav"]
+    assert [item["status"] for item in body["results"]] == [200, 200, 400]
+    assert body["failed"] == 1
+
+    first = body["results"][0]
+    # Same cache as /classify
+    assert first["cache"] == "memory"
+    assert first["result"]["predictions"] == single["predictions"]
+    assert body["results"][1]["result"]["audioInfo"]["numSegments"] == 2
+    assert "too short" in body["results"][2]["error"]
+
+
+@pytest.mark.parametrize("pack", [zip_bytes, tar_bytes])
+def test_batch_classifies_archive_members(client, wav, pack):
+    archive = pack({"album/one.wav": wav(6), "album/cover.jpg": b"\xff\xd8", "album/two.wav": wav(3, freq=660.0)})
+    response = post_batch(client, files=[("loose.wav", wav(4))], archive=archive)
+    assert response.status_code == 200
+    body = response.json()
+    # Loose files first, then audio members in archive order
+    assert [item["filename"] for item in body["results"]] == ["loose.wav", "album/one.wav", "album/two.wav"]
+    assert body["failed"] == 0
+
+
+def test_batch_reports_oversized_members(client, wav, monkeypatch):
+    # The limit applies to what is decompressed, whatever the header claims
+    monkeypatch.setattr(main, "MAX_UPLOAD_BYTES", 200_000)
+    response = post_batch(client, archive=zip_bytes({"small.wav": wav(3), "large.wav": wav(10)}))
+    assert response.status_code == 200
+    assert [item["status"] for item in response.json()["results"]] == [200, 413]
+
+
+def test_batch_request_errors(client, wav, monkeypatch):
+    assert post_batch(client).status_code == 400
+    assert post_batch(client, archive=b"not an archive").status_code == 400
+    assert post_batch(client, archive=zip_bytes({"notes.txt": b"hi"})).status_code == 400
+    assert post_batch(client, [("a.wav", wav(3))], strategy="loudest").status_code == 400
+
+    monkeypatch.setattr(main, "BATCH_MAX_FILES", 2)
+    response = post_batch(client, [(f"{i}.wav", wav(3)) for i in range(3)])
+    assert response.status_code == 400
+    assert "Too many files" in response.json()["detail"]
+
+
+def test_batch_takes_one_admission_slot(client, wav, monkeypatch):
+    monkeypatch.setattr(main, "admission", main.AdmissionQueue(1))
+    response = post_batch(client, [(f"{i}.wav", wav(3, freq=300.0 + i)) for i in range(4)])
+    assert response.status_code == 200
+    assert response.json()["failed"] == 0
+    assert main.admission.pending == 0
@@ -0,0 +1,97 @@
+import os
+
+import numpy as np
+import pytest
+
+from feature_store import MEL_SHAPE, SUMMARY_COLUMNS, FeatureStore
+
+SIGNATURE = {"size": 1, "mtimeNs": 1}
+
+
+def add_track(store: FeatureStore, path: str, segments: int, value: float):
+    store.add(path, np.full((segments, *MEL_SHAPE), value, dtype=np.float16),
+              np.full(len(SUMMARY_COLUMNS), value, dtype=np.float32), segments * 3.0, SIGNATURE)
+
+
+@pytest.fixture
+def store_dir(tmp_path):
+    store = FeatureStore(str(tmp_path), mode="a")
+    for i, segments in enumerate([2, 3, 1]):
+        add_track(store, f"track{i}", segments, i)
+    store.close()
+    return str(tmp_path)
+
+
+def tear_index(store_dir: str, drop_bytes: int) -> int:
+    """Cut the end off index.jsonl, as a crash mid-flush would; returns the surviving length."""
+    path = os.path.join(store_dir, "index.jsonl")
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data[:-drop_bytes])
+    return data[:-drop_bytes].rfind(b"\n") + 1
+
+
+def test_round_trip(store_dir):
+    store = FeatureStore(store_dir)
+    assert len(store) == 3
+    assert store.segments == 6
+    assert store.mel("track1").shape == (3, *MEL_SHAPE)
+    assert float(store.mel("track1")[0, 0, 0]) == 1.0
+    assert float(store.summary("track2")[0]) == 2.0
+
+
+def test_append_truncates_unindexed_arrays(store_dir):
+    # Rows written before a crash but never flushed to the index
+    with open(os.path.join(store_dir, "mels.f16"), "ab") as f:
+        f.write(b"\0" * FeatureStore._mel_bytes())
+    with open(os.path.join(store_dir, "summary.f32"), "ab") as f:
+        f.write(b"\0" * FeatureStore._summary_bytes())
+
+    store = FeatureStore(store_dir, mode="a")
+    assert os.path.getsize(store.mels_path) == 6 * store._mel_bytes()
+    assert os.path.getsize(store.summary_path) == 3 * store._summary_bytes()
+    add_track(store, "track3", 2, 7)
+    store.close()
+    reopened = FeatureStore(store_dir)
+    assert reopened.records["track3"]["offset"] == 6
+    assert float(reopened.mel("track3")[0, 0, 0]) == 7.0
+
+
+def test_torn_last_index_line_is_skipped_read_only(store_dir):
+    size = os.path.getsize(os.path.join(store_dir, "index.jsonl"))
+    tear_index(store_dir, 10)
+    store = FeatureStore(store_dir)
+    assert sorted(store.records) == ["track0", "track1"]
+    assert (store.segments, store.rows) == (5, 2)
+    assert float(store.mel("track1")[-1, 0, 0]) == 1.0
+    # Read-only opens leave the file alone
+    assert os.path.getsize(os.path.join(store_dir, "index.jsonl")) == size - 10
+
+
+def test_append_truncates_torn_index_and_unindexed_arrays(store_dir):
+    complete = tear_index(store_dir, 10)
+    store = FeatureStore(store_dir, mode="a")
+    assert os.path.getsize(store.index_path) == complete
+    assert os.path.getsize(store.mels_path) == 5 * store._mel_bytes()
+    assert os.path.getsize(store.summary_path) == 2 * store._summary_bytes()
+
+    # New rows follow straight on from the surviving ones
+    add_track(store, "track2", 4, 9)
+    store.close()
+    reopened = FeatureStore(store_dir)
+    assert len(reopened) == 3
+    assert reopened.records["track2"]["offset"] == 5
+    assert float(reopened.mel("track2")[0, 0, 0]) == 9.0
+    assert float(reopened.mel("track1")[0, 0, 0]) == 1.0
+
+
+def test_unparseable_line_stops_the_index(store_dir):
+    path = os.path.join(store_dir, "index.jsonl")
+    with open(path, "rb") as f:
+        lines = f.read().splitlines(keepends=True)
+    with open(path, "wb") as f:
+        f.write(lines[0] + b"{not json\n" + b"".join(lines[1:]))
+    store = FeatureStore(store_dir)
+    assert list(store.records) == ["track0"]
+    assert store.segments == 2
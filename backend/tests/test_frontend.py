@@ -0,0 +1,33 @@
+import numpy as np
+
+import main
+
+# float32 batch vs librosa's float64 path; ~2e-5 dB is the largest gap seen
+ATOL_DB = 1e-4
+
+
+def per_segment(segments) -> np.ndarray:
+    return np.stack([main.prepare_segment_for_model(segment) for segment in segments])
+
+
+def test_batch_matches_per_segment_front_end(wav):
+    # 20 s -> 6 segments, more than one FRONTEND_CHUNK_SEGMENTS chunk
+    audio, _ = main.decode_audio(wav(20))
+    segments, _, _ = main.segment_audio(audio)
+    assert len(segments) > main.FRONTEND_CHUNK_SEGMENTS
+    batch = main.mel_spectrogram_batch(segments, workspace=main.FrontendWorkspace())
+    assert batch.shape == (len(segments), main.N_MELS, main.EXPECTED_TIME_FRAMES, 1)
+    np.testing.assert_allclose(batch, per_segment(segments), rtol=0, atol=ATOL_DB)
+
+
+def test_reused_workspace_matches_padded_tail_segment(wav):
+    # The padded tail of a short track runs through a workspace that last held louder, different audio
+    workspace = main.FrontendWorkspace()
+    noise = np.random.default_rng(1).standard_normal(main.SAMPLE_RATE * 9).astype(np.float32)
+    main.mel_spectrogram_batch(main.segment_audio(noise)[0], workspace=workspace)
+
+    audio, _ = main.decode_audio(wav(2))
+    segments, _, num_segments = main.segment_audio(audio)
+    assert num_segments == 1
+    batch = main.mel_spectrogram_batch(segments, workspace=workspace)
+    np.testing.assert_allclose(batch, per_segment(segments), rtol=0, atol=ATOL_DB)
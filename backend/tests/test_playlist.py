@@ -0,0 +1,65 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import playlist
+
+GENRES = ["blues", "jazz", "metal", "pop", "rock"]
+LANGUAGES = ["english", "hindi", "korean"]
+
+
+def random_songs(n: int, seed: int) -> list:
+    """Two-decimal moods clustered around the mood points, so exact score ties are common."""
+    rng = np.random.default_rng(seed)
+    centres = np.array(list(playlist.MOOD_POINTS.values()))
+    points = np.clip(centres[rng.integers(len(centres), size=n)] + 0.15 * rng.standard_normal((n, 2)), 0, 1)
+    points = np.round(points, 2)
+    return [{
+        "id": f"s{i}",
+        "title": f"Song {i}",
+        "artist": f"Artist {rng.integers(40)}",
+        "genre": GENRES[rng.integers(len(GENRES))],
+        "language": LANGUAGES[rng.integers(len(LANGUAGES))],
+        "valence": float(points[i, 0]),
+        "energy": float(points[i, 1]),
+        "tempo": float(rng.integers(60, 180)),
+    } for i in range(n)]
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return playlist.Catalog.from_songs(random_songs(5000, seed=3))
+
+
+PREFERENCES = [
+    {},
+    {"preferred_genres": ["jazz"], "preferred_languages": ["hindi"]},
+    {"favorite_artists": ["Artist 3", "Artist 17"], "liked_song_ids": ["s1", "s42", "s999"]},
+    {"preferred_genres": ["metal", "rock"], "favorite_artists": ["Artist 5"], "preferred_languages": ["korean"],
+     "liked_song_ids": ["s7"]},
+]
+
+
+@pytest.mark.parametrize("prefs", PREFERENCES)
+def test_grid_search_matches_exhaustive_scan(catalog, prefs):
+    preferences = playlist.Preferences(catalog, **prefs)
+    for current, target in itertools.permutations(playlist.MOOD_POINTS, 2):
+        exact = playlist.generate_playlist(catalog, current, target, preferences, 12)
+        exhaustive = playlist.generate_playlist(catalog, current, target, preferences, 12, exhaustive=True)
+        assert exact == exhaustive, (current, target)
+
+
+def test_ties_go_to_the_earlier_catalog_entry():
+    songs = [{"id": f"s{i}", "title": "", "artist": "a", "genre": "pop", "language": "english",
+              "valence": 0.8, "energy": 0.6, "tempo": 100.0} for i in range(5)]
+    catalog = playlist.Catalog.from_songs(songs)
+    result = playlist.generate_playlist(catalog, "happy", "happy", playlist.Preferences(catalog), 3)
+    assert [song["id"] for song in result["songs"]] == ["s0", "s1", "s2"]
+
+
+def test_small_catalog_runs_out_of_songs():
+    catalog = playlist.Catalog.from_songs(random_songs(3, seed=0))
+    result = playlist.generate_playlist(catalog, "sad", "happy", playlist.Preferences(catalog), 8)
+    assert len(result["songs"]) == 3
+    assert len({song["id"] for song in result["songs"]}) == 3
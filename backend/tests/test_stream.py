@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+import main
+
+
+def sse_events(body: str) -> list:
+    """``[(event, payload), ...]`` from a text/event-stream body."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+@pytest.fixture
+def unreadable_by_libsndfile(monkeypatch):
+    """Make every upload look like a format libsndfile cannot open, forcing the full-decode fallback."""
+    def info(*args, **kwargs):
+        raise RuntimeError("Format not recognised")
+
+    monkeypatch.setattr(main.sf, "info", info)
+
+
+def test_stream_matches_classify(client, wav):
+    audio = wav(20)
+    expected = client.post("/classify", files={"file": ("a.wav", audio, "audio/wav")}).json()
+    response = client.post("/classify/stream", files={"file": ("a.wav", audio, "audio/wav")})
+    assert response.status_code == 200
+    events = sse_events(response.text)
+    assert [event for event, _ in events[:-1]] == ["progress"] * (len(events) - 1)
+    event, result = events[-1]
+    assert event == "result"
+    assert result["topGenre"] == expected["topGenre"]
+    assert result["audioInfo"]["segmentsProcessed"] == expected["audioInfo"]["numSegments"]
+    assert main.admission.pending == 0
+
+
+def test_stream_falls_back_to_full_decode(client, wav, unreadable_by_libsndfile):
+    response = client.post("/classify/stream", files={"file": ("a.wav", wav(10), "audio/wav")})
+    assert response.status_code == 200
+    event, result = sse_events(response.text)[-1]
+    assert event == "result", result
+    assert result["audioInfo"]["numSegments"] == 3
+    assert result["audioInfo"]["segmentsProcessed"] == 3
+    assert main.admission.pending == 0
+
+
+def test_stream_early_exit_releases_the_slot(client, wav):
+    response = client.post("/classify/stream?early_exit=true&min_segments=4",
+                           files={"file": ("a.wav", wav(60), "audio/wav")})
+    event, result = sse_events(response.text)[-1]
+    assert event == "result"
+    assert result["earlyExit"]
+    assert result["audioInfo"]["segmentsProcessed"] < result["audioInfo"]["numSegments"]
+    assert main.admission.pending == 0
+
+
+def test_stream_rejects_short_audio(client, wav):
+    response = client.post("/classify/stream", files={"file": ("a.wav", wav(1), "audio/wav")})
+    assert response.status_code == 400
+    assert main.admission.pending == 0
@@ -0,0 +1,90 @@
+import librosa
+import numpy as np
+import pytest
+
+import main
+
+SR = main.SAMPLE_RATE
+
+# Per-feature (rtol, atol) against the librosa calls the shared STFT replaced.
+# float32 intermediates put the mel heatmap up to a few hundredths of a dB off
+TOLERANCES = {
+    "melSpectrogram": (0, 0.05),
+    "waveform": (0, 0),
+    "spectralCentroid": (0, 1e-6),
+    "spectralRolloff": (0, 1.01 / (main.N_FFT // 2)),  # one FFT bin
+    "rms": (0, 1e-6),
+    "tempo": (1e-6, 0),
+    "beats": (0, 1e-6),
+    "chromagram": (0, 1e-5),
+    "mfcc": (1e-4, 1e-3),
+}
+
+
+def downsample(x: np.ndarray, n: int) -> np.ndarray:
+    if x.shape[-1] > n:
+        return x[..., np.linspace(0, x.shape[-1] - 1, n, dtype=int)]
+    return x
+
+
+def librosa_visualization(audio: np.ndarray) -> dict:
+    """The per-feature librosa calls extract_visualization_data used to make."""
+    hop = main.HOP_LENGTH
+    mel = librosa.feature.melspectrogram(y=audio, sr=SR, n_mels=main.VIZ_N_MELS, hop_length=hop)
+    rms = downsample(librosa.feature.rms(y=audio, hop_length=hop)[0], main.VIZ_FEATURE_SAMPLES)
+    tempo, beats = librosa.beat.beat_track(y=audio, sr=SR)
+    return {
+        "melSpectrogram": downsample(librosa.power_to_db(mel, ref=np.max), main.VIZ_MAX_FRAMES),
+        "waveform": audio[np.linspace(0, len(audio) - 1, main.VIZ_WAVEFORM_SAMPLES, dtype=int)],
+        "spectralCentroid": downsample(librosa.feature.spectral_centroid(y=audio, sr=SR, hop_length=hop)[0],
+                                       main.VIZ_FEATURE_SAMPLES) / (SR / 2),
+        "spectralRolloff": downsample(librosa.feature.spectral_rolloff(y=audio, sr=SR, hop_length=hop)[0],
+                                      main.VIZ_FEATURE_SAMPLES) / (SR / 2),
+        "rms": rms / (np.max(rms) + 1e-8),
+        "tempo": float(np.atleast_1d(tempo)[0]),
+        "beats": librosa.frames_to_time(beats, sr=SR)[:50],
+        "chromagram": downsample(librosa.feature.chroma_stft(y=audio, sr=SR, hop_length=hop), main.VIZ_MAX_FRAMES),
+        "mfcc": downsample(librosa.feature.mfcc(y=audio, sr=SR, n_mfcc=13, hop_length=hop), main.VIZ_MAX_FRAMES),
+    }
+
+
+def clicks(seconds: float) -> np.ndarray:
+    """A quiet tone under noise bursts every half second, so tempo and beats have something to find."""
+    rng = np.random.default_rng(0)
+    audio = 0.1 * np.sin(2 * np.pi * 220 * np.arange(int(seconds * SR)) / SR)
+    for start in np.arange(0, len(audio) - 200, SR // 2):
+        audio[start:start + 200] += rng.standard_normal(200)
+    return audio.astype(np.float32)
+
+
+def assert_matches(out: dict, expected: dict):
+    for name, value in expected.items():
+        rtol, atol = TOLERANCES[name]
+        np.testing.assert_allclose(out[name], value, rtol=rtol, atol=atol, err_msg=name)
+
+
+@pytest.mark.parametrize("source", ["tone", "clicks"])
+def test_matches_librosa(source, wav):
+    audio = main.decode_audio(wav(20))[0] if source == "tone" else clicks(15)
+    out = main.extract_visualization_data(audio)
+    assert_matches(out, librosa_visualization(audio))
+    np.testing.assert_allclose(out["timeAxis"], np.linspace(0, len(audio) / SR, main.VIZ_FEATURE_SAMPLES))
+
+
+def test_accumulator_is_independent_of_block_size():
+    audio = clicks(12)
+    accumulator = main.VisualizationAccumulator(len(audio))
+    for start in range(0, len(audio), 1000):
+        accumulator.update(audio[start:start + 1000])
+    assert_matches(accumulator.finalize(), librosa_visualization(audio))
+
+
+def test_feature_subset_skips_the_full_pass():
+    audio = clicks(12)
+    features = ("spectralCentroid", "spectralRolloff", "rms", "chromagram")
+    accumulator = main.VisualizationAccumulator(len(audio), features=features)
+    assert not accumulator.full_pass
+    accumulator.update(audio)
+    out = accumulator.finalize()
+    assert sorted(out) == sorted(features)
+    assert_matches(out, {name: librosa_visualization(audio)[name] for name in features})
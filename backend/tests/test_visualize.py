@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+import main
+from analysis_store import AnalysisStore
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = AnalysisStore()
+    monkeypatch.setattr(main, "analysis_store", store)
+    return store
+
+
+def classify(client, audio: bytes, **params):
+    response = client.post("/classify", params=params, files={"file": ("a.wav", audio, "audio/wav")})
+    assert response.status_code == 200
+    return response.json()
+
+
+def assert_same_visualization(actual: dict, expected: dict):
+    assert sorted(actual) == sorted(expected)
+    for name, value in expected.items():
+        np.testing.assert_allclose(actual[name], value, rtol=1e-5, atol=1e-4, err_msg=name)
+
+
+@pytest.mark.parametrize("retain_bytes", [main.ANALYSIS_RETAIN_MAX_BYTES, 0])
+def test_visualize_matches_inline_visualization(client, wav, store, monkeypatch, retain_bytes):
+    # With no retain budget only the upload is kept and /visualize decodes it again
+    monkeypatch.setattr(main, "ANALYSIS_RETAIN_MAX_BYTES", retain_bytes)
+    audio = wav(10)
+    inline = classify(client, audio, include="visualization")
+    result = classify(client, audio)
+    assert "visualization" not in result
+    entry = store.get(result["analysisId"])
+    assert (entry.audio is None) == (retain_bytes == 0)
+
+    response = client.get(f"/visualize/{result['analysisId']}")
+    assert response.status_code == 200
+    assert response.json()["analysisId"] == result["analysisId"]
+    assert_same_visualization(response.json()["visualization"], inline["visualization"])
+
+
+def test_visualize_sampled_windows(client, wav, store):
+    audio = wav(30)
+    inline = classify(client, audio, strategy="uniform", k=3, include="visualization")
+    result = classify(client, audio, strategy="uniform", k=3)
+    visualization = client.get(f"/visualize/{result['analysisId']}").json()["visualization"]
+    assert visualization["windows"] == result["audioInfo"]["windows"]
+    assert_same_visualization(visualization, inline["visualization"])
+
+
+def test_visualize_feature_subset(client, wav, store):
+    result = classify(client, wav(10))
+    response = client.get(f"/visualize/{result['analysisId']}", params={"features": "waveform,rms"})
+    assert response.status_code == 200
+    assert sorted(response.json()["visualization"]) == ["rms", "waveform"]
+
+
+def test_visualize_rejects_unknown_ids_and_features(client, wav, store):
+    assert client.get("/visualize/missing").status_code == 404
+    result = classify(client, wav(5))
+    response = client.get(f"/visualize/{result['analysisId']}", params={"features": "loudness"})
+    assert response.status_code == 400
+    assert "loudness" in response.json()["detail"]
@@ -0,0 +1,332 @@
+"""
+In-process nearest-neighbour search over track embeddings
+
+Vectors are L2-normalized on the way in, so the inner product is the cosine
+similarity. Two index types share one search interface:
+
+* ``ExactIndex``: brute force, one matrix-vector product over the catalog
+  in row chunks. Exact results and no build step.
+* ``IVFIndex``: an inverted file. Spherical k-means splits the catalog into
+  ``n_lists`` clusters, and vectors are stored grouped by cluster, so each
+  list is one contiguous slice. A query scores the centroids and scans only
+  the ``n_probe`` closest lists. Raising ``n_probe`` trades speed for recall.
+
+Vectors can be stored as float32 or float16 (half the memory; slices are
+widened to float32 for scoring). ``save`` writes a directory of ``.npy``
+files plus ``index.json``; ``load_index`` memory-maps it, so a catalog of
+10^6 tracks costs page cache rather than heap.
+
+Usage:
+    python backend/vector_index.py build --feature-store features/ --output similarity/ --kind ivf
+    python backend/vector_index.py build --embeddings embeddings.npz --output similarity/ --dtype float16
+    python backend/vector_index.py query --index similarity/ --track rock/song.mp3 --k 10
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+INDEX_VERSION = 1
+INDEX_KINDS = ("exact", "ivf")
+SCAN_CHUNK_ROWS = 16384  # rows scored per matrix-vector product in a full scan
+KMEANS_SAMPLE_PER_LIST = 64
+KMEANS_ITERATIONS = 10
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows as float32; all-zero rows stay zero."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def encode_ids(ids) -> np.ndarray:
+    """Track ids as a fixed-width UTF-8 byte array (a quarter the size of numpy unicode)."""
+    return np.array([str(i).encode() for i in ids], dtype=bytes)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the ``k`` largest scores, best first."""
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class ExactIndex:
+    """Brute-force cosine search."""
+
+    kind = "exact"
+
+    def __init__(self, vectors: np.ndarray, ids: np.ndarray, meta: dict = None):
+        self.vectors = vectors
+        self.ids = ids
+        self.meta = meta or {}
+        self._id_order = None
+        self._sorted_ids = None
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, ids, dtype: str = "float32", **meta) -> "ExactIndex":
+        return cls(normalize(vectors).astype(dtype, copy=False), encode_ids(ids), meta)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    def position(self, track_id: str) -> Optional[int]:
+        """Row of ``track_id``, or None. Uses a sorted id order, not a dict, to stay compact."""
+        if self._sorted_ids is None:
+            # Built on first use; _sorted_ids is set last so a concurrent lookup never sees half of it
+            self._id_order = np.argsort(self.ids, kind="stable")
+            self._sorted_ids = self.ids[self._id_order]
+        key = track_id.encode()
+        i = int(np.searchsorted(self._sorted_ids, key))
+        if i < len(self._sorted_ids) and self._sorted_ids[i] == key:
+            return int(self._id_order[i])
+        return None
+
+    def vector(self, track_id: str) -> Optional[np.ndarray]:
+        row = self.position(track_id)
+        return None if row is None else np.asarray(self.vectors[row], dtype=np.float32)
+
+    def _scan(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Scores of ``query`` against ``rows`` (any float dtype), chunked to bound temporaries."""
+        if rows.dtype == np.float32:
+            return rows @ query
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), SCAN_CHUNK_ROWS):
+            chunk = rows[start:start + SCAN_CHUNK_ROWS]
+            scores[start:start + len(chunk)] = chunk.astype(np.float32) @ query
+        return scores
+
+    def search(self, query: np.ndarray, k: int = 10, **options) -> Tuple[list, np.ndarray]:
+        """``(ids, scores)`` of the ``k`` most similar vectors, best first."""
+        query = normalize(query)
+        scores = self._scan(query, self.vectors)
+        top = _top_k(scores, k)
+        return self._ids_at(top), scores[top]
+
+    def _ids_at(self, rows: np.ndarray) -> list:
+        return [track_id.decode() for track_id in self.ids[rows]]
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "size": len(self),
+            "dim": self.dim,
+            "dtype": self.vectors.dtype.name,
+            "bytesPerVector": self.nbytes() / max(len(self), 1),
+        }
+
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + self.ids.nbytes
+
+    def _arrays(self) -> dict:
+        return {"vectors": self.vectors, "ids": self.ids}
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        for name, array in self._arrays().items():
+            np.save(os.path.join(directory, f"{name}.npy"), array)
+        with open(os.path.join(directory, "index.json"), "w") as f:
+            json.dump({"version": INDEX_VERSION, "kind": self.kind, **self.meta}, f, indent=2)
+
+
+class IVFIndex(ExactIndex):
+    """Inverted-file cosine search over k-means lists."""
+
+    kind = "ivf"
+
+    def __init__(self, vectors: np.ndarray, ids: np.ndarray, centroids: np.ndarray, offsets: np.ndarray,
+                 meta: dict = None):
+        super().__init__(vectors, ids, meta)
+        self.centroids = centroids
+        self.offsets = offsets
+        self.n_probe = int(self.meta.get("nProbe", 16))
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, ids, dtype: str = "float32", n_lists: int = None, n_probe: int = None,
+              iterations: int = KMEANS_ITERATIONS, seed: int = 0, **meta) -> "IVFIndex":
+        vectors = normalize(vectors)
+        n_lists = max(1, min(n_lists or int(4 * np.sqrt(len(vectors))), len(vectors)))
+        centroids = train_centroids(vectors, n_lists, iterations, seed)
+        assignments = assign(vectors, centroids)
+        # Group vectors by list so each list is one contiguous slice
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=n_lists)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        meta.update({"nLists": n_lists, "nProbe": n_probe or max(1, n_lists // 64)})
+        return cls(vectors[order].astype(dtype, copy=False), encode_ids(ids)[order], centroids, offsets, meta)
+
+    def search(self, query: np.ndarray, k: int = 10, n_probe: int = None, **options) -> Tuple[list, np.ndarray]:
+        query = normalize(query)
+        lists = _top_k(self.centroids @ query, n_probe or self.n_probe)
+        rows = np.concatenate([np.arange(self.offsets[i], self.offsets[i + 1]) for i in lists])
+        if len(rows) == 0:
+            return [], np.empty(0, dtype=np.float32)
+        slices = [self.vectors[self.offsets[i]:self.offsets[i + 1]] for i in lists]
+        scores = self._scan(query, np.concatenate(slices))
+        top = _top_k(scores, k)
+        return self._ids_at(rows[top]), scores[top]
+
+    def stats(self) -> dict:
+        return {**super().stats(), "nLists": len(self.centroids), "nProbe": self.n_probe}
+
+    def nbytes(self) -> int:
+        return super().nbytes() + self.centroids.nbytes + self.offsets.nbytes
+
+    def _arrays(self) -> dict:
+        return {**super()._arrays(), "centroids": self.centroids, "offsets": self.offsets}
+
+
+def assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Closest centroid of each (normalized) vector, computed in row chunks."""
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), SCAN_CHUNK_ROWS):
+        chunk = np.asarray(vectors[start:start + SCAN_CHUNK_ROWS], dtype=np.float32)
+        labels[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return labels
+
+
+def train_centroids(vectors: np.ndarray, n_lists: int, iterations: int = KMEANS_ITERATIONS,
+                    seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of ``vectors``; returns normalized centroids."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), n_lists * KMEANS_SAMPLE_PER_LIST)
+    sample = vectors[np.sort(rng.choice(len(vectors), size=sample_size, replace=False))]
+    centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=n_lists)
+        empty = counts == 0
+        # Re-seed empty lists with random sample points
+        sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+def build_index(kind: str, vectors: np.ndarray, ids, **options) -> ExactIndex:
+    if kind == "exact":
+        options = {key: value for key, value in options.items() if key not in ("n_lists", "n_probe")}
+        return ExactIndex.build(vectors, ids, **options)
+    if kind == "ivf":
+        return IVFIndex.build(vectors, ids, **options)
+    raise ValueError(f"Unknown index kind: {kind!r} (expected one of {', '.join(INDEX_KINDS)})")
+
+
+def load_index(directory: str, mmap: bool = True) -> ExactIndex:
+    """Load a saved index; with ``mmap`` the arrays are memory-mapped read-only."""
+    with open(os.path.join(directory, "index.json")) as f:
+        meta = json.load(f)
+    if meta.get("version") != INDEX_VERSION:
+        raise ValueError(f"Unsupported index version {meta.get('version')} in {directory}")
+    mmap_mode = "r" if mmap else None
+
+    def array(name: str) -> np.ndarray:
+        return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+
+    kind = meta.pop("kind")
+    meta.pop("version")
+    if kind == "exact":
+        return ExactIndex(array("vectors"), array("ids"), meta)
+    if kind == "ivf":
+        return IVFIndex(array("vectors"), array("ids"), array("centroids"), array("offsets"), meta)
+    raise ValueError(f"Unknown index kind {kind!r} in {directory}")
+
+
+def store_embeddings(store_dir: str, batch_segments: int = 512) -> Tuple[list, np.ndarray]:
+    """Track embeddings for every track in a feature store, from its stored mels.
+
+    Segments from many tracks share each predict call, as in classify_library.
+    """
+    import main
+    from feature_store import FeatureStore
+
+    store = FeatureStore(store_dir)
+    if main.load_embedding_model() is None:
+        raise SystemExit("The loaded model does not expose embeddings (see EMBEDDING_LAYER)")
+    paths = list(store.records)
+    vectors = []
+    start = time.perf_counter()
+    batch, pending_segments = [], 0
+
+    def flush():
+        outputs = main.predict_outputs(np.concatenate(batch).astype(np.float32)[..., np.newaxis])
+        _, embeddings = main.split_outputs(outputs)
+        offset = 0
+        for mel in batch:
+            vectors.append(main.track_embedding(embeddings[offset:offset + len(mel)]))
+            offset += len(mel)
+
+    for path in paths:
+        mel = store.mel(path)
+        batch.append(mel)
+        pending_segments += len(mel)
+        if pending_segments >= batch_segments:
+            flush()
+            batch, pending_segments = [], 0
+            print(f"{len(vectors)}/{len(paths)} tracks  {len(vectors) / (time.perf_counter() - start):.1f} tracks/s")
+    if batch:
+        flush()
+    return paths, np.stack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="Build an index from a feature store or an embeddings file")
+    source = build_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--feature-store", help="Embed every track of this feature store with the model")
+    source.add_argument("--embeddings", help=".npz with 'ids' and 'vectors' arrays")
+    build_parser.add_argument("--output", required=True, help="Index directory to write")
+    build_parser.add_argument("--kind", default="ivf", choices=INDEX_KINDS, help="Index type")
+    build_parser.add_argument("--dtype", default="float32", choices=["float32", "float16"], help="Vector storage")
+    build_parser.add_argument("--n-lists", type=int, help="IVF lists (default: 4 * sqrt(n))")
+    build_parser.add_argument("--n-probe", type=int, help="Default IVF lists scanned per query (default: n_lists / 64)")
+    query_parser = commands.add_parser("query", help="Print the nearest neighbours of a catalog track")
+    query_parser.add_argument("--index", required=True, help="Index directory")
+    query_parser.add_argument("--track", required=True, help="Catalog id of the query track")
+    query_parser.add_argument("--k", type=int, default=10, help="Neighbours to return")
+    query_parser.add_argument("--n-probe", type=int, help="IVF lists to scan")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        meta = {}
+        if args.feature_store:
+            import main
+            ids, vectors = store_embeddings(args.feature_store)
+            meta["model"] = main.model_identity()
+        else:
+            data = np.load(args.embeddings)
+            ids, vectors = data["ids"], data["vectors"]
+        start = time.perf_counter()
+        index = build_index(args.kind, vectors, ids, dtype=args.dtype, n_lists=args.n_lists, n_probe=args.n_probe,
+                            **meta)
+        print(f"Built {args.kind} index over {len(index)} vectors in {time.perf_counter() - start:.1f} s")
+        index.save(args.output)
+        print(json.dumps(index.stats()))
+    else:
+        index = load_index(args.index)
+        query = index.vector(args.track)
+        if query is None:
+            raise SystemExit(f"{args.track} is not in the index")
+        start = time.perf_counter()
+        ids, scores = index.search(query, args.k + 1, n_probe=args.n_probe)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        for track_id, score in [(i, s) for i, s in zip(ids, scores) if i != args.track][:args.k]:
+            print(f"{score:.4f}  {track_id}")
+        print(f"({elapsed_ms:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main_cli()
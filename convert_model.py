@@ -1,73 +1,62 @@
 """
-Convert Keras H5 model to TensorFlow.js format
+Convert Keras H5 model to TensorFlow.js or TFLite format
 
 Usage:
     python convert_model.py
+    python convert_model.py --quantize uint8 --shard-size-mb 1
+    python convert_model.py --target tflite --quantize float16
+    python convert_model.py --target tflite --quantize int8 --calibration-samples 256
 
 Requirements:
-    pip install tensorflowjs tensorflow
+    pip install tensorflowjs tensorflow   # tfjs target
+    pip install tensorflow                # tflite target
 
-This script converts the CRNN GTZAN model from .h5 format to TensorFlow.js
-format for use in the browser.
+The default target converts the CRNN GTZAN model from .h5 format to
+TensorFlow.js format for use in the browser, optionally with float16 or
+uint8 weights and a chosen shard size, and cleans model.json for
+TensorFlow.js. It writes a report of the download size, shard count,
+model.json parse time and prediction delta against the Keras model,
+read back from the quantized shards. The tflite target writes a
+graph-optimized artifact for the backend (INFERENCE_BACKEND=tflite),
+optionally float16- or int8-quantized, with int8 calibrated on log-mel
+inputs computed by the backend front-end from synthetic audio. It also
+writes an accuracy and latency report against the Keras model.
 """
 
 import os
 import sys
 import json
 import re
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+from clean_model_json import clean_model_json
 
 try:
-    import tensorflowjs as tfjs
     import tensorflow as tf
 except ImportError:
     print("Please install required packages:")
-    print("  pip install tensorflowjs tensorflow")
+    print("  pip install tensorflow")
     sys.exit(1)
 
 # Paths
 INPUT_MODEL_PATH = "model/crnn_gtzan_model_best.h5"
 OUTPUT_DIR = "public/model/crnn_gtzan_genre_model_tfjs"
+TFLITE_OUTPUT_PATH = "model/crnn_gtzan_model_best.tflite"
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
 
-def clean_model_json(model_json_path):
-    """
-    Clean up the model.json to be more compatible with TensorFlow.js.
-    Removes complex DTypePolicy objects that can cause loading issues.
-    """
-    print("\n🔧 Cleaning model.json for better TensorFlow.js compatibility...")
-    
-    with open(model_json_path, 'r') as f:
-        model_json = json.load(f)
-    
-    def clean_dtype_policy(obj):
-        """Recursively clean DTypePolicy objects from the config."""
-        if isinstance(obj, dict):
-            # If this is a DTypePolicy config, simplify it
-            if obj.get('class_name') == 'DTypePolicy':
-                return 'float32'
-            
-            # Handle dtype that contains a DTypePolicy object
-            if 'dtype' in obj and isinstance(obj['dtype'], dict):
-                if obj['dtype'].get('class_name') == 'DTypePolicy':
-                    obj['dtype'] = 'float32'
-            
-            # Recursively process all dict values
-            return {k: clean_dtype_policy(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [clean_dtype_policy(item) for item in obj]
-        else:
-            return obj
-    
-    # Clean the model topology
-    if 'modelTopology' in model_json:
-        model_json['modelTopology'] = clean_dtype_policy(model_json['modelTopology'])
-    
-    # Write back
-    with open(model_json_path, 'w') as f:
-        json.dump(model_json, f)
-    
-    print("✅ model.json cleaned successfully")
-
-def convert_model():
+def convert_model(output_dir, quantize, shard_size_mb, eval_samples, repeat):
+    try:
+        import tensorflowjs as tfjs
+    except ImportError:
+        print("Please install required packages:")
+        print("  pip install tensorflowjs tensorflow")
+        return False
+    
     print("=" * 60)
     print("GTZAN CRNN Model Converter")
     print("=" * 60)
@@ -79,10 +68,8 @@ def convert_model():
         return False
     
     print(f"📂 Input model: {INPUT_MODEL_PATH}")
-    print(f"📂 Output directory: {OUTPUT_DIR}")
-    
-    # Create output directory
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    print(f"📂 Output directory: {output_dir}")
+    print(f"🔢 Weight quantization: {quantize}, shard size: {shard_size_mb:g} MB")
     
     # Load the Keras model
     print("\n🔄 Loading Keras model...")
@@ -103,38 +90,318 @@ def convert_model():
     print(f"\n📐 Input shape: {input_shape}")
     print(f"📐 Output shape: {output_shape}")
     
-    # Convert to TensorFlow.js format
+    # Convert to TensorFlow.js format in a staging directory next to the output,
+    # so a failed load or conversion leaves the previous export intact
     print("\n🔄 Converting to TensorFlow.js format...")
+    parent_dir = os.path.dirname(os.path.abspath(output_dir))
+    os.makedirs(parent_dir, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix=".tfjs-export-", dir=parent_dir)
     try:
-        tfjs.converters.save_keras_model(model, OUTPUT_DIR)
+        tfjs.converters.save_keras_model(
+            model,
+            staging_dir,
+            quantization_dtype_map=TFJS_QUANTIZATION.get(quantize),
+            weight_shard_size_bytes=int(shard_size_mb * 1024 * 1024),
+        )
         print("✅ Conversion successful!")
+        
+        # Clean the model.json for better compatibility
+        print("\n🔧 Cleaning model.json for better TensorFlow.js compatibility...")
+        try:
+            counts, _ = clean_model_json(os.path.join(staging_dir, "model.json"))
+            print("✅ model.json cleaned: " + ", ".join(f"{name} {count}" for name, count in sorted(counts.items())))
+        except Exception as e:
+            print(f"⚠️ Warning: Could not clean model.json: {e}")
+        
+        replace_tfjs_export(staging_dir, output_dir)
     except Exception as e:
         print(f"❌ Error during conversion: {e}")
         return False
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
     
-    # Clean the model.json for better compatibility
-    model_json_path = os.path.join(OUTPUT_DIR, "model.json")
-    try:
-        clean_model_json(model_json_path)
-    except Exception as e:
-        print(f"⚠️ Warning: Could not clean model.json: {e}")
+    print("\n📏 Comparing against the Keras model...")
+    evaluation = synthetic_mel_inputs(eval_samples, seed=1)
+    report = tfjs_report(model, output_dir, quantize, evaluation, repeat)
+    report_path = output_dir.rstrip("/\\") + ".report.json"
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
     
-    # List generated files
-    print("\n📁 Generated files:")
-    for f in os.listdir(OUTPUT_DIR):
-        filepath = os.path.join(OUTPUT_DIR, f)
-        size = os.path.getsize(filepath)
-        print(f"   - {f} ({size:,} bytes)")
+    print(f"   Download: {report['totalBytes']:,} bytes in {report['shardCount']} shard(s) "
+          f"+ model.json ({report['modelJsonBytes']:,} bytes)")
+    print(f"   model.json parse: {report['jsonParseMs']:.2f} ms")
+    print(f"   Top-1 agreement: {100 * report['top1Agreement']:.1f}% over {report['samples']} segments")
+    print(f"   Probability delta: max {report['maxAbsDiff']:.4f}, mean {report['meanAbsDiff']:.5f}")
+    print(f"   Report written to {report_path}")
     
     print("\n" + "=" * 60)
     print("✅ Model conversion complete!")
     print("=" * 60)
-    print(f"\nThe model is now available at: {OUTPUT_DIR}")
+    print(f"\nThe model is now available at: {output_dir}")
     print("You can load it in TensorFlow.js with:")
     print("  const model = await tf.loadLayersModel('/model/crnn_gtzan_genre_model_tfjs/model.json');")
     
     return True
 
+def replace_tfjs_export(staging_dir, output_dir):
+    """Move a finished export from ``staging_dir`` into ``output_dir``, dropping shards of the previous one.
+
+    model.json is moved last, so it never references shards that are not there yet.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    new_files = set(os.listdir(staging_dir))
+    for f in sorted(new_files - {"model.json"}):
+        os.replace(os.path.join(staging_dir, f), os.path.join(output_dir, f))
+    os.replace(os.path.join(staging_dir, "model.json"), os.path.join(output_dir, "model.json"))
+    for f in os.listdir(output_dir):
+        if f.endswith(".bin") and f not in new_files:
+            os.remove(os.path.join(output_dir, f))
+
+
+# quantization_dtype_map for tfjs.converters.save_keras_model
+TFJS_QUANTIZATION = {"float16": {"float16": "*"}, "uint8": {"uint8": "*"}}
+# Weight dtypes in a TensorFlow.js weights manifest
+TFJS_DTYPES = {"float32": np.float32, "int32": np.int32, "bool": np.bool_, "float16": np.float16, "uint8": np.uint8,
+               "uint16": np.uint16}
+
+
+def read_tfjs_weights(output_dir):
+    """Weights as a browser sees them: read from the shards and dequantized, keyed by manifest name."""
+    with open(os.path.join(output_dir, "model.json")) as f:
+        manifest = json.load(f)["weightsManifest"]
+    weights = {}
+    for group in manifest:
+        data = bytearray()
+        for path in group["paths"]:
+            with open(os.path.join(output_dir, path), "rb") as f:
+                data += f.read()
+        offset = 0
+        for entry in group["weights"]:
+            quantization = entry.get("quantization")
+            stored = TFJS_DTYPES[quantization["dtype"] if quantization else entry["dtype"]]
+            count = int(np.prod(entry["shape"], dtype=np.int64))
+            values = np.frombuffer(data, dtype=stored, count=count, offset=offset)
+            offset += count * np.dtype(stored).itemsize
+            if quantization and quantization["dtype"] == "float16":
+                values = values.astype(np.float32)
+            elif quantization:
+                # Affine: value = q * scale + min
+                values = values.astype(np.float32) * quantization["scale"] + quantization["min"]
+            weights[entry["name"]] = values.reshape(entry["shape"])
+    return weights
+
+
+def _weight_key(name):
+    # clean_model_json drops '/lstm_cell/'; Keras 2 variable names end in ':0'
+    return name.replace("/lstm_cell/", "/").split(":")[0]
+
+
+def model_with_tfjs_weights(model, output_dir):
+    """A copy of ``model`` carrying the (dequantized) weights from the TensorFlow.js shards."""
+    shards = read_tfjs_weights(output_dir)
+    by_name = {_weight_key(name): values for name, values in shards.items()}
+    names = [_weight_key(getattr(w, "path", w.name)) for w in model.weights]
+    if all(name in by_name for name in names):
+        values = [by_name[name] for name in names]
+    else:
+        # Fall back to manifest order, which follows the model's weight order
+        values = list(shards.values())
+        if [v.shape for v in values] != [tuple(w.shape) for w in model.weights]:
+            raise ValueError("Could not match the TensorFlow.js weights to the Keras model's weights")
+    copy = tf.keras.models.clone_model(model)
+    copy.set_weights(values)
+    return copy
+
+
+def tfjs_report(model, output_dir, quantize, inputs, repeat):
+    """Download size, model.json parse time and prediction delta of a TensorFlow.js export."""
+    model_json_path = os.path.join(output_dir, "model.json")
+    with open(model_json_path) as f:
+        model_json_text = f.read()
+    shard_paths = [path for group in json.loads(model_json_text)["weightsManifest"] for path in group["paths"]]
+    shard_bytes = [os.path.getsize(os.path.join(output_dir, path)) for path in shard_paths]
+    
+    keras_probs = model.predict(inputs, verbose=0)
+    tfjs_probs = model_with_tfjs_weights(model, output_dir).predict(inputs, verbose=0)
+    diff = np.abs(keras_probs - tfjs_probs)
+    return {
+        "artifact": output_dir,
+        "quantize": quantize,
+        "modelJsonBytes": len(model_json_text.encode()),
+        "weightBytes": sum(shard_bytes),
+        "totalBytes": len(model_json_text.encode()) + sum(shard_bytes),
+        "shardCount": len(shard_paths),
+        "largestShardBytes": max(shard_bytes, default=0),
+        "kerasSizeBytes": os.path.getsize(INPUT_MODEL_PATH),
+        # Python's json parser stands in for JSON.parse; the browser's cost scales the same way
+        "jsonParseMs": _median_ms(lambda: json.loads(model_json_text), repeat),
+        "samples": len(inputs),
+        "maxAbsDiff": float(diff.max()),
+        "meanAbsDiff": float(diff.mean()),
+        "top1Agreement": float(np.mean(np.argmax(keras_probs, axis=1) == np.argmax(tfjs_probs, axis=1))),
+    }
+
+
+def synthetic_mel_inputs(count, seed):
+    """Model-ready log-mel segments from deterministic synthetic audio, via the backend front-end."""
+    sys.path.insert(0, BACKEND_DIR)
+    sys.path.insert(0, os.path.join(BACKEND_DIR, "benchmarks"))
+    from main import SAMPLE_RATE, SEGMENT_DURATION, mel_spectrogram_batch
+    from fixtures import synth_track
+    
+    segment_samples = SAMPLE_RATE * SEGMENT_DURATION
+    audio = synth_track(count * SEGMENT_DURATION, sr=SAMPLE_RATE, seed=seed)
+    return mel_spectrogram_batch(audio[:count * segment_samples].reshape(count, segment_samples))
+
+
+def export_tflite(model, output_path, quantize, calibration):
+    """Convert ``model`` to TFLite, optionally float16- or int8-quantized."""
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantize == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantize == "int8":
+        # Post-training quantization; activation ranges come from the calibration inputs
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([calibration[i:i + 1]] for i in range(len(calibration)))
+    
+    try:
+        tflite_model = converter.convert()
+    except Exception as e:
+        # Recurrent layers can need TensorFlow ops the builtin set lacks
+        print(f"⚠️ Builtin-only conversion failed ({e}); retrying with TensorFlow ops enabled")
+        print("   The artifact will need the full tensorflow package, not tflite-runtime")
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+        converter._experimental_lower_tensor_list_ops = False
+        tflite_model = converter.convert()
+    
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "wb") as f:
+        f.write(tflite_model)
+
+
+def _median_ms(fn, repeat):
+    fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+def tflite_report(model, tflite_path, quantize, inputs, batch_size, repeat):
+    """Accuracy delta and latency of the TFLite artifact against the Keras model on the same inputs."""
+    sys.path.insert(0, BACKEND_DIR)
+    from lite_model import TFLiteModel
+    
+    lite = TFLiteModel(tflite_path)
+    keras_probs = model.predict(inputs, batch_size=batch_size, verbose=0)
+    lite_probs = lite.predict(inputs, batch_size=batch_size)
+    diff = np.abs(keras_probs - lite_probs)
+    
+    single = inputs[:1]
+    batch = inputs[:batch_size]
+    latency = {
+        "keras": {
+            "batch1Ms": _median_ms(lambda: model.predict(single, verbose=0), repeat),
+            f"batch{len(batch)}Ms": _median_ms(lambda: model.predict(batch, batch_size=batch_size, verbose=0), repeat),
+        },
+        "tflite": {
+            "batch1Ms": _median_ms(lambda: lite.predict(single, batch_size=batch_size), repeat),
+            f"batch{len(batch)}Ms": _median_ms(lambda: lite.predict(batch, batch_size=batch_size), repeat),
+        },
+    }
+    return {
+        "artifact": tflite_path,
+        "quantize": quantize,
+        "sizeBytes": os.path.getsize(tflite_path),
+        "kerasSizeBytes": os.path.getsize(INPUT_MODEL_PATH),
+        "samples": len(inputs),
+        "maxAbsDiff": float(diff.max()),
+        "meanAbsDiff": float(diff.mean()),
+        "top1Agreement": float(np.mean(np.argmax(keras_probs, axis=1) == np.argmax(lite_probs, axis=1))),
+        "latency": latency,
+    }
+
+
+def convert_tflite(output_path, quantize, calibration_samples, eval_samples, batch_size, repeat):
+    print("=" * 60)
+    print("GTZAN CRNN Model Converter (TFLite)")
+    print("=" * 60)
+    
+    if not os.path.exists(INPUT_MODEL_PATH):
+        print(f"❌ Error: Model not found at {INPUT_MODEL_PATH}")
+        print("   Please ensure the model file is in the correct location.")
+        return False
+    
+    print(f"📂 Input model: {INPUT_MODEL_PATH}")
+    print(f"📂 Output file: {output_path}")
+    print(f"🔢 Quantization: {quantize}")
+    
+    print("\n🔄 Loading Keras model...")
+    try:
+        model = tf.keras.models.load_model(INPUT_MODEL_PATH)
+        print("✅ Model loaded successfully")
+    except Exception as e:
+        print(f"❌ Error loading model: {e}")
+        return False
+    
+    # Calibration and evaluation inputs come from different synthetic tracks
+    print("\n🎼 Computing synthetic mel inputs...")
+    calibration = synthetic_mel_inputs(calibration_samples, seed=0) if quantize == "int8" else None
+    evaluation = synthetic_mel_inputs(eval_samples, seed=1)
+    
+    print("\n🔄 Converting to TFLite...")
+    try:
+        export_tflite(model, output_path, quantize, calibration)
+        print("✅ Conversion successful!")
+    except Exception as e:
+        print(f"❌ Error during conversion: {e}")
+        return False
+    
+    print("\n📏 Comparing against the Keras model...")
+    report = tflite_report(model, output_path, quantize, evaluation, batch_size, repeat)
+    report_path = os.path.splitext(output_path)[0] + ".report.json"
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    
+    print(f"   Size: {report['sizeBytes']:,} bytes (Keras .h5: {report['kerasSizeBytes']:,} bytes)")
+    print(f"   Top-1 agreement: {100 * report['top1Agreement']:.1f}% over {report['samples']} segments")
+    print(f"   Probability delta: max {report['maxAbsDiff']:.4f}, mean {report['meanAbsDiff']:.5f}")
+    for runtime, timings in report["latency"].items():
+        print(f"   {runtime:<7} " + ", ".join(f"{name[:-2]}: {ms:.1f} ms" for name, ms in timings.items()))
+    print(f"   Report written to {report_path}")
+    
+    print("\n" + "=" * 60)
+    print("✅ Model conversion complete!")
+    print("=" * 60)
+    print("\nServe it with:")
+    print(f"  INFERENCE_BACKEND=tflite TFLITE_MODEL_PATH={os.path.abspath(output_path)} python backend/main.py")
+    
+    return True
+
+
 if __name__ == "__main__":
-    success = convert_model()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=["tfjs", "tflite"], default="tfjs", help="Export format")
+    parser.add_argument("--quantize", choices=["none", "float16", "int8", "uint8"], default="none",
+                        help="Quantization: none, float16 or uint8 weights for tfjs; none, float16 or int8 for tflite")
+    parser.add_argument("--output", help=f"Output directory (tfjs, default {OUTPUT_DIR}) "
+                                         f"or file (tflite, default {TFLITE_OUTPUT_PATH})")
+    parser.add_argument("--shard-size-mb", type=float, default=4, help="TensorFlow.js weight shard size")
+    parser.add_argument("--calibration-samples", type=int, default=200, help="Segments used to calibrate int8")
+    parser.add_argument("--eval-samples", type=int, default=200, help="Segments used for the accuracy report")
+    parser.add_argument("--batch-size", type=int, default=32, help="Batch size for the report's batched latency")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per latency measurement")
+    args = parser.parse_args()
+    if args.quantize == ("uint8" if args.target == "tflite" else "int8"):
+        parser.error(f"--quantize {args.quantize} is not available for --target {args.target}")
+    
+    if args.target == "tflite":
+        success = convert_tflite(args.output or TFLITE_OUTPUT_PATH, args.quantize, args.calibration_samples,
+                                 args.eval_samples, args.batch_size, args.repeat)
+    else:
+        success = convert_model(args.output or OUTPUT_DIR, args.quantize, args.shard_size_mb,
+                                args.eval_samples, args.repeat)
     sys.exit(0 if success else 1)
@@ -148,7 +148,7 @@ class GenreClassifier {
     formData.append('file', file);
 
     try {
-      const response = await fetch(`${API_BASE_URL}/classify`, {
+      const response = await fetch(`${API_BASE_URL}/classify?include=visualization`, {
         method: 'POST',
         body: formData,
       });